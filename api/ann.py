@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import logging
+from typing import Protocol, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from quant import dot
+from utils.topk import topk_indices
+
+logger = logging.getLogger(__name__)
+
+# Amostra máxima usada no treino do k-means (por lista)
+_TRAIN_PER_LIST = 64
+_ASSIGN_CHUNK = 4096
+
+
+class VectorIndex(Protocol):
+    """
+    Top-k inner-product search over the rows of a normalized embedding matrix
+    (a float array or a quant.QuantizedMatrix).
+    """
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        ...
+
+
+class ExactIndex:
+    """Brute-force search; reference for recall and fallback for small corpora."""
+
+    name = "exact"
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = dot(self.vectors, query)
+        top = topk_indices(scores, k)
+        return top, scores[top]
+
+
+class IVFFlatIndex:
+    """
+    Inverted-file index: rows are clustered with spherical k-means and a query only
+    scores the rows of the `nprobe` lists whose centroids are closest to it.
+    `nlist` trades build time/recall, `nprobe` trades latency/recall.
+    """
+
+    name = "ivf"
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        centroids: np.ndarray,
+        list_ids: np.ndarray,
+        list_offsets: np.ndarray,
+        nprobe: int = 8,
+    ):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.list_ids = list_ids
+        self.list_offsets = list_offsets
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, nlist: int, nprobe: int = 8, n_iter: int = 10, seed: int = 0):
+        nlist = max(1, min(nlist, len(vectors)))
+        centroids = _spherical_kmeans(vectors, nlist, n_iter, seed)
+        assign = _assign(vectors, centroids)
+        list_ids = np.argsort(assign, kind="stable").astype(np.int64)
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=nlist), out=list_offsets[1:])
+        return cls(vectors, centroids, list_ids, list_offsets, nprobe)
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        query = query.astype(np.float32)
+        order = np.argsort(-(self.centroids @ query))
+        # Visita ao menos `nprobe` listas, e mais se ainda não houver k candidatos
+        chunks, n_cand = [], 0
+        for probed, c in enumerate(order):
+            if probed >= self.nprobe and n_cand >= k:
+                break
+            ids = self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]]
+            chunks.append(ids)
+            n_cand += len(ids)
+        cand = np.sort(np.concatenate(chunks)) if chunks else np.zeros(0, dtype=np.int64)
+        scores = np.asarray(self.vectors[cand], dtype=np.float32) @ query
+        top = topk_indices(scores, k)
+        return cand[top], scores[top]
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    out = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), _ASSIGN_CHUNK):
+        block = np.asarray(vectors[start:start + _ASSIGN_CHUNK], dtype=np.float32)
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def _spherical_kmeans(vectors: np.ndarray, n_clusters: int, n_iter: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    n_train = min(len(vectors), n_clusters * _TRAIN_PER_LIST)
+    rows = np.sort(rng.choice(len(vectors), n_train, replace=False))
+    sample = np.asarray(vectors[rows], dtype=np.float32)
+    centroids = sample[rng.choice(n_train, n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _assign(sample, centroids)
+        onehot = sparse.csr_matrix(
+            (np.ones(n_train, dtype=np.float32), (assign, np.arange(n_train))),
+            shape=(n_clusters, n_train),
+        )
+        sums = np.asarray(onehot @ sample)
+        empty = np.bincount(assign, minlength=n_clusters) == 0
+        # Listas vazias recebem um ponto aleatório da amostra
+        sums[empty] = sample[rng.choice(n_train, int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+    return centroids.astype(np.float32)
+
+
+def build_ann(vectors: np.ndarray, backend: str, nlist: int = 0, nprobe: int = 8) -> VectorIndex:
+    """Build the configured backend (`exact` or `ivf`)."""
+    if backend == "exact":
+        return ExactIndex(vectors)
+    if backend == "ivf":
+        if nlist <= 0:
+            nlist = int(4 * np.sqrt(len(vectors)))
+        logger.info("Building IVF index: %d vectors, nlist=%d", len(vectors), nlist)
+        return IVFFlatIndex.build(vectors, nlist, nprobe)
+    raise ValueError(f"Unknown ANN backend: {backend}")
@@ -0,0 +1,287 @@
+"""
+Retrieval and alignment benchmark on synthetic Portuguese corpora (offline).
+
+For each corpus size: index build time and memory, p50/p95/p99 latency and
+throughput of `topk_lexical`, `topk_semantic`, `sentence_alignment` and the
+full `/compare` path, hit@k of the copied source document, and recall@k of the
+approximate paths in use (ANN, quantized embeddings, MaxScore postings) against
+exact brute-force search. Results are written as JSON for comparison across
+commits; the index configuration comes from the usual environment variables.
+
+    python -m benchmarks.bench_retrieval --out .data/bench/head.json
+    python -m benchmarks.bench_retrieval --large   # adds 100k and 1M docs (slow)
+    EMBED_QUANT=int8 ANN_BACKEND=ivf python -m benchmarks.bench_retrieval --sizes 100000
+    python -m benchmarks.bench_retrieval --compare .data/bench/base.json .data/bench/head.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+from benchmarks.synthetic import StubEncoder, SyntheticCorpus
+from utils import config
+
+# Tamanhos padrão (rodam em minutos); --large acrescenta os da escala de produção
+DEFAULT_SIZES = (1_000, 10_000)
+LARGE_SIZES = (100_000, 1_000_000)
+
+
+def _summary(samples: Sequence[float]) -> Dict[str, float]:
+    ms = np.asarray(samples) * 1e3
+    return {
+        "n": len(ms),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "qps": float(len(ms) / (ms.sum() / 1e3)) if ms.sum() > 0 else 0.0,
+    }
+
+
+def _timed_calls(fn: Callable, items: Sequence) -> tuple[Dict[str, float], list]:
+    samples, results = [], []
+    for item in items:
+        t0 = time.perf_counter()
+        results.append(fn(item))
+        samples.append(time.perf_counter() - t0)
+    return _summary(samples), results
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _recall(approx: List[list], exact: List[list], k: int) -> float:
+    hits = [len({d for d, _ in a} & {d for d, _ in e}) / max(1, min(k, len(e))) for a, e in zip(approx, exact)]
+    return float(np.mean(hits)) if hits else 1.0
+
+
+def _hit_rate(results: List[list], sources: List[int]) -> float:
+    return float(np.mean([src in {d for d, _ in res} for res, src in zip(results, sources)]))
+
+
+def _exact_index(index):
+    """Same corpus with every approximate structure dropped (dense TF-IDF, brute-force float32 embeddings)."""
+    passages = index.passages
+    if passages is not None:
+        passages = dataclasses.replace(passages, word_postings=None, char_postings=None, ann=None, embed_codes=None)
+    return dataclasses.replace(
+        index, word_postings=None, char_postings=None, ann=None, embed_codes=None, passages=passages
+    )
+
+
+async def _compare_load(app, queries: List[str], k: int, concurrency: int) -> tuple[Dict[str, float], float]:
+    import httpx
+
+    sem = asyncio.Semaphore(concurrency)
+    samples: List[float] = []
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+
+        async def one(text: str) -> None:
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.post("/compare", json={"text": text, "top_k": k, "mode": "full"})
+                r.raise_for_status()
+                samples.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(q) for q in queries))
+        wall = time.perf_counter() - t0
+    return _summary(samples), len(queries) / wall
+
+
+@contextmanager
+def _use_encoder(encoder):
+    """Route query encoding through `encoder` (None keeps the real model), without cache or batching delay."""
+    import match
+
+    saved = match._encoding, match.query_cache.maxsize
+    if encoder is not None:
+        match.use_encoder(encoder, 0, 1)
+    # Consultas repetidas não podem sair do cache
+    match.query_cache.maxsize = 0
+    match.query_cache.clear()
+    try:
+        yield
+    finally:
+        match._encoding, match.query_cache.maxsize = saved
+
+
+def run_size(n_docs: int, args, encoder) -> dict:
+    with _use_encoder(encoder):
+        return _run_size(n_docs, args, encoder)
+
+
+def _run_size(n_docs: int, args, encoder) -> dict:
+    import main
+    import match
+    from ingest import ingest_corpus
+    from split import sentence_alignment
+
+    corpus = SyntheticCorpus(n_docs, seed=args.seed)
+    work_dir = tempfile.mkdtemp(prefix="bench-ingest-")
+    rss0 = _rss_mb()
+    t0 = time.perf_counter()
+    try:
+        index = ingest_corpus(
+            iter(corpus), work_dir=work_dir, chunk_size=args.chunk_size, workers=args.workers,
+            encode=encoder.encode if encoder is not None else None, mode=args.mode,
+        )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    build_s = time.perf_counter() - t0
+    usage = index.memory_usage()
+    result: dict = {
+        "n_docs": n_docs,
+        "build_s": build_s,
+        "build_docs_per_s": n_docs / build_s,
+        "rss_delta_mb": _rss_mb() - rss0,
+        "index_mb": {
+            storage: sum(v for (_, s), v in usage.items() if s == storage) / 2**20
+            for storage in ("resident", "mapped")
+        },
+        "index_components_mb": {f"{name}/{storage}": v / 2**20 for (name, storage), v in sorted(usage.items())},
+    }
+
+    pairs = corpus.queries(args.queries)
+    texts = [q for q, _ in pairs]
+    sources = [s for _, s in pairs]
+    k = args.k
+
+    result["lexical"], lex = _timed_calls(lambda q: match.topk_lexical(index, q, k), texts)
+    result["semantic"], sem = _timed_calls(lambda q: match.topk_semantic(index, q, k), texts)
+    result["alignment"], _ = _timed_calls(
+        lambda p: sentence_alignment(index, p[0], index.texts[p[1]], top_n=5, doc_pos=p[1]),
+        [(q, index.position(s)) for q, s in pairs],
+    )
+    result["hit_at_k"] = {"lexical": _hit_rate(lex, sources), "semantic": _hit_rate(sem, sources)}
+
+    exact = _exact_index(index)
+    lex_exact = [match.topk_lexical(exact, q, k) for q in texts]
+    sem_exact = [match.topk_semantic(exact, q, k) for q in texts]
+    result["recall_at_k"] = {"lexical": _recall(lex, lex_exact, k), "semantic": _recall(sem, sem_exact, k)}
+
+    # Latência sem fila (uma requisição por vez) e vazão com `concurrency` em andamento
+    main.set_index(index)
+    result["compare"], _ = asyncio.run(_compare_load(main.app, texts, k, 1))
+    main.response_cache.clear()
+    _, result["compare"]["concurrent_qps"] = asyncio.run(_compare_load(main.app, texts, k, args.concurrency))
+    return result
+
+
+def _metadata(args) -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    keys = [
+        "INDEX_MODE", "LEXICAL_ENGINE", "LEXICAL_CHAR_WEIGHT", "ANN_BACKEND", "ANN_MIN_DOCS", "ANN_NLIST",
+        "ANN_NPROBE", "EMBED_QUANT", "EMBED_RERANK", "INDEX_EMBED_DTYPE", "FINGERPRINT_KGRAM", "WORKER_THREADS",
+    ]
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpus": os.cpu_count(),
+        "encoder": args.encoder,
+        "args": {k: v for k, v in vars(args).items() if k not in ("compare", "out")},
+        "config": {key: getattr(config, key) for key in keys},
+    }
+
+
+def compare_runs(old_path: str, new_path: str) -> None:
+    """Print p50/p95 latency and recall of two result files side by side."""
+    old, new = (json.loads(Path(p).read_text()) for p in (old_path, new_path))
+    old_by_n = {r["n_docs"]: r for r in old["results"]}
+    print(f"{old['meta']['commit']} -> {new['meta']['commit']}")
+    print(f"{'N':>9} {'stage':>10} {'p50 old':>9} {'p50 new':>9} {'p95 old':>9} {'p95 new':>9} {'change':>8}")
+    for r in new["results"]:
+        base = old_by_n.get(r["n_docs"])
+        if base is None:
+            continue
+        for stage in ("lexical", "semantic", "alignment", "compare"):
+            a, b = base[stage], r[stage]
+            print(
+                f"{r['n_docs']:>9} {stage:>10} {a['p50_ms']:>9.2f} {b['p50_ms']:>9.2f} "
+                f"{a['p95_ms']:>9.2f} {b['p95_ms']:>9.2f} {b['p50_ms'] / a['p50_ms'] - 1:>+7.0%}"
+            )
+        print(f"{r['n_docs']:>9} {'build s':>10} {base['build_s']:>9.1f} {r['build_s']:>9.1f}")
+        for path in ("lexical", "semantic"):
+            print(f"{r['n_docs']:>9} {'recall ' + path[:3]:>10} "
+                  f"{base['recall_at_k'][path]:>9.3f} {r['recall_at_k'][path]:>9.3f}")
+
+
+def bench_sizes(sizes: Sequence[int] | None, large: bool) -> List[int]:
+    """Corpus sizes to run: `sizes` (or the defaults) plus, with `large`, LARGE_SIZES."""
+    out = list(sizes or DEFAULT_SIZES)
+    if large:
+        out += [n for n in LARGE_SIZES if n not in out]
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=None, help=f"default: {DEFAULT_SIZES}")
+    parser.add_argument(
+        "--large", action="store_true", help=f"also run {LARGE_SIZES} docs (slow, needs a lot of memory at 1M)"
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--mode", default=config.INDEX_MODE, choices=["document", "passage"])
+    parser.add_argument("--encoder", default="stub", choices=["stub", "model"], help="stub = hashed bag of words")
+    parser.add_argument("--workers", type=int, default=config.INGEST_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=config.INGEST_CHUNK_SIZE)
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight for /compare throughput")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="JSON output (default: .data/bench/<commit>-<time>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_runs(*args.compare)
+        return
+
+    encoder = StubEncoder() if args.encoder == "stub" else None
+    meta = _metadata(args)
+    results = []
+    for n in bench_sizes(args.sizes, args.large):
+        r = run_size(n, args, encoder)
+        results.append(r)
+        print(
+            f"N={n:>8}  build {r['build_s']:7.1f}s  index {r['index_mb']['resident']:8.1f} MB  "
+            + "  ".join(f"{s} p50 {r[s]['p50_ms']:.2f}/p99 {r[s]['p99_ms']:.2f} ms"
+                        for s in ("lexical", "semantic", "alignment", "compare"))
+            + f"  recall lex {r['recall_at_k']['lexical']:.3f} sem {r['recall_at_k']['semantic']:.3f}"
+        )
+
+    out = Path(args.out or f".data/bench/{meta['commit'] or 'local'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({"meta": meta, "results": results}, indent=2))
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
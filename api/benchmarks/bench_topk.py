@@ -0,0 +1,43 @@
+"""
+Micro-benchmark: full `np.argsort` vs `utils.topk.topk_indices` for top-k
+selection over corpus-sized score vectors.
+
+    python -m benchmarks.bench_topk --sizes 10000 100000 1000000 --k 20
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+
+from utils.topk import topk_indices
+
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'N':>10} {'argsort ms':>12} {'topk ms':>10} {'speedup':>8}")
+    for n in args.sizes:
+        scores = rng.random(n).astype(np.float32)
+        full = _best_of(lambda: np.argsort(-scores)[: args.k], args.repeat)
+        part = _best_of(lambda: topk_indices(scores, args.k), args.repeat)
+        print(f"{n:>10} {full * 1e3:>12.2f} {part * 1e3:>10.2f} {full / part:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Offline synthetic Portuguese corpus and stub encoder for the benchmarks.
+
+Documents mix a Zipf-distributed general vocabulary (common Portuguese words
+followed by generated pseudo-words) with words of one of `n_topics` topics, so
+lexical and semantic scores have structure without downloading anything.
+Queries copy a few sentences of a known source document, lightly edited, and
+surround them with unrelated sentences.
+"""
+from __future__ import annotations
+
+from typing import Iterator, List, Tuple
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from models.document import Document
+
+_COMMON = """
+o a os as um uma de do da dos das em no na nos nas por para com sem sobre entre
+que se não mais muito como quando onde porque mas ou também já ainda sempre
+ser estar ter haver fazer poder dizer ir ver dar saber querer chegar passar
+é foi são era está estão tem tinha pode deve havia fica ficou começou mudou
+ano anos dia tempo vida mundo país cidade estado governo história parte forma
+guerra século região população trabalho sociedade cultura língua povo rio
+grande pequeno novo antigo primeiro último maior principal importante público
+brasil portugal europa américa lisboa paris londres rei igreja escola economia
+""".split()
+
+_SYLLABLES = "ba be bi bo ca ce co da de di do fa fe fo ga go la le li lo ma me mi mo na ne no pa pe po ra re ri ro sa se so ta te ti to va ve vi".split()
+_SUFFIXES = ["ção", "mente", "dade", "ismo", "ar", "er", "ir", "al", "oso", "eiro", "ista", "ura"]
+
+
+def vocabulary(size: int, seed: int = 0) -> List[str]:
+    """`size` distinct words: the common words first, then pronounceable pseudo-words."""
+    rng = np.random.default_rng(seed)
+    words = list(dict.fromkeys(_COMMON))
+    seen = set(words)
+    while len(words) < size:
+        n = int(rng.integers(2, 4))
+        word = "".join(rng.choice(_SYLLABLES, n)) + rng.choice(_SUFFIXES)
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words[:size]
+
+
+class SyntheticCorpus:
+    """Deterministic generator of documents and plagiarism-like queries."""
+
+    def __init__(
+        self,
+        n_docs: int,
+        seed: int = 0,
+        vocab_size: int = 50_000,
+        n_topics: int = 200,
+        topic_words: int = 150,
+    ):
+        self.n_docs = n_docs
+        self.seed = seed
+        self.words = np.array(vocabulary(vocab_size, seed))
+        ranks = np.arange(1, vocab_size + 1, dtype=np.float64)
+        self._cdf = np.cumsum(ranks ** -1.1)
+        self._cdf /= self._cdf[-1]
+        rng = np.random.default_rng(seed + 1)
+        # Palavras de cada tópico: fora das mais frequentes, para serem informativas
+        self.topics = rng.integers(len(_COMMON), vocab_size, size=(n_topics, topic_words))
+
+    def _sentence(self, rng: np.random.Generator, topic: int) -> str:
+        n = int(rng.integers(8, 22))
+        general = np.searchsorted(self._cdf, rng.random(n))
+        specific = self.topics[topic][rng.integers(0, self.topics.shape[1], n)]
+        idx = np.where(rng.random(n) < 0.3, specific, general)
+        tokens = self.words[idx]
+        return tokens[0].capitalize() + " " + " ".join(tokens[1:]) + "."
+
+    def document(self, pos: int) -> Document:
+        rng = np.random.default_rng((self.seed, pos))
+        topic = int(rng.integers(len(self.topics)))
+        n = int(rng.integers(3, 13))
+        text = " ".join(self._sentence(rng, topic) for _ in range(n))
+        return Document(id=pos, title=f"Artigo {pos}", text=text)
+
+    def __iter__(self) -> Iterator[Document]:
+        for pos in range(self.n_docs):
+            yield self.document(pos)
+
+    def queries(self, n: int, edit: float = 0.1) -> List[Tuple[str, int]]:
+        """(query text, source doc id) pairs: 1-3 sentences copied from the source, `edit` of the words replaced."""
+        rng = np.random.default_rng(self.seed + 2)
+        out = []
+        for _ in range(n):
+            source = int(rng.integers(self.n_docs))
+            sentences = self.document(source).text.split(". ")
+            start = int(rng.integers(len(sentences)))
+            copied = ". ".join(sentences[start:start + int(rng.integers(1, 4))]).rstrip(".").split()
+            for i in np.flatnonzero(rng.random(len(copied)) < edit):
+                copied[i] = str(self.words[np.searchsorted(self._cdf, rng.random())])
+            filler = [self._sentence(rng, int(rng.integers(len(self.topics)))) for _ in range(2)]
+            out.append((f"{filler[0]} {' '.join(copied)}. {filler[1]}", source))
+        return out
+
+
+class StubEncoder:
+    """
+    Deterministic encoder with no model download: L2-normalized hashed bag of
+    words (`dim` buckets). Texts sharing words get similar vectors, which is all
+    the retrieval benchmarks need.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self._hasher = HashingVectorizer(n_features=dim, alternate_sign=False, norm="l2", dtype=np.float32)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return self._hasher.transform(texts).toarray()
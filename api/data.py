@@ -1,21 +1,26 @@
 from __future__       import annotations
 
 import logging
-import pandas as pd
 
-from typing           import List
-from datasets         import load_dataset
-from typing           import List
+from typing           import Iterator
 from models.document import Document
 from utils.config   import DATASET_LANG, DATASET_SIZE, WIKIPEDIA_DATES
 
 logger = logging.getLogger(__name__)
 
 
-def load_wikipedia_docs(limit: int = DATASET_SIZE) -> List[Document]:
+def _clean_text(text) -> str:
+    # Sanitize newlines for small snippets later
+    return str(text).replace("\r", " ").replace("\n\n", "\n")
+
+
+def iter_wikipedia_docs(limit: int = DATASET_SIZE) -> Iterator[Document]:
     """
-    Load up to `limit` PT-BR wikipedia docs using Hugging Face datasets.
+    Stream up to `limit` PT-BR wikipedia docs from Hugging Face datasets, one at a time.
     """
+    # Import tardio: datasets traz pandas/pyarrow, só necessários ao montar o índice do zero
+    from datasets import load_dataset
+
     dataset = None
     # New canonical dataset is hosted on the Hub as "wikimedia/wikipedia"
     for date in WIKIPEDIA_DATES:
@@ -32,9 +37,6 @@ def load_wikipedia_docs(limit: int = DATASET_SIZE) -> List[Document]:
         except Exception as e:  # pragma: no cover - network path
             logger.warning("Failed to load wikimedia/wikipedia %s: %s", cfg, e)
 
-
-    # Convert to pandas and extract title + text
-    items = []
     count = 0
     for i, row in enumerate(dataset):
         if i >= limit:
@@ -44,12 +46,6 @@ def load_wikipedia_docs(limit: int = DATASET_SIZE) -> List[Document]:
         text = row.get("text") if isinstance(row, dict) else None
         if not text:
             continue
-        # Sanitize newlines for small snippets later
-        text_s = str(text).replace("\r", " ").replace("\n\n", "\n")
-        items.append((i, title, text_s))
         count += 1
-
-    df = pd.DataFrame(items, columns=["id", "title", "text"])
-    docs = [Document(id=int(r.id), title=r.title, text=str(r.text)) for r in df.itertuples()]
-    logger.info("Prepared %d wikipedia docs (requested %d)", len(docs), limit)
-    return docs
\ No newline at end of file
+        yield Document(id=i, title=title, text=_clean_text(text))
+    logger.info("Streamed %d wikipedia docs (requested %d)", count, limit)
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.config import (
+    FINGERPRINT_KGRAM,
+    FINGERPRINT_MAX_DF,
+    FINGERPRINT_GAP,
+    FINGERPRINT_WINDOW,
+)
+from utils.topk import topk_indices
+
+_TOKEN_RE = re.compile(r"\w+")
+_BASE = np.uint64(1099511628211)  # multiplicador do hash rolante (primo FNV de 64 bits)
+
+# (query_start, query_end, doc_start, doc_end, score) de um trecho copiado
+Span = Tuple[int, int, int, int, float]
+
+
+@lru_cache(maxsize=1 << 18)
+def _token_hash(token: str) -> int:
+    # Estável entre processos (hash() do Python é aleatorizado); ignora caixa e acentos
+    norm = unicodedata.normalize("NFKD", token.lower())
+    norm = "".join(c for c in norm if not unicodedata.combining(c))
+    return int.from_bytes(hashlib.blake2b(norm.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    # Finalizador do splitmix64: espalha os bits para o mínimo da janela ser uniforme
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def fingerprints(
+    text: str, k: int = FINGERPRINT_KGRAM, window: int = FINGERPRINT_WINDOW
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Winnowed hashes of the word k-grams of `text` (Schleimer et al., 2003): in
+    every run of `window` consecutive k-grams the one with the smallest hash is
+    kept, so any copied passage of at least window + k - 1 words shares a
+    fingerprint with its source. Returns (hashes, char starts, char ends) of the
+    selected k-grams, in text order.
+    """
+    tokens = [(m.start(), m.end(), _token_hash(m.group())) for m in _TOKEN_RE.finditer(text)]
+    if not tokens:
+        empty = np.zeros(0, dtype=np.int64)
+        return np.zeros(0, dtype=np.uint64), empty, empty
+    t_starts = np.fromiter((t[0] for t in tokens), dtype=np.int64, count=len(tokens))
+    t_ends = np.fromiter((t[1] for t in tokens), dtype=np.int64, count=len(tokens))
+    t_hash = np.fromiter((t[2] for t in tokens), dtype=np.uint64, count=len(tokens))
+
+    k = max(1, min(k, len(tokens)))  # textos curtos viram um único k-grama
+    n = len(tokens) - k + 1
+    grams = np.zeros(n, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for i in range(k):
+            grams = grams * _BASE + t_hash[i:i + n]
+        grams = _mix(grams)
+
+    if n <= window:
+        # Mínimo mais à direita, como no winnowing com empates
+        picked = np.array([n - 1 - int(np.argmin(grams[::-1]))])
+    else:
+        windows = sliding_window_view(grams, window)
+        picked = np.unique(np.arange(len(windows)) + window - 1 - np.argmin(windows[:, ::-1], axis=1))
+    return grams[picked], t_starts[picked], t_ends[picked + k - 1]
+
+
+class FingerprintIndex:
+    """
+    Winnowed fingerprints of the whole corpus, sorted by hash: a lookup is a
+    binary search per query fingerprint, independent of the corpus size apart
+    from the length of the matching runs. Character offsets are kept, so matches
+    map straight back to spans of the source document.
+    """
+
+    def __init__(self, hashes: np.ndarray, docs: np.ndarray, starts: np.ndarray, ends: np.ndarray):
+        self.hashes = hashes
+        self.docs = docs
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def build(cls, texts: Sequence[str], offset: int = 0) -> "FingerprintIndex":
+        parts = [fingerprints(text) for text in texts]
+        counts = [len(h) for h, _, _ in parts]
+        return cls._sorted(
+            np.concatenate([h for h, _, _ in parts] + [np.zeros(0, dtype=np.uint64)]),
+            np.repeat(np.arange(offset, offset + len(texts), dtype=np.int32), counts),
+            np.concatenate([s for _, s, _ in parts] + [np.zeros(0, dtype=np.int64)]).astype(np.int32),
+            np.concatenate([e for _, _, e in parts] + [np.zeros(0, dtype=np.int64)]).astype(np.int32),
+        )
+
+    @classmethod
+    def concat(cls, indexes: Iterable["FingerprintIndex"]) -> "FingerprintIndex":
+        """Merge indexes over disjoint documents (doc positions must already be global)."""
+        indexes = list(indexes)
+        return cls._sorted(
+            np.concatenate([i.hashes for i in indexes]),
+            np.concatenate([i.docs for i in indexes]),
+            np.concatenate([i.starts for i in indexes]),
+            np.concatenate([i.ends for i in indexes]),
+        )
+
+    @classmethod
+    def _sorted(cls, hashes, docs, starts, ends) -> "FingerprintIndex":
+        order = np.lexsort((starts, docs, hashes))
+        return cls(hashes[order], docs[order], starts[order], ends[order])
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def select(self, docs: np.ndarray, offset: int = 0) -> "FingerprintIndex":
+        """Fingerprints of the documents at positions `docs` (ascending), renumbered offset, offset+1, ..."""
+        keep = np.isin(self.docs, docs)
+        renumbered = (np.searchsorted(docs, self.docs[keep]) + offset).astype(np.int32)
+        # Renumerar preserva a ordem relativa dos documentos: continua ordenado
+        return FingerprintIndex(self.hashes[keep], renumbered, self.starts[keep], self.ends[keep])
+
+    def extend(self, texts: Sequence[str], offset: int) -> "FingerprintIndex":
+        """New index with the fingerprints of `texts` appended as documents offset, offset+1, ..."""
+        return FingerprintIndex.concat([self, FingerprintIndex.build(texts, offset)])
+
+    def search(
+        self, query: str, k: int, alive: np.ndarray | None = None
+    ) -> List[Tuple[int, float, List[Span]]]:
+        """
+        Documents sharing fingerprints with `query`, best first: (doc position,
+        share of the query fingerprints found in it, copied spans). Runs of
+        matching k-grams are merged into spans; a span's score is the share of the
+        query fingerprints inside it that match, 1.0 for verbatim copies.
+        """
+        q_hash, q_starts, q_ends = fingerprints(query)
+        if len(q_hash) == 0 or len(self.hashes) == 0 or k <= 0:
+            return []
+        lo = np.searchsorted(self.hashes, q_hash, side="left")
+        hi = np.searchsorted(self.hashes, q_hash, side="right")
+        counts = hi - lo
+        # k-gramas muito frequentes (boilerplate) não identificam a fonte
+        counts[counts > FINGERPRINT_MAX_DF] = 0
+        total = int(counts.sum())
+        if total == 0:
+            return []
+        q_idx = np.repeat(np.arange(len(q_hash)), counts)
+        entry = lo[q_idx] + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        docs = self.docs[entry]
+        if alive is not None:
+            keep = alive[docs]
+            q_idx, entry, docs = q_idx[keep], entry[keep], docs[keep]
+            if len(docs) == 0:
+                return []
+
+        # Score do documento: fração distinta das impressões da consulta encontradas nele
+        pairs = np.unique(np.stack([docs.astype(np.int64), q_idx]), axis=1)
+        cand, n_matched = np.unique(pairs[0], return_counts=True)
+        scores = n_matched / len(q_hash)
+        results = []
+        for i in topk_indices(scores, k):
+            pos = int(cand[i])
+            mask = docs == pos
+            spans = _merge_spans(
+                q_idx[mask], q_starts, q_ends, self.starts[entry[mask]], self.ends[entry[mask]]
+            )
+            results.append((pos, float(scores[i]), spans))
+        return results
+
+
+def _merge_spans(
+    q_idx: np.ndarray,
+    q_starts: np.ndarray,
+    q_ends: np.ndarray,
+    d_starts: np.ndarray,
+    d_ends: np.ndarray,
+    gap: int = FINGERPRINT_GAP,
+) -> List[Span]:
+    # Encadeia k-gramas casados que avançam juntos na consulta e no documento
+    order = np.lexsort((d_starts, q_idx))
+    spans: List[list] = []
+    for j in order:
+        qi = int(q_idx[j])
+        qs, qe, ds, de = int(q_starts[qi]), int(q_ends[qi]), int(d_starts[j]), int(d_ends[j])
+        # Um k-grama repetido no documento não deve interromper o trecho principal
+        for cur in reversed(spans):
+            if qs <= cur[1] + gap and cur[2] <= ds <= cur[3] + gap:
+                cur[1], cur[3] = max(cur[1], qe), max(cur[3], de)
+                cur[4].add(qi)
+                break
+        else:
+            spans.append([qs, qe, ds, de, {qi}])
+    result = []
+    for qs, qe, ds, de, matched in spans:
+        # Impressões da consulta que começam dentro do trecho (casadas ou não)
+        inside = int(np.searchsorted(q_starts, qe, side="left") - np.searchsorted(q_starts, qs, side="left"))
+        result.append((qs, qe, ds, de, len(matched) / max(inside, 1)))
+    return result
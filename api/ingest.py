@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from fingerprint import FingerprintIndex
+from models.corpus import CorpusIndex, PassageTable, SentenceTable
+from models.document import Document
+from passages import build_passage_table, passage_offsets, passage_texts, pool_embeddings
+from split import build_sentence_table, sentence_offsets
+from utils.config import (
+    FINGERPRINT_KGRAM,
+    INDEX_MODE,
+    INGEST_CHUNK_SIZE,
+    INGEST_DIR,
+    INGEST_WORKERS,
+    LEXICAL_CHAR_WEIGHT,
+    TFIDF_CHAR_PARAMS,
+    TFIDF_WORD_PARAMS,
+)
+from utils.metrics import timer
+
+if TYPE_CHECKING:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+# Este módulo é importado pelos processos filhos: nada de `match` (e do modelo) aqui no topo.
+
+logger = logging.getLogger(__name__)
+
+
+def _shard_path(work_dir: str, n: int, kind: str, ext: str) -> str:
+    return os.path.join(work_dir, f"{kind}-{n:05d}.{ext}")
+
+
+def _write_shards(docs: Iterable[Document], work_dir: str, chunk_size: int) -> Tuple[int, int]:
+    """Stream documents into JSONL shards of `chunk_size` docs; returns (n_shards, n_docs)."""
+    n_shards = n_docs = 0
+    out = None
+    for doc in docs:
+        if n_docs % chunk_size == 0:
+            if out is not None:
+                out.close()
+            out = open(_shard_path(work_dir, n_shards, "docs", "jsonl"), "w", encoding="utf-8")
+            n_shards += 1
+        out.write(json.dumps({"id": doc.id, "title": doc.title, "text": doc.text}, ensure_ascii=False) + "\n")
+        n_docs += 1
+    if out is not None:
+        out.close()
+    return n_shards, n_docs
+
+
+def _read_shard(work_dir: str, n: int) -> List[dict]:
+    with open(_shard_path(work_dir, n, "docs", "jsonl"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def _iter_texts(work_dir: str, n_shards: int) -> Iterator[str]:
+    for n in range(n_shards):
+        for row in _read_shard(work_dir, n):
+            yield row["text"]
+
+
+def _fit_vectorizer(params: dict, work_dir: str, n_shards: int) -> TfidfVectorizer:
+    # Lê os textos dos shards em disco em vez de recebê-los do processo principal
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vectorizer = TfidfVectorizer(**params)
+    vectorizer.fit(_iter_texts(work_dir, n_shards))
+    vectorizer.stop_words_ = None  # só serve para inspeção e pode ser enorme
+    return vectorizer
+
+
+_worker_vectorizers: Dict[str, tuple] = {}
+
+
+def _load_vectorizers(work_dir: str) -> tuple:
+    if work_dir not in _worker_vectorizers:
+        with open(os.path.join(work_dir, "vectorizers.pkl"), "rb") as f:
+            _worker_vectorizers[work_dir] = pickle.load(f)
+    return _worker_vectorizers[work_dir]
+
+
+def _vectorize_shard(work_dir: str, n: int, mode: str, offset: int) -> int:
+    """
+    Vectorize one shard (word/char TF-IDF, sentence table, passages, fingerprints)
+    and save it next to it. `offset` is the global position of its first document.
+    """
+    word, char = _load_vectorizers(work_dir)
+    texts = [row["text"] for row in _read_shard(work_dir, n)]
+    sparse.save_npz(_shard_path(work_dir, n, "word", "npz"), word.transform(texts))
+    if char is not None:
+        sparse.save_npz(_shard_path(work_dir, n, "char", "npz"), char.transform(texts))
+    table = build_sentence_table(texts, word)
+    sparse.save_npz(_shard_path(work_dir, n, "sent", "npz"), table.matrix)
+    np.savez(_shard_path(work_dir, n, "offsets", "npz"), starts=table.starts, ends=table.ends, doc_ptr=table.doc_ptr)
+    if mode == "passage":
+        # Embeddings dos trechos ficam com o processo principal (ver _encode_shard)
+        passages = build_passage_table(texts, word, char, embed_matrix=np.zeros((0, 0)), sentences=table)
+        sparse.save_npz(_shard_path(work_dir, n, "pass_word", "npz"), passages.word_matrix)
+        if char is not None:
+            sparse.save_npz(_shard_path(work_dir, n, "pass_char", "npz"), passages.char_matrix)
+        np.savez(
+            _shard_path(work_dir, n, "pass_offsets", "npz"),
+            starts=passages.starts, ends=passages.ends, doc_ptr=passages.doc_ptr,
+        )
+    if FINGERPRINT_KGRAM > 0:
+        fp = FingerprintIndex.build(texts, offset)
+        np.savez(_shard_path(work_dir, n, "fp", "npz"), hashes=fp.hashes, docs=fp.docs, starts=fp.starts, ends=fp.ends)
+    return len(texts)
+
+
+def _load_fingerprints(work_dir: str, n: int) -> FingerprintIndex:
+    arrays = np.load(_shard_path(work_dir, n, "fp", "npz"))
+    return FingerprintIndex(arrays["hashes"], arrays["docs"], arrays["starts"], arrays["ends"])
+
+
+def _encode_shard(work_dir: str, n: int, mode: str, encode) -> int:
+    """Embed one shard (documents, or passages and their pooled document vectors)."""
+    texts = [row["text"] for row in _read_shard(work_dir, n)]
+    if mode == "passage":
+        starts, ends, doc_ptr = passage_offsets(*sentence_offsets(texts))
+        chunks = passage_texts(texts, starts, ends, doc_ptr)
+        embed = np.asarray(encode(chunks), dtype=np.float32)
+        np.save(_shard_path(work_dir, n, "pass_embed", "npy"), embed)
+        table = PassageTable(starts, ends, doc_ptr, None, None, embed)
+        np.save(_shard_path(work_dir, n, "embed", "npy"), pool_embeddings(table, embed.shape[1]))
+    else:
+        np.save(_shard_path(work_dir, n, "embed", "npy"), np.asarray(encode(texts), dtype=np.float32))
+    return len(texts)
+
+
+def _load_passages(work_dir: str, n: int, with_char: bool) -> PassageTable:
+    arrays = np.load(_shard_path(work_dir, n, "pass_offsets", "npz"))
+    char = sparse.load_npz(_shard_path(work_dir, n, "pass_char", "npz")) if with_char else None
+    return PassageTable(
+        starts=arrays["starts"],
+        ends=arrays["ends"],
+        doc_ptr=arrays["doc_ptr"],
+        word_matrix=sparse.load_npz(_shard_path(work_dir, n, "pass_word", "npz")),
+        char_matrix=char,
+        embed_matrix=np.load(_shard_path(work_dir, n, "pass_embed", "npy")),
+    )
+
+
+def _load_sentences(work_dir: str, n: int) -> SentenceTable:
+    arrays = np.load(_shard_path(work_dir, n, "offsets", "npz"))
+    return SentenceTable(
+        starts=arrays["starts"],
+        ends=arrays["ends"],
+        doc_ptr=arrays["doc_ptr"],
+        matrix=sparse.load_npz(_shard_path(work_dir, n, "sent", "npz")),
+    )
+
+
+class _InlineExecutor:
+    """Executor-like stand-in that runs jobs in the calling process (workers <= 1)."""
+
+    def submit(self, fn, *args) -> Future:
+        future: Future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait: bool = True) -> None:
+        pass
+
+
+def _rate(n: int, start: float) -> float:
+    return n / max(time.perf_counter() - start, 1e-9)
+
+
+@timer("ingest")
+def ingest_corpus(
+    docs: Iterable[Document],
+    work_dir: str = INGEST_DIR,
+    chunk_size: int = INGEST_CHUNK_SIZE,
+    workers: int = INGEST_WORKERS,
+    encode=None,
+    mode: str = INDEX_MODE,
+) -> CorpusIndex:
+    """
+    Build a CorpusIndex from a stream of documents, chunk by chunk.
+
+    Documents are written to JSONL shards as they arrive, the TF-IDF vocabularies
+    are fitted from the shards, and each shard is then vectorized by a pool of
+    worker processes while the main process encodes the same shards. Every
+    intermediate result lives on disk, so besides the final index only
+    `chunk_size` documents (times the number of jobs in flight) are held in
+    memory at once. `encode` defaults to the shared sentence encoder; `mode` is
+    the index mode, as in `match.build_index`. Shards go to a directory of this
+    build under `work_dir`, deleted at the end: concurrent builds sharing
+    `work_dir` (uvicorn workers, containers on the same volume) don't collide.
+    """
+    if encode is None:
+        from match import get_encoder  # import tardio: carrega o modelo
+        encode = get_encoder().encode
+
+    os.makedirs(work_dir, exist_ok=True)
+    # Como o .tmp-<pid> de store.save_index: só este diretório é apagado
+    run_dir = tempfile.mkdtemp(prefix=f"tmp-{os.getpid()}-", dir=work_dir)
+    try:
+        return _ingest(docs, run_dir, chunk_size, workers, encode, mode)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+        _worker_vectorizers.pop(run_dir, None)
+
+
+def _ingest(docs: Iterable[Document], work_dir: str, chunk_size: int, workers: int, encode, mode: str) -> CorpusIndex:
+    from match import assemble_index
+
+    if workers > 1:
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        executor = _InlineExecutor()
+    try:
+        # 1) Documentos -> shards JSONL
+        t0 = time.perf_counter()
+        n_shards, n_docs = _write_shards(docs, work_dir, chunk_size)
+        logger.info(
+            "ingest: wrote %d docs in %d shards (%.0f docs/s)", n_docs, n_shards, _rate(n_docs, t0)
+        )
+        if n_docs == 0:
+            raise ValueError("no documents to ingest")
+
+        # 2) Vocabulários word e char ajustados em paralelo
+        t0 = time.perf_counter()
+        word_future = executor.submit(_fit_vectorizer, TFIDF_WORD_PARAMS, work_dir, n_shards)
+        char_future = None
+        if LEXICAL_CHAR_WEIGHT > 0:
+            char_future = executor.submit(_fit_vectorizer, TFIDF_CHAR_PARAMS, work_dir, n_shards)
+        word = word_future.result()
+        char = char_future.result() if char_future is not None else None
+        with open(os.path.join(work_dir, "vectorizers.pkl"), "wb") as f:
+            pickle.dump((word, char), f)
+        logger.info("ingest: fitted vectorizers (%.0f docs/s)", _rate(n_docs, t0))
+
+        # 3) Vetorização nos workers (fila limitada) enquanto o processo principal codifica
+        t0 = time.perf_counter()
+        max_pending = max(2, 2 * workers)
+        pending: set = set()
+        done_docs = encoded_docs = 0
+        for n in range(n_shards):
+            while len(pending) >= max_pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                done_docs += sum(f.result() for f in finished)
+            pending.add(executor.submit(_vectorize_shard, work_dir, n, mode, n * chunk_size))
+            encoded_docs += _encode_shard(work_dir, n, mode, encode)
+            logger.info(
+                "ingest: encoded shard %d/%d (%.0f docs/s, %d docs vectorized)",
+                n + 1, n_shards, _rate(encoded_docs, t0), done_docs,
+            )
+        done_docs += sum(f.result() for f in pending)
+        logger.info("ingest: vectorized and encoded %d docs (%.0f docs/s)", done_docs, _rate(n_docs, t0))
+    finally:
+        executor.shutdown(wait=True)
+
+    # 4) Montagem do índice a partir dos shards
+    t0 = time.perf_counter()
+    ids: List[int] = []
+    titles: List[str | None] = []
+    texts: List[str] = []
+    for n in range(n_shards):
+        for row in _read_shard(work_dir, n):
+            ids.append(row["id"])
+            titles.append(row["title"])
+            texts.append(row["text"])
+    shards = range(n_shards)
+    word_matrix = sparse.vstack([sparse.load_npz(_shard_path(work_dir, n, "word", "npz")) for n in shards], format="csr")
+    char_matrix = None
+    if char is not None:
+        char_matrix = sparse.vstack([sparse.load_npz(_shard_path(work_dir, n, "char", "npz")) for n in shards], format="csr")
+    embed = np.concatenate([np.load(_shard_path(work_dir, n, "embed", "npy")) for n in shards])
+    sentences = SentenceTable.concat([_load_sentences(work_dir, n) for n in shards])
+    passages = None
+    if mode == "passage":
+        passages = PassageTable.concat([_load_passages(work_dir, n, char is not None) for n in shards])
+    fingerprints = None
+    if FINGERPRINT_KGRAM > 0:
+        fingerprints = FingerprintIndex.concat(_load_fingerprints(work_dir, n) for n in shards)
+    index = assemble_index(
+        ids, titles, texts, word, word_matrix, char, char_matrix, embed, sentences, passages, fingerprints
+    )
+    logger.info("ingest: assembled index of %d docs (%.0f docs/s)", n_docs, _rate(n_docs, t0))
+    return index
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import logging
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+
+class PostingIndex:
+    """
+    Term -> postings view of a (docs x terms) TF-IDF matrix, i.e. its CSC form.
+    `max_weight[t]` is the largest weight of term t in any document and bounds how
+    much that term can add to a document score.
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, max_weight: np.ndarray, n_docs: int):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.max_weight = max_weight
+        self.n_docs = n_docs
+
+    @classmethod
+    def from_matrix(cls, matrix) -> "PostingIndex":
+        csc = sparse.csc_matrix(matrix)
+        csc.sort_indices()
+        max_weight = np.asarray(csc.max(axis=0).todense()).ravel()
+        return cls(csc.indptr, csc.indices, csc.data, max_weight, csc.shape[0])
+
+    def postings(self, term: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.indptr[term], self.indptr[term + 1]
+        return self.indices[start:end], self.data[start:end]
+
+
+def search_postings(
+    spaces: Sequence[Tuple[PostingIndex, sparse.csr_matrix, float]],
+    k: int,
+    alive: np.ndarray | None = None,
+) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    Exact top-k over a weighted sum of dot products, scoring only documents that
+    share terms with the query.
+
+    `spaces` holds (postings, query row, weight) per vector space. Terms are read
+    in decreasing order of their score upper bound (term-at-a-time MaxScore): once
+    the bound of the terms still to read falls below the current k-th best score,
+    no new document can reach the top-k, so only the surviving candidates keep
+    being scored and those that cannot catch up are dropped.
+
+    Returns the candidate positions and, for each space, their unweighted scores.
+    Every document in the true top-k is a candidate and its scores are complete.
+    Documents with `alive[pos] == False` (tombstones) are never candidates.
+    Scores are accumulated only for documents found in the postings read, so
+    the work and memory follow the postings touched, not the corpus size.
+    """
+    terms = []  # (bound, space, term, weighted query value)
+    for s, (postings, q_row, weight) in enumerate(spaces):
+        if weight <= 0:
+            continue
+        q_row = sparse.csr_matrix(q_row)
+        for term, value in zip(q_row.indices, q_row.data):
+            bound = weight * value * postings.max_weight[term]
+            if bound > 0:
+                terms.append((bound, s, int(term), float(value)))
+    terms.sort(key=lambda t: -t[0])
+    rest = np.cumsum([t[0] for t in reversed(terms)])[::-1].tolist() + [0.0]
+
+    weights = [w for _, _, w in spaces]
+    # Acumuladores esparsos (só documentos vistos nas postings lidas), nunca do tamanho do corpus
+    read: List[list] = [[] for _ in spaces]  # (docs, contribuições) por espaço, até a poda começar
+    cand = np.zeros(0, dtype=np.int64)
+    acc = [np.zeros(0, dtype=np.float64) for _ in spaces]
+    theta = 0.0
+    pruning = False
+
+    for i, (_, s, term, value) in enumerate(terms):
+        docs, vals = spaces[s][0].postings(term)
+        if pruning:
+            # Só os candidatos sobreviventes (cand está ordenado) recebem a contribuição
+            at = np.searchsorted(cand, docs)
+            hit = at < len(cand)
+            hit[hit] = cand[at[hit]] == docs[hit]
+            acc[s][at[hit]] += value * vals[hit]
+        else:
+            read[s].append((docs, value * vals))
+        # O limiar só cresce, então basta recalculá-lo de tempos em tempos antes da poda
+        if not pruning and (i & (i + 1)) != 0 and i + 1 < len(terms):
+            continue
+        if not pruning:
+            cand, acc = _accumulate(read, alive)
+        combined = sum(w * a for w, a in zip(weights, acc))
+        if len(cand) >= k > 0:
+            theta = max(theta, float(np.partition(combined, len(cand) - k)[len(cand) - k]))
+        if rest[i + 1] < theta:
+            pruning = True
+            keep = combined + rest[i + 1] >= theta
+            cand, acc = cand[keep], [a[keep] for a in acc]
+    return cand, acc
+
+
+def _accumulate(read: List[list], alive: np.ndarray | None) -> Tuple[np.ndarray, List[np.ndarray]]:
+    # Soma por documento das contribuições lidas: custo proporcional às postings, não a n_docs
+    docs = np.concatenate([d for parts in read for d, _ in parts] + [np.zeros(0, dtype=np.int64)])
+    cand, inverse = np.unique(docs, return_inverse=True)
+    inverse = inverse.ravel()
+    acc, start = [], 0
+    for parts in read:
+        vals = np.concatenate([v for _, v in parts] + [np.zeros(0, dtype=np.float64)])
+        # Sem postings lidas no espaço, bincount devolveria inteiros
+        acc.append(np.bincount(inverse[start:start + len(vals)], weights=vals, minlength=len(cand)).astype(np.float64))
+        start += len(vals)
+    cand = cand.astype(np.int64)
+    if alive is not None:
+        keep = alive[cand]
+        cand, acc = cand[keep], [a[keep] for a in acc]
+    return cand, acc
+
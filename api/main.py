@@ -1,17 +1,77 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-from functools import lru_cache
-from typing import List
+import threading
+import time
+from typing import Dict, List, Tuple
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
 
-from match import CorpusIndex, build_index, topk_lexical, topk_semantic
-from split import sentence_alignment
-from data import load_wikipedia_docs
-from models.response import CompareMethodResult, CompareResponse, DocSentences, SentencePair
-from models.request import CompareRequest
-from utils.config import TOP_K_MAX
+import match
+from match import (
+    CorpusIndex,
+    apply_updates,
+    compact_index,
+    query_cache,
+)
+from report import build_report
+from shards import ShardPool, coordinator_view
+from split import Alignment, sentence_alignment, split_sentences
+from data import iter_wikipedia_docs
+from ingest import ingest_corpus
+from store import append_update, index_version, load_index, read_updates, save_index
+from models.response import (
+    CompareBatchResponse,
+    CompareMethodResult,
+    CompareResponse,
+    DocAlignment,
+    DocSentences,
+    DocumentText,
+    DocumentsUpdateResponse,
+    ReportResponse,
+    ReportSentence,
+    ReportSource,
+    ReportSpan,
+    SentencePair,
+)
+from models.request import (
+    CompareBatchRequest,
+    CompareRequest,
+    DocumentsAddRequest,
+    DocumentsRemoveRequest,
+    ReportRequest,
+)
+from utils.cache import MISSING, LRUCache, text_key
+from utils.config import (
+    ADMIN_TOKEN,
+    BATCH_SIZE_MAX,
+    CACHE_TTL,
+    COMPACT_DEAD_RATIO,
+    COMPACT_DELTA_RATIO,
+    COMPACT_INTERVAL,
+    COMPARE_MODE,
+    EMBED_QUANT,
+    FINGERPRINT_MIN,
+    INDEX_DIR,
+    REPORT_MAX_SENTS,
+    REPORT_MIN_LEXICAL,
+    REPORT_MIN_SEMANTIC,
+    RESPONSE_CACHE_SIZE,
+    SHARD_DIR,
+    SHARDS,
+    STREAM_ALIGN_MAX,
+    TOP_K_MAX,
+    WARMUP_MODE,
+    WORKER_QUEUE_MAX,
+    WORKER_THREADS,
+)
+from utils.metrics import REQUEST_SECONDS, STAGE_SECONDS, gauge, profiling, timed
+from utils.serialize import FastJSONResponse, dumps
+from utils.workers import PoolSaturated, WorkerPool
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -20,71 +80,818 @@ app = FastAPI(title="Letrus - Detector de plágio")
 
 CACHE_LOADED = False
 
-@lru_cache(maxsize=1)
+# Estágios pesados rodam fora do event loop; além de WORKER_QUEUE_MAX requisições, 503
+pool = WorkerPool(WORKER_THREADS, WORKER_QUEUE_MAX)
+
+# Respostas completas, por (texto, top_k, detail, versão do índice). O texto não é
+# normalizado aqui: os offsets da resposta dependem dele caractere a caractere.
+response_cache = LRUCache(RESPONSE_CACHE_SIZE, CACHE_TTL)
+
+
+COMPARE_MODES = ("full", "fast", "auto")
+PAIR_COLUMNS = ("query_start", "query_end", "doc_start", "doc_end", "score")
+NDJSON = "application/x-ndjson"
+
+
+def response_key(idx: CorpusIndex, text: str, top_k: int, detail: bool, mode: str = "full") -> tuple:
+    return (text_key(text, normalize=False), top_k, detail, mode, idx.version, idx.generation)
+
+
+_index: CorpusIndex | None = None
+_shards: ShardPool | None = None  # processos de busca quando SHARDS > 1
+_retired: Dict[ShardPool, threading.Timer] = {}  # shards substituídos, fechados após as requisições em andamento
+_index_build_seconds = 0.0  # duração da última carga/construção do índice
+_http_in_flight = 0
+_index_lock = threading.Lock()  # carga inicial do índice
+_warmup: threading.Thread | None = None  # carga do índice e do encoder em segundo plano
+_warmup_error: str | None = None
+_write_lock = threading.Lock()  # serializa inclusões, remoções e compactação
+
+
+class IndexNotReady(Exception):
+    """Raised while the background warmup is still loading the index."""
+
+
 def get_index() -> CorpusIndex:
-    global CACHE_LOADED
-    docs = load_wikipedia_docs()
-    ids = [d.id for d in docs]
-    titles = [d.title for d in docs]
-    texts = [d.text for d in docs]
-    logger.info("Building corpus index: %d docs", len(docs))
-    index = build_index(ids, titles, texts)
+    if _index is None:
+        if _warmup is not None and _warmup.is_alive():
+            raise IndexNotReady()
+        _ensure_index()
+    return _index
+
+
+async def request_index() -> CorpusIndex:
+    """`get_index` for the routes: a lazy load runs in a thread, so /health and /ready keep answering."""
+    if _index is None:
+        return await asyncio.to_thread(get_index)
+    return _index
+
+
+def _ensure_index() -> None:
+    with _index_lock:
+        if _index is None:
+            set_index(load_or_build_index())
+
+
+def warmup(raise_errors: bool = False) -> None:
+    """
+    Load the index and the encoder, so the first request pays for neither.
+    Errors are shown by /ready (the next request tries again), or raised with
+    `raise_errors`.
+    """
+    global _warmup_error
+    start = time.perf_counter()
+    try:
+        _ensure_index()
+        match.get_encoder().encode(["aquecimento do modelo"])
+    except Exception as e:
+        _warmup_error = f"{type(e).__name__}: {e}"
+        logger.exception("Warmup failed")
+        if raise_errors:
+            raise
+        return
+    _warmup_error = None
+    logger.info("Warmup finished in %.1fs", time.perf_counter() - start)
+
+
+def start_warmup() -> None:
+    """Run `warmup` in a background thread, unless one is already running."""
+    global _warmup
+    if _warmup is None or not _warmup.is_alive():
+        _warmup = threading.Thread(target=warmup, name="warmup", daemon=True)
+        _warmup.start()
+
+
+def is_ready() -> bool:
+    if WARMUP_MODE == "off":
+        # O encoder carrega na 1ª consulta; pronto = índice carregado
+        return _index is not None
+    return _index is not None and match.get_encoder().loaded
+
+
+def set_index(index: CorpusIndex) -> None:
+    global _index, _shards, CACHE_LOADED
+    old = _shards
+    if SHARDS > 1:
+        # A busca fica nos shards; aqui só ids, títulos, textos e offsets
+        _shards = ShardPool(index, SHARDS, SHARD_DIR)
+        if INDEX_DIR:
+            # Sem snapshot, a compactação só teria o índice inteiro daqui
+            index = coordinator_view(index)
+    _index = index
+    response_cache.clear()
     CACHE_LOADED = True
+    if old is not None:
+        _retire(old)
+
+
+def _retire(shards: ShardPool, delay: float = 30) -> None:
+    # Requisições em andamento ainda podem estar usando os shards antigos
+    def close() -> None:
+        if _retired.pop(shards, None) is not None:
+            shards.close()
+
+    # daemon: o timer não segura o fim do processo (o shutdown fecha o que restar)
+    timer = threading.Timer(delay, close)
+    timer.daemon = True
+    _retired[shards] = timer
+    timer.start()
+
+
+def searcher():
+    """Where the top-k searches run: the shard processes when SHARDS > 1, else this process."""
+    return _shards or match
+
+
+def has_fingerprints(idx: CorpusIndex) -> bool:
+    return _shards.fingerprints if _shards is not None else idx.fingerprints is not None
+
+
+def full_index() -> CorpusIndex:
+    """
+    The served index with all its search structures. With shards the API
+    process keeps only a coordinator view, so the index is reloaded from the
+    snapshot and the update log (the only place it is whole).
+    """
+    idx = get_index()
+    if _shards is None or not INDEX_DIR:
+        return idx
+    full = load_index(INDEX_DIR, idx.version)
+    if full is None:
+        raise RuntimeError(f"snapshot {idx.version} not found under {INDEX_DIR}")
+    return apply_updates(full, read_updates(INDEX_DIR, idx.version))
+
+
+def load_or_build_index() -> CorpusIndex:
+    global _index_build_seconds
+    start = time.perf_counter()
+    version = index_version()
+    index = load_index(INDEX_DIR, version) if INDEX_DIR else None
+    if index is not None:
+        # Inclusões e remoções feitas desde a última compactação
+        updates = read_updates(INDEX_DIR, version)
+        if updates:
+            logger.info("Replaying %d index updates", len(updates))
+            index = apply_updates(index, updates)
+    if index is None:
+        logger.info("Building corpus index")
+        index = ingest_corpus(iter_wikipedia_docs())
+        index.version = version
+        if INDEX_DIR:
+            save_index(index, INDEX_DIR)
+            if EMBED_QUANT != "none":
+                # Recarrega o snapshot: os float32 ficam mapeados em disco e só os códigos em memória
+                index = load_index(INDEX_DIR, version) or index
+    _index_build_seconds = time.perf_counter() - start
     return index
 
 
+def compact_now() -> CorpusIndex:
+    with _write_lock:
+        compacted = compact_index(full_index())
+        if INDEX_DIR:
+            save_index(compacted, INDEX_DIR, overwrite=True)
+        set_index(compacted)
+    return compacted
+
+
+async def compaction_loop():
+    # Compactação em segundo plano quando há muitos removidos/adicionados (estilo LSM)
+    while True:
+        await asyncio.sleep(COMPACT_INTERVAL)
+        idx = _index
+        if idx is not None and idx.needs_compaction(COMPACT_DEAD_RATIO, COMPACT_DELTA_RATIO):
+            try:
+                await asyncio.to_thread(compact_now)
+            except Exception:  # pragma: no cover - mantém o loop vivo
+                logger.exception("Background compaction failed")
+
+
 @app.on_event("startup") 
 async def preload():
-    logger.info("Preloading corpus index...")
-    get_index()
+    # background: a porta abre na hora e /ready responde 503 até o índice e o encoder carregarem
+    if WARMUP_MODE == "background":
+        start_warmup()
+    elif WARMUP_MODE == "blocking":
+        logger.info("Preloading corpus index...")
+        # Falha aqui impede a subida em vez de deixar a API sem índice
+        await asyncio.to_thread(warmup, True)
+    if COMPACT_INTERVAL > 0:
+        asyncio.get_running_loop().create_task(compaction_loop())
+
+
+@app.on_event("shutdown")
+async def close_shards():
+    # Shards substituídos ainda à espera do timer e os atuais
+    pools = list(_retired)
+    for timer in _retired.values():
+        timer.cancel()
+    _retired.clear()
+    if _shards is not None:
+        pools.append(_shards)
+    for shards in pools:
+        await asyncio.to_thread(shards.close)
+
+
+@app.exception_handler(PoolSaturated)
+async def pool_saturated(request: Request, exc: PoolSaturated):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servidor ocupado, tente novamente"},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(IndexNotReady)
+async def index_not_ready(request: Request, exc: IndexNotReady):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Índice carregando, tente novamente"},
+        headers={"Retry-After": "5"},
+    )
+
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    global _http_in_flight
+    _http_in_flight += 1
+    start = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        _http_in_flight -= 1
+        # Rótulo pelo template da rota (não pela URL) para não explodir a cardinalidade
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(getattr(route, "path", "other"), time.perf_counter() - start)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> str:
+    """Prometheus text exposition: stage/request latency, index footprint, caches and load."""
+    lines = STAGE_SECONDS.render() + REQUEST_SECONDS.render()
+    idx = _index
+    if idx is not None:
+        usage = idx.memory_usage()
+        lines += gauge(
+            "letrus_index_bytes", "Bytes held by each index component.",
+            [({"component": name, "storage": storage}, size) for (name, storage), size in sorted(usage.items())],
+        )
+        lines += gauge("letrus_index_documents", "Live documents in the index.", [({}, idx.n_alive)])
+        lines += gauge("letrus_index_deleted", "Tombstoned documents awaiting compaction.", [({}, idx.n_dead)])
+        lines += gauge("letrus_index_generation", "Index generation (bumped on every update).", [({}, idx.generation)])
+    lines += gauge("letrus_index_build_seconds", "Duration of the last index load or build.", [({}, _index_build_seconds)])
+    for name, cache in (("query", query_cache), ("response", response_cache)):
+        stats = cache.stats()
+        lines += gauge(f"letrus_{name}_cache_hits_total", f"Hits of the {name} cache.", [({}, stats["hits"])], "counter")
+        lines += gauge(f"letrus_{name}_cache_misses_total", f"Misses of the {name} cache.", [({}, stats["misses"])], "counter")
+        lines += gauge(f"letrus_{name}_cache_hit_ratio", f"Hit ratio of the {name} cache.", [({}, stats["hit_ratio"])])
+        lines += gauge(f"letrus_{name}_cache_entries", f"Entries in the {name} cache.", [({}, stats["size"])])
+    lines += gauge("letrus_http_in_flight", "HTTP requests being served.", [({}, _http_in_flight)])
+    lines += gauge("letrus_pool_in_flight", "Requests holding a worker pool slot.", [({}, pool.in_flight)])
+    lines += gauge("letrus_pool_rejected_total", "Requests rejected with 503 (pool saturated).", [({}, pool.rejected)], "counter")
+    return "\n".join(lines) + "\n"
 
 
 @app.get("/health")
 async def health():
-    return { "status": "ok", "cache_loaded": CACHE_LOADED }
+    """Liveness: answers as soon as the port is open, even while warming up."""
+    return {
+        "status": "ok",
+        "ready": is_ready(),
+        "cache_loaded": CACHE_LOADED,
+        "shards": _shards.n if _shards is not None else 1,
+        "pool": pool.stats(),
+        "cache": {"query": query_cache.stats(), "response": response_cache.stats()},
+    }
 
 
-@app.post("/compare", response_model=CompareResponse)
-async def compare(payload: CompareRequest) -> CompareResponse:
-    if payload.top_k > TOP_K_MAX:
-        raise HTTPException(status_code=400, detail=f"top_k máximo é {TOP_K_MAX}")
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the index and the encoder are loaded, 503 before."""
+    status = {"index": _index is not None, "encoder": match.get_encoder().loaded, "error": _warmup_error}
+    if WARMUP_MODE == "off" and _index is None:
+        # Sem aquecimento na subida, o 1º /ready começa a carga (sem travar o loop)
+        start_warmup()
+    if is_ready():
+        return {"status": "ready", **status}
+    return JSONResponse(status_code=503, content={"status": "warming_up", **status}, headers={"Retry-After": "5"})
 
-    idx = get_index()
-    k = min(payload.top_k, len(idx.ids))
-
-    lex_docs = topk_lexical(idx, payload.text, k)
-    sem_docs = topk_semantic(idx, payload.text, k)
-
-    def build_doc_groups(doc_ids: List[int]) -> List[DocSentences]:
-        groups: List[DocSentences] = []
-        for doc_id in doc_ids:
-            pos = idx.ids.index(doc_id)
-            title = idx.titles[pos]
-            text = idx.texts[pos]
-            sent_align = sentence_alignment(idx, payload.text, text, top_n=5)
+
+def align_doc(idx: CorpusIndex, text: str, pos: int, span: Tuple[int, int] | None = None) -> Alignment:
+    # Já vem ordenado por score desc
+    seg, row = idx.segment(pos)
+    return sentence_alignment(seg, text, seg.texts[row], top_n=5, doc_pos=row, span=span)
+
+
+def sentence_pairs(alignment: Alignment) -> List[SentencePair]:
+    # Valores já tipados pelo alinhamento: model_construct dispensa a validação
+    return [SentencePair.model_construct(**m) for m in alignment]
+
+
+def build_response(
+    idx: CorpusIndex,
+    text: str,
+    lex_docs: List[Tuple[int, float]],
+    sem_docs: List[Tuple[int, float]],
+    detail: bool = True,
+    spans: Dict[int, Tuple[int, int]] | None = None,
+) -> CompareResponse:
+    with timed("response"):
+        return _build_response(idx, text, lex_docs, sem_docs, detail, spans)
+
+
+def _build_response(
+    idx: CorpusIndex,
+    text: str,
+    lex_docs: List[Tuple[int, float]],
+    sem_docs: List[Tuple[int, float]],
+    detail: bool,
+    spans: Dict[int, Tuple[int, int]] | None,
+) -> CompareResponse:
+    # Cada documento é alinhado uma única vez, mesmo se aparece nos dois métodos
+    spans = spans or {}
+    alignments: Dict[int, Alignment] = {}
+    if detail:
+        alignments = {
+            doc_id: align_doc(idx, text, pos, spans.get(doc_id))
+            for doc_id, pos in doc_positions(idx, lex_docs, sem_docs).items()
+        }
+    return assemble_response(idx, text, lex_docs, sem_docs, alignments)
+
+
+def doc_positions(
+    idx: CorpusIndex, lex_docs: List[Tuple[int, float]], sem_docs: List[Tuple[int, float]]
+) -> Dict[int, int]:
+    return {doc_id: idx.position(doc_id) for doc_id, _ in lex_docs + sem_docs}
+
+
+def assemble_response(
+    idx: CorpusIndex,
+    text: str,
+    lex_docs: List[Tuple[int, float]],
+    sem_docs: List[Tuple[int, float]],
+    alignments: Dict[int, Alignment],
+) -> CompareResponse:
+    # Montagem sem validação (model_construct): os tipos já são os do modelo
+    positions = doc_positions(idx, lex_docs, sem_docs)
+    pairs = {doc_id: sentence_pairs(alignment) for doc_id, alignment in alignments.items()}
+
+    def build_doc_groups(docs: List[Tuple[int, float]]) -> List[DocSentences]:
+        return [
+            DocSentences.model_construct(
+                doc_id=doc_id,
+                doc_title=idx.title(positions[doc_id]),
+                score=score,
+                sentences=pairs.get(doc_id, []),
+            )
+            for doc_id, score in docs
+        ]
+
+    items = [
+        CompareMethodResult.model_construct(method="lexical", docs=build_doc_groups(lex_docs)),
+        CompareMethodResult.model_construct(method="semantic", docs=build_doc_groups(sem_docs)),
+    ]
+
+    return CompareResponse.model_construct(query_len=len(text), corpus_size=idx.n_alive, items=items)
+
+
+def compact_response(response: CompareResponse, generation: int) -> dict:
+    """
+    format="compact": `response` without sentence texts. Each document carries its
+    sentence pairs as parallel offset/score arrays ("pairs"); the texts are slices
+    of the query and of GET /documents/{doc_id}/text, requested with the index
+    `generation` the offsets refer to.
+    """
+    out = {
+        "format": "compact",
+        "generation": generation,
+        "query_len": response.query_len,
+        "corpus_size": response.corpus_size,
+        "items": [
+            {
+                "method": item.method,
+                "docs": [
+                    {
+                        "doc_id": d.doc_id,
+                        "doc_title": d.doc_title,
+                        "score": d.score,
+                        "pairs": pair_columns(d.sentences),
+                    }
+                    for d in item.docs
+                ],
+            }
+            for item in response.items
+        ],
+    }
+    if response.profile is not None:
+        out["profile"] = response.profile
+    return out
+
+
+def pair_columns(pairs: List[SentencePair] | Alignment) -> Dict[str, list]:
+    if isinstance(pairs, Alignment):
+        return {c: getattr(pairs, c) for c in PAIR_COLUMNS}
+    return {c: [getattr(p, c) for p in pairs] for c in PAIR_COLUMNS}
+
+
+def render(response: CompareResponse, fmt: str, generation: int) -> FastJSONResponse:
+    # Serializa uma vez só: devolver um Response pula a revalidação do response_model
+    return FastJSONResponse(compact_response(response, generation) if fmt == "compact" else response)
+
+
+def build_fingerprint_result(
+    idx: CorpusIndex, text: str, hits: List[Tuple[int, float, list]], detail: bool = True
+) -> CompareMethodResult:
+    docs = []
+    for doc_id, score, spans in hits:
+        pos = idx.position(doc_id)
+        doc_text = idx.text(pos)
+        sentences = []
+        if detail:
+            # Valores já tipados (offsets e scores do índice): model_construct dispensa a validação
             sentences = [
-                SentencePair(
-                    doc_sentence=m["doc_sentence"],
-                    doc_start=m["doc_start"],
-                    doc_end=m["doc_end"],
-                    query_sentence=m["query_sentence"],
-                    query_start=m["query_start"],
-                    query_end=m["query_end"],
-                    score=m["score"],
+                SentencePair.model_construct(
+                    doc_sentence=doc_text[ds:de],
+                    doc_start=int(ds),
+                    doc_end=int(de),
+                    query_sentence=text[qs:qe],
+                    query_start=int(qs),
+                    query_end=int(qe),
+                    score=float(span_score),
                 )
-                for m in sent_align
+                for qs, qe, ds, de, span_score in spans
             ]
-            # ordenar sentenças por score desc
-            sentences.sort(key=lambda s: s.score, reverse=True)
-            groups.append(DocSentences(doc_id=doc_id, doc_title=title, sentences=sentences))
-        return groups
+        docs.append(DocSentences.model_construct(
+            doc_id=int(doc_id), doc_title=idx.title(pos), score=float(score), sentences=sentences
+        ))
+    return CompareMethodResult.model_construct(method="fingerprint", docs=docs)
+
+
+def report_response(data: dict) -> ReportResponse:
+    # Dicts de build_report com valores já tipados: model_construct em vez de validar tudo de novo
+    return ReportResponse.model_construct(
+        query_len=data["query_len"],
+        corpus_size=data["corpus_size"],
+        percent_matched=data["percent_matched"],
+        sentences=[ReportSentence.model_construct(**s) for s in data["sentences"]],
+        spans=[ReportSpan.model_construct(**s) for s in data["spans"]],
+        sources=[ReportSource.model_construct(**s) for s in data["sources"]],
+    )
+
+
+def compare_mode(mode: str | None, idx: CorpusIndex) -> str:
+    mode = mode or COMPARE_MODE
+    if mode not in COMPARE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode deve ser um de {', '.join(COMPARE_MODES)}")
+    if mode == "fast" and not has_fingerprints(idx):
+        raise HTTPException(status_code=400, detail="impressões desativadas (FINGERPRINT_KGRAM=0)")
+    return mode
+
+
+def fingerprint_response(idx: CorpusIndex, text: str, k: int, detail: bool, mode: str) -> CompareResponse | None:
+    """
+    Answer from the fingerprint stage alone: always in mode "fast"; in mode "auto"
+    only when a source covers at least FINGERPRINT_MIN of the query.
+    """
+    if mode == "full" or not has_fingerprints(idx):
+        return None
+    hits = searcher().topk_fingerprint(idx, text, k)
+    if mode == "auto" and (not hits or hits[0][1] < FINGERPRINT_MIN):
+        return None
+    items = [build_fingerprint_result(idx, text, hits, detail)]
+    return CompareResponse(query_len=len(text), corpus_size=idx.n_alive, items=items)
+
+
+def fingerprint_responses(
+    idx: CorpusIndex, texts: List[str], k: int, detail: bool, mode: str
+) -> List[CompareResponse | None]:
+    return [fingerprint_response(idx, text, k, detail, mode) for text in texts]
+
+
+async def run_fingerprint(
+    idx: CorpusIndex, texts: List[str], k: int, detail: bool, mode: str
+) -> List[CompareResponse | None]:
+    """`fingerprint_response` of each text, computed in the worker pool (nothing to do in mode "full")."""
+    if mode == "full" or not has_fingerprints(idx):
+        return [None] * len(texts)
+    return await pool.run(fingerprint_responses, idx, texts, k, detail, mode)
+
+
+@app.post("/compare", response_model=CompareResponse)
+async def compare(payload: CompareRequest, profile: bool = False) -> FastJSONResponse:
+    if payload.top_k > TOP_K_MAX:
+        raise HTTPException(status_code=400, detail=f"top_k máximo é {TOP_K_MAX}")
+    idx = await request_index()
+    if not profile:
+        return render(await run_compare(payload, idx), payload.format, idx.generation)
+    # Perfil: ignora o cache de respostas para que todos os estágios rodem
+    with profiling() as stages:
+        start = time.perf_counter()
+        response = await run_compare(payload, idx, use_cache=False)
+        stages["total"] = time.perf_counter() - start
+    return render(response.model_copy(update={"profile": stages}), payload.format, idx.generation)
+
+
+async def run_compare(payload: CompareRequest, idx: CorpusIndex, use_cache: bool = True) -> CompareResponse:
+    mode = compare_mode(payload.mode, idx)
+    k = min(payload.top_k, idx.n_alive)
+    key = response_key(idx, payload.text, k, payload.detail, mode)
+    cached = response_cache.get(key) if use_cache else MISSING
+    if cached is not MISSING:
+        return cached
+
+    # Índice por trechos: cada método informa o trecho que casou; o léxico tem prioridade
+    lex_spans: Dict[int, Tuple[int, int]] = {}
+    sem_spans: Dict[int, Tuple[int, int]] = {}
+    search = searcher()
+    async with pool.slot():
+        # Impressões primeiro: se bastarem, a busca léxica/semântica nem roda
+        response = (await run_fingerprint(idx, [payload.text], k, payload.detail, mode))[0]
+        if response is None:
+            lex_docs, sem_docs = await asyncio.gather(
+                pool.run(search.topk_lexical, idx, payload.text, k, lex_spans),
+                pool.run(search.topk_semantic, idx, payload.text, k, sem_spans),
+            )
+            response = await pool.run(
+                build_response, idx, payload.text, lex_docs, sem_docs, payload.detail, {**sem_spans, **lex_spans}
+            )
+    response_cache.put(key, response)
+    return response
+
+
+def ndjson(event: str, data: BaseModel | dict) -> bytes:
+    return b'{"event":"%s","data":%s}\n' % (event.encode("utf-8"), dumps(data))
+
+
+def whole_stream(response: CompareResponse, fmt: str, generation: int) -> StreamingResponse:
+    # Resposta já completa (cache ou impressões): vai inteira na linha "ranking"
+    if fmt == "compact":
+        response = compact_response(response, generation)
+    return StreamingResponse(iter([ndjson("ranking", response), ndjson("done", {"docs": 0})]), media_type=NDJSON)
+
+
+@app.post("/compare/stream")
+async def compare_stream(payload: CompareRequest, request: Request) -> StreamingResponse:
+    """
+    NDJSON variant of /compare for long texts. The first line ("ranking") holds
+    the ranked documents of every method, without sentences; then one "doc" line
+    per document with its sentence alignment, in completion order; "done" last.
+    Cached and fingerprint answers are complete in the "ranking" line. With
+    format="compact", lines carry offset/score arrays as in /compare.
+    """
+    if payload.top_k > TOP_K_MAX:
+        raise HTTPException(status_code=400, detail=f"top_k máximo é {TOP_K_MAX}")
+
+    idx = await request_index()
+    mode = compare_mode(payload.mode, idx)
+    k = min(payload.top_k, idx.n_alive)
+    key = response_key(idx, payload.text, k, payload.detail, mode)
+    response = response_cache.get(key)
+    if response is not MISSING:
+        return whole_stream(response, payload.format, idx.generation)
+
+    # A vaga no pool vale até o fim do stream (liberada pelo gerador ou, se ele nem começar, pela task)
+    release = pool.acquire()
+    try:
+        response = (await run_fingerprint(idx, [payload.text], k, payload.detail, mode))[0]
+        if response is not None:
+            response_cache.put(key, response)
+            release()
+            return whole_stream(response, payload.format, idx.generation)
+        search = searcher()
+        lex_spans: Dict[int, Tuple[int, int]] = {}
+        sem_spans: Dict[int, Tuple[int, int]] = {}
+        lex_docs, sem_docs = await asyncio.gather(
+            pool.run(search.topk_lexical, idx, payload.text, k, lex_spans),
+            pool.run(search.topk_semantic, idx, payload.text, k, sem_spans),
+        )
+    except BaseException:
+        release()
+        raise
+    stream = stream_alignments(
+        request, idx, payload.text, lex_docs, sem_docs, payload.detail, {**sem_spans, **lex_spans}, key, release,
+        payload.format,
+    )
+    return StreamingResponse(stream, media_type=NDJSON, background=BackgroundTask(release))
+
+
+async def stream_alignments(
+    request: Request,
+    idx: CorpusIndex,
+    text: str,
+    lex_docs: List[Tuple[int, float]],
+    sem_docs: List[Tuple[int, float]],
+    detail: bool,
+    spans: Dict[int, Tuple[int, int]],
+    key: tuple,
+    release,
+    fmt: str = "full",
+):
+    try:
+        ranking = assemble_response(idx, text, lex_docs, sem_docs, {})
+        yield ndjson("ranking", compact_response(ranking, idx.generation) if fmt == "compact" else ranking)
+        alignments: Dict[int, Alignment] = {}
+        if detail:
+            async def align(doc_id: int, pos: int):
+                return doc_id, await pool.run(align_doc, idx, text, pos, spans.get(doc_id))
+
+            # No máximo STREAM_ALIGN_MAX alinhamentos no pool por vez: um stream não ocupa todas as threads
+            todo = iter(doc_positions(idx, lex_docs, sem_docs).items())
+            running: set = set()
+
+            def launch() -> None:
+                for doc_id, pos in todo:
+                    running.add(asyncio.ensure_future(align(doc_id, pos)))
+                    if len(running) >= max(1, STREAM_ALIGN_MAX):
+                        break
+
+            try:
+                launch()
+                while running:
+                    done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    running -= done
+                    for task in done:
+                        doc_id, alignment = task.result()
+                        alignments[doc_id] = alignment
+                        if fmt == "compact":
+                            yield ndjson("doc", {"doc_id": doc_id, "pairs": pair_columns(alignment)})
+                        else:
+                            doc = DocAlignment.model_construct(doc_id=doc_id, sentences=sentence_pairs(alignment))
+                            yield ndjson("doc", doc)
+                    if await request.is_disconnected():
+                        return
+                    launch()
+            finally:
+                # Desconexão ou erro: cancela os alinhamentos em andamento; os demais nem foram enviados
+                for task in running:
+                    task.cancel()
+        # Stream completo: a resposta montada serve ao /compare normal também
+        response_cache.put(key, assemble_response(idx, text, lex_docs, sem_docs, alignments))
+        yield ndjson("done", {"docs": len(alignments)})
+    finally:
+        release()
+
+
+@app.post("/compare/batch", response_model=CompareBatchResponse)
+async def compare_batch(payload: CompareBatchRequest) -> FastJSONResponse:
+    if payload.top_k > TOP_K_MAX:
+        raise HTTPException(status_code=400, detail=f"top_k máximo é {TOP_K_MAX}")
+    if len(payload.texts) > BATCH_SIZE_MAX:
+        raise HTTPException(status_code=400, detail=f"máximo de {BATCH_SIZE_MAX} textos por lote")
+
+    idx = await request_index()
+    mode = compare_mode(payload.mode, idx)
+    k = min(payload.top_k, idx.n_alive)
+    keys = [response_key(idx, text, k, payload.detail, mode) for text in payload.texts]
+    results = [response_cache.get(key) for key in keys]
+    todo = [i for i, r in enumerate(results) if r is MISSING]
+
+    if todo:
+        search = searcher()
+        async with pool.slot():
+            quick = await run_fingerprint(idx, [payload.texts[i] for i in todo], k, payload.detail, mode)
+            for i, response in zip(todo, quick):
+                if response is not None:
+                    response_cache.put(keys[i], response)
+                    results[i] = response
+            todo = [i for i in todo if results[i] is MISSING]
+            texts = [payload.texts[i] for i in todo]
+            lex_spans: List[Dict[int, Tuple[int, int]]] = [{} for _ in texts]
+            sem_spans: List[Dict[int, Tuple[int, int]]] = [{} for _ in texts]
+            lex_batch, sem_batch = await asyncio.gather(
+                pool.run(search.topk_lexical_batch, idx, texts, k, lex_spans),
+                pool.run(search.topk_semantic_batch, idx, texts, k, sem_spans),
+            )
+            fresh = await asyncio.gather(*(
+                pool.run(build_response, idx, text, lex_docs, sem_docs, payload.detail, {**sem, **lex})
+                for text, lex_docs, sem_docs, lex, sem in zip(texts, lex_batch, sem_batch, lex_spans, sem_spans)
+            ))
+        for i, response in zip(todo, fresh):
+            response_cache.put(keys[i], response)
+            results[i] = response
+    if payload.format == "compact":
+        results = [compact_response(r, idx.generation) for r in results]
+        return FastJSONResponse({"format": "compact", "generation": idx.generation, "results": results})
+    return FastJSONResponse(CompareBatchResponse.model_construct(results=results))
+
+
+@app.post("/report", response_model=ReportResponse)
+async def report(payload: ReportRequest) -> FastJSONResponse:
+    n_sents = len(split_sentences(payload.text))
+    if n_sents > REPORT_MAX_SENTS:
+        raise HTTPException(status_code=400, detail=f"máximo de {REPORT_MAX_SENTS} sentenças por texto")
+
+    idx = await request_index()
+    min_lexical = REPORT_MIN_LEXICAL if payload.min_lexical is None else payload.min_lexical
+    min_semantic = REPORT_MIN_SEMANTIC if payload.min_semantic is None else payload.min_semantic
+    key = response_key(idx, payload.text, 0, True, f"report:{min_lexical}:{min_semantic}")
+    cached = response_cache.get(key)
+    if cached is not MISSING:
+        return FastJSONResponse(cached)
+    async with pool.slot():
+        data = await pool.run(build_report, idx, payload.text, min_lexical, min_semantic, search=_shards)
+    response = report_response(data)
+    response_cache.put(key, response)
+    return FastJSONResponse(response)
+
+
+@app.get("/documents/{doc_id}/text", response_model=DocumentText)
+async def document_text(
+    doc_id: int, start: int = 0, end: int | None = None, generation: int | None = None
+) -> DocumentText:
+    """
+    Characters [start, end) of a corpus document: the sentence texts of
+    format="compact". With `generation` (the one of the compact response), the
+    offsets are only served by that same index; after an update the answer is
+    409 and the comparison has to be repeated.
+    """
+    idx = await request_index()
+    if generation is not None and generation != idx.generation:
+        raise HTTPException(
+            status_code=409, detail=f"índice mudou (geração {idx.generation}, pedida {generation}); refaça a consulta"
+        )
+    try:
+        text = idx.text(idx.position(doc_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"documento {doc_id} não encontrado")
+    end = len(text) if end is None else min(end, len(text))
+    if not 0 <= start <= end:
+        raise HTTPException(status_code=400, detail="intervalo inválido: 0 <= start <= end")
+    return DocumentText(
+        doc_id=doc_id, start=start, end=end, length=len(text), text=text[start:end], generation=idx.generation
+    )
+
+
+def check_admin(token: str | None) -> None:
+    # Sem ADMIN_TOKEN configurado as rotas de administração ficam desligadas
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="administração desabilitada (defina ADMIN_TOKEN)")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="token de administração inválido")
+
+
+def _publish(index: CorpusIndex) -> None:
+    # Troca de referência única: leitores em andamento seguem com o índice anterior, inteiro
+    global _index
+    _index = index
+    response_cache.clear()
+
+
+def _add_documents(payload: DocumentsAddRequest) -> DocumentsUpdateResponse:
+    with _write_lock:
+        idx = get_index()
+        docs = payload.documents
+        ids, titles, texts = [d.id for d in docs], [d.title for d in docs], [d.text for d in docs]
+        passage_mode = _shards.passage_mode if _shards is not None else None
+        embeddings, passages = match.embed_documents(idx, texts, passage_mode)
+        new = idx.add_documents(ids, titles, texts, embeddings, passages=passages)
+        if INDEX_DIR:
+            # Registrado antes de publicar: o que foi respondido sobrevive a um restart
+            append_update(INDEX_DIR, idx.version, {
+                "op": "add", "ids": ids, "titles": titles, "texts": texts, "embed": embeddings,
+                "passage_embed": passages.embed_matrix if passages is not None else None,
+            })
+        if _shards is not None:
+            _shards.add_documents(ids, texts, embeddings, passages)
+        _publish(new)
+        return DocumentsUpdateResponse(changed=len(docs), corpus_size=new.n_alive, generation=new.generation)
+
+
+def _remove_documents(payload: DocumentsRemoveRequest) -> DocumentsUpdateResponse:
+    with _write_lock:
+        idx = get_index()
+        new, removed = idx.remove_documents(payload.ids)
+        if removed:
+            if INDEX_DIR:
+                append_update(INDEX_DIR, idx.version, {"op": "remove", "ids": list(payload.ids)})
+            if _shards is not None:
+                _shards.remove_documents(payload.ids)
+            _publish(new)
+        return DocumentsUpdateResponse(changed=removed, corpus_size=new.n_alive, generation=new.generation)
+
+
+@app.post("/admin/documents", response_model=DocumentsUpdateResponse)
+async def admin_add_documents(
+    payload: DocumentsAddRequest, x_admin_token: str | None = Header(None)
+) -> DocumentsUpdateResponse:
+    check_admin(x_admin_token)
+    return await asyncio.to_thread(_add_documents, payload)
+
+
+@app.post("/admin/documents/delete", response_model=DocumentsUpdateResponse)
+async def admin_remove_documents(
+    payload: DocumentsRemoveRequest, x_admin_token: str | None = Header(None)
+) -> DocumentsUpdateResponse:
+    check_admin(x_admin_token)
+    return await asyncio.to_thread(_remove_documents, payload)
 
-    items = [
-        CompareMethodResult(method="lexical", docs=build_doc_groups([d for d, _ in lex_docs])),
-        CompareMethodResult(method="semantic", docs=build_doc_groups([d for d, _ in sem_docs])),
-    ]
 
-    return CompareResponse(query_len=len(payload.text), corpus_size=len(idx.ids), items=items)
+@app.post("/admin/compact", response_model=DocumentsUpdateResponse)
+async def admin_compact(x_admin_token: str | None = Header(None)) -> DocumentsUpdateResponse:
+    check_admin(x_admin_token)
+    before = await request_index()
+    idx = await asyncio.to_thread(compact_now)
+    return DocumentsUpdateResponse(changed=before.n_dead, corpus_size=idx.n_alive, generation=idx.generation)
 
 
 if __name__ == "__main__":
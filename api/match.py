@@ -1,34 +1,180 @@
 from __future__ import annotations
 
+import heapq
 import logging
-from typing import List, Tuple
+import threading
+from itertools import chain
+from operator import itemgetter
+from typing import TYPE_CHECKING, Dict, List, Tuple
 
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from models.corpus import CorpusIndex
-from utils.config import LEXICAL_CHAR_WEIGHT
-from utils.encoder import SemanticEncoder
-from sklearn.feature_extraction.text import TfidfVectorizer
+from scipy import sparse
+from ann import build_ann
+from fingerprint import FingerprintIndex, Span
+from inverted import PostingIndex, search_postings
+from models.corpus import CorpusIndex, PassageTable, SentenceTable
+from passages import build_passage_table, pool_embeddings, pool_passages
+from quant import QuantizedMatrix, dot, rerank
+from split import build_sentence_table
+from utils.config import (
+    ANN_BACKEND,
+    ANN_MIN_DOCS,
+    ANN_NLIST,
+    ANN_NPROBE,
+    CACHE_TTL,
+    EMBED_QUANT,
+    ENCODER_BATCH_MAX,
+    ENCODER_BATCH_MS,
+    EMBED_RERANK,
+    FINGERPRINT_KGRAM,
+    INDEX_MODE,
+    LEXICAL_CHAR_WEIGHT,
+    LEXICAL_ENGINE,
+    PASSAGE_FANOUT,
+    PASSAGE_POOLING,
+    QUERY_CACHE_SIZE,
+    TFIDF_CHAR_PARAMS,
+    TFIDF_WORD_PARAMS,
+)
+from utils.cache import MISSING, LRUCache, text_key
+from utils.encoder import MicroBatcher, SemanticEncoder
+from utils.metrics import timed, timer
+from utils.topk import topk_indices
+
+if TYPE_CHECKING:
+    from sklearn.feature_extraction.text import TfidfVectorizer
 
 logger = logging.getLogger(__name__)
 
-encoder = SemanticEncoder()
+# Encoder e o micro-batcher das consultas à frente dele, sempre trocados juntos (ver encoding)
+_encoding: Tuple[SemanticEncoder, MicroBatcher] | None = None
+_encoding_lock = threading.Lock()
+
+
+def use_encoder(
+    encoder, wait_ms: float = ENCODER_BATCH_MS, max_batch: int = ENCODER_BATCH_MAX
+) -> Tuple[SemanticEncoder, MicroBatcher]:
+    """Encode documents and queries with `encoder` (e.g. a stub in tests and benchmarks)."""
+    global _encoding
+    # Consultas simultâneas do /compare viram uma só passada do modelo
+    _encoding = (encoder, MicroBatcher(encoder.encode, wait_ms, max_batch))
+    return _encoding
+
+
+def encoding() -> Tuple[SemanticEncoder, MicroBatcher]:
+    """(encoder, query micro-batcher), created together on first use."""
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                use_encoder(SemanticEncoder())
+    return _encoding
+
 
+def get_encoder() -> SemanticEncoder:
+    return encoding()[0]
+
+# Embeddings de consultas (dependem só do texto e do modelo, não do índice)
+query_cache = LRUCache(QUERY_CACHE_SIZE, CACHE_TTL)
+
+
+def encode_queries(queries: List[str]) -> np.ndarray:
+    """Encode queries, running the model once for all cache misses."""
+    keys = [text_key(q) for q in queries]
+    vecs = [query_cache.get(key) for key in keys]
+    missing = [i for i, v in enumerate(vecs) if v is MISSING]
+    if missing:
+        with timed("encode"):
+            fresh = encoding()[1].encode([queries[i] for i in missing])
+        for i, vec in zip(missing, fresh):
+            query_cache.put(keys[i], vec)
+            vecs[i] = vec
+    return np.vstack(vecs)
+
+
+@timer("build_index")
+def build_index(
+    ids: List[int],
+    titles: List[str | None],
+    texts: List[str],
+    embed_matrix: np.ndarray | None = None,
+    mode: str = INDEX_MODE,
+    passage_embed: np.ndarray | None = None,
+) -> CorpusIndex:
+    """
+    Fit the vectorizers over `texts` and build the index. mode="passage" also
+    indexes overlapping passages of each document; their embeddings replace the
+    whole-document ones, which become the pooled passage vectors.
+    """
+    if mode not in ("document", "passage"):
+        raise ValueError(f"Unknown index mode: {mode}")
+    from sklearn.feature_extraction.text import TfidfVectorizer
 
-def build_index(ids: List[int], titles: List[str | None], texts: List[str]) -> CorpusIndex:
     # Word-level TF-IDF (inclui unigrams e bigrams, mantém termos raros min_df=1, sublinear_tf)
-    tfidf_word = TfidfVectorizer(ngram_range=(1, 2), min_df=1, max_features=60000, sublinear_tf=True)
+    tfidf_word = TfidfVectorizer(**TFIDF_WORD_PARAMS)
     tfidf_word_matrix = tfidf_word.fit_transform(texts)
 
     # Char n-grams (wb para respeitar fronteiras; 3-5 captura radicais e variações pequenas)
     tfidf_char = None
     tfidf_char_matrix = None
     if LEXICAL_CHAR_WEIGHT > 0:
-        tfidf_char = TfidfVectorizer(analyzer='char_wb', ngram_range=(3,5), min_df=1, max_features=60000, sublinear_tf=True)
+        tfidf_char = TfidfVectorizer(**TFIDF_CHAR_PARAMS)
         tfidf_char_matrix = tfidf_char.fit_transform(texts)
 
-    # Embeddings
-    embed_matrix = encoder.encode(texts)
+    # Tabela de sentenças do corpus (alinhamento sem re-segmentar a cada consulta)
+    sentences = build_sentence_table(texts, tfidf_word)
+
+    # Embeddings (reaproveitados quando já calculados, p.ex. na compactação)
+    passages = None
+    if mode == "passage":
+        passages = build_passage_table(
+            texts, tfidf_word, tfidf_char, get_encoder().encode, embed_matrix=passage_embed, sentences=sentences
+        )
+        if embed_matrix is None:
+            embed_matrix = pool_embeddings(passages)
+    elif embed_matrix is None:
+        embed_matrix = get_encoder().encode(texts)
+
+    return assemble_index(
+        ids, titles, texts,
+        tfidf_word, tfidf_word_matrix,
+        tfidf_char, tfidf_char_matrix,
+        embed_matrix, sentences, passages,
+    )
+
+
+def assemble_index(
+    ids: List[int],
+    titles: List[str | None],
+    texts: List[str],
+    tfidf_word: TfidfVectorizer,
+    tfidf_word_matrix,
+    tfidf_char: TfidfVectorizer | None,
+    tfidf_char_matrix,
+    embed_matrix: np.ndarray,
+    sentences: SentenceTable | None,
+    passages: PassageTable | None = None,
+    fingerprints: FingerprintIndex | None = None,
+) -> CorpusIndex:
+    """
+    Build the search structures (posting lists, ANN) over already vectorized
+    documents, or over their passages when `passages` is given. Fingerprints
+    are computed here unless precomputed ones are given.
+    """
+    if fingerprints is None and FINGERPRINT_KGRAM > 0:
+        fingerprints = FingerprintIndex.build(texts)
+    if sentences is not None and sentences.postings is None:
+        # Busca de sentenças do /report: montada aqui, nunca durante uma requisição
+        sentences.postings = PostingIndex.from_matrix(sentences.matrix)
+    word_postings = char_postings = ann = embed_codes = None
+    if passages is not None:
+        (passages.word_postings, passages.char_postings,
+         passages.ann, passages.embed_codes) = _search_structures(
+            passages.word_matrix, passages.char_matrix, passages.embed_matrix
+        )
+    else:
+        word_postings, char_postings, ann, embed_codes = _search_structures(
+            tfidf_word_matrix, tfidf_char_matrix, embed_matrix
+        )
 
     return CorpusIndex(
         ids=ids,
@@ -39,32 +185,563 @@ def build_index(ids: List[int], titles: List[str | None], texts: List[str]) -> C
         tfidf_char_vectorizer=tfidf_char,
         tfidf_char_matrix=tfidf_char_matrix,
         embed_matrix=embed_matrix,
+        ann=ann,
+        word_postings=word_postings,
+        char_postings=char_postings,
+        sentences=sentences,
+        passages=passages,
+        fingerprints=fingerprints,
+        embed_codes=embed_codes,
     )
 
 
+def _search_structures(word_matrix, char_matrix, embed_matrix) -> tuple:
+    # Listas invertidas (forma CSC) para a busca léxica
+    word_postings = None
+    char_postings = None
+    if LEXICAL_ENGINE == "inverted":
+        word_postings = PostingIndex.from_matrix(word_matrix)
+        if char_matrix is not None:
+            char_postings = PostingIndex.from_matrix(char_matrix)
+
+    # Cópia quantizada: a busca (e o ANN) usa os códigos; os float32 só no re-rank
+    codes = None
+    if EMBED_QUANT != "none":
+        codes = QuantizedMatrix.from_vectors(embed_matrix, EMBED_QUANT)
+
+    ann = None
+    if len(embed_matrix) >= ANN_MIN_DOCS:
+        ann = build_ann(codes if codes is not None else embed_matrix, ANN_BACKEND, ANN_NLIST, ANN_NPROBE)
+    return word_postings, char_postings, ann, codes
+
+
+def embed_documents(
+    index: CorpusIndex, texts: List[str], passage_mode: bool | None = None
+) -> Tuple[np.ndarray, PassageTable | None]:
+    """
+    Document embeddings of `texts` and, on passage indexes, their passage table.
+    `passage_mode` overrides the mode read from `index` (the API process of a
+    sharded index keeps no passages, see shards.coordinator_view).
+    """
+    if passage_mode is None:
+        passage_mode = index.passages is not None
+    if passage_mode:
+        passages = build_passage_table(
+            texts, index.tfidf_word_vectorizer, index.tfidf_char_vectorizer, get_encoder().encode
+        )
+        dim = index.embed_matrix.shape[1] if index.embed_matrix is not None else None
+        return pool_embeddings(passages, dim), passages
+    return (get_encoder().encode(texts) if texts else np.zeros((0, 0))), None
+
+
+def add_documents(
+    index: CorpusIndex,
+    ids: List[int],
+    titles: List[str | None],
+    texts: List[str],
+    embeddings: np.ndarray | None = None,
+    passage_embed: np.ndarray | None = None,
+) -> CorpusIndex:
+    """
+    New index with the documents added (see CorpusIndex.add_documents). Given
+    `embeddings` (and `passage_embed` on passage indexes, e.g. replayed from the
+    update log) the model is not run.
+    """
+    passages = None
+    if embeddings is None:
+        embeddings, passages = embed_documents(index, texts)
+    elif index.passages is not None:
+        passages = build_passage_table(
+            texts, index.tfidf_word_vectorizer, index.tfidf_char_vectorizer, embed_matrix=passage_embed
+        )
+    return index.add_documents(ids, titles, texts, embeddings, passages=passages)
+
+
+def apply_updates(index: CorpusIndex, entries: List[dict]) -> CorpusIndex:
+    """Replay update log entries (see store.append_update) over a freshly loaded index."""
+    for entry in entries:
+        if entry["op"] == "add":
+            index = add_documents(
+                index, entry["ids"], entry["titles"], entry["texts"], entry["embed"], entry.get("passage_embed")
+            )
+        else:
+            index = index.remove_documents(entry["ids"])[0]
+    return index
+
+
+def _live_rows(index: CorpusIndex, pos: np.ndarray) -> dict:
+    """
+    Data of global positions `pos` (ascending) gathered across the segments:
+    ids, titles, texts, TF-IDF rows, embeddings, passages, sentences and
+    fingerprints (renumbered from 0).
+    """
+    parts = []
+    for start, seg in index.segments():
+        rows = pos[(pos >= start) & (pos < start + len(seg.ids))] - start
+        if len(rows) or not parts:
+            parts.append((seg, rows))
+    char = None
+    if index.tfidf_char_matrix is not None:
+        char = sparse.vstack([seg.tfidf_char_matrix[rows] for seg, rows in parts], format="csr")
+    passages = None
+    if index.passages is not None:
+        passages = PassageTable.concat([seg.passages.select(rows) for seg, rows in parts])
+    sentences = None
+    if index.sentences is not None:
+        sentences = SentenceTable.concat([seg.sentences.select(rows) for seg, rows in parts])
+    fingerprints = None
+    if index.fingerprints is not None:
+        offsets = np.cumsum([0] + [len(rows) for _, rows in parts[:-1]])
+        fingerprints = FingerprintIndex.concat(
+            seg.fingerprints.select(rows, int(off)) for (seg, rows), off in zip(parts, offsets)
+        )
+    return dict(
+        ids=[seg.ids[i] for seg, rows in parts for i in rows],
+        titles=[seg.titles[i] for seg, rows in parts for i in rows],
+        texts=[seg.texts[i] for seg, rows in parts for i in rows],
+        word=sparse.vstack([seg.tfidf_word_matrix[rows] for seg, rows in parts], format="csr"),
+        char=char,
+        embed=np.vstack([np.asarray(seg.embed_matrix[rows], dtype=np.float32) for seg, rows in parts]),
+        passages=passages,
+        sentences=sentences,
+        fingerprints=fingerprints,
+    )
+
+
+def _live_positions(index: CorpusIndex) -> np.ndarray:
+    return np.flatnonzero(np.concatenate([seg.alive for _, seg in index.segments()]))
+
+
+def compact_index(index: CorpusIndex) -> CorpusIndex:
+    """
+    Rebuild `index` from its live documents: drops tombstones, merges the delta,
+    refits the TF-IDF vocabulary/IDF over the current corpus and retrains the
+    ANN lists. Embeddings are reused, so the model is not run again.
+    """
+    live = _live_positions(index)
+    logger.info("Compacting corpus index: %d live docs, %d removed", len(live), index.n_dead)
+    rows = _live_rows(index, live)
+    passage_embed = None
+    if rows["passages"] is not None:
+        passage_embed = rows["passages"].embed_matrix
+    compacted = build_index(
+        rows["ids"],
+        rows["titles"],
+        rows["texts"],
+        embed_matrix=rows["embed"],
+        mode="passage" if index.passages is not None else "document",
+        passage_embed=passage_embed,
+    )
+    compacted.version = index.version
+    compacted.generation = index.generation + 1
+    return compacted
+
+
+def shard_index(index: CorpusIndex, n: int) -> List[CorpusIndex]:
+    """
+    Split the live documents of `index` (delta included) into `n` search-only
+    shards. Shards keep the global vectorizers and their rows of the global
+    matrices, sentences and fingerprints, so IDF and scores match the whole
+    index; postings, ANN and quantized codes are rebuilt per shard. Texts and
+    titles stay with the caller (see shards.coordinator_view).
+    """
+    shards = []
+    live = _live_positions(index)
+    for pos in np.array_split(live, max(1, min(n, len(live)))):
+        rows = _live_rows(index, pos)
+        passages = rows["passages"]
+        if passages is not None:
+            (passages.word_postings, passages.char_postings,
+             passages.ann, passages.embed_codes) = _search_structures(
+                passages.word_matrix, passages.char_matrix, passages.embed_matrix
+            )
+            word_postings = char_postings = ann = embed_codes = None
+        else:
+            word_postings, char_postings, ann, embed_codes = _search_structures(
+                rows["word"], rows["char"], rows["embed"]
+            )
+        sentences = rows["sentences"]
+        if sentences is not None:
+            sentences.postings = PostingIndex.from_matrix(sentences.matrix)
+        shards.append(CorpusIndex(
+            ids=rows["ids"],
+            titles=[None] * len(pos),
+            texts=[""] * len(pos),
+            tfidf_word_vectorizer=index.tfidf_word_vectorizer,
+            tfidf_word_matrix=rows["word"],
+            tfidf_char_vectorizer=index.tfidf_char_vectorizer,
+            tfidf_char_matrix=rows["char"],
+            embed_matrix=rows["embed"],
+            ann=ann,
+            word_postings=word_postings,
+            char_postings=char_postings,
+            sentences=sentences,
+            passages=passages,
+            fingerprints=rows["fingerprints"],
+            embed_codes=embed_codes,
+        ))
+    return shards
+
+
+def merge_hits(
+    results: List[Tuple[List[List[Tuple]], List[dict]]], k: int, spans: List[dict] | None
+) -> List[List[Tuple]]:
+    """
+    Global top-k per query from the (hits, spans) of disjoint parts of the corpus
+    (index segments or shards); each hit is (doc_id, score, ...).
+    """
+    merged = []
+    for q in range(len(results[0][0])):
+        hits = heapq.nlargest(k, chain.from_iterable(r[0][q] for r in results), key=itemgetter(1))
+        if spans is not None:
+            for _, part_spans in results:
+                spans[q].update((d, part_spans[q][d]) for d, *_ in hits if d in part_spans[q])
+        merged.append(hits)
+    return merged
+
+
+def _per_segment(index: CorpusIndex, search, n: int, k: int, spans: List[dict] | None) -> list:
+    # Cada segmento (base e delta) é buscado à parte; os top-k são mesclados por score
+    if index.delta is None:
+        return search(index, spans)
+    results = []
+    for _, seg in index.segments():
+        seg_spans = [{} for _ in range(n)] if spans is not None else None
+        results.append((search(seg, seg_spans), seg_spans))
+    return merge_hits(results, k, spans)
+
+
+@timer("fingerprint")
+def topk_fingerprint(index: CorpusIndex, query: str, k: int = 5) -> List[Tuple[int, float, List[Span]]]:
+    """
+    Documents that share winnowed fingerprints with `query`: (doc_id, share of
+    the query found in the document, copied spans with character offsets).
+    Empty when the index has no fingerprints.
+    """
+    if index.fingerprints is None:
+        return []
+
+    def search(seg: CorpusIndex, _) -> List[list]:
+        hits = seg.fingerprints.search(query, k, seg.alive if seg.n_dead else None)
+        return [[(int(seg.ids[pos]), score, spans) for pos, score, spans in hits]]
+
+    return _per_segment(index, search, 1, k, None)[0]
+
+
+def _cosine(q, matrix) -> np.ndarray:
+    # Linhas TF-IDF têm norma L2 unitária: o produto interno já é o cosseno
+    return (q @ matrix.T).toarray().ravel()
+
+
+def _char_weight() -> float:
+    return max(0.0, min(1.0, LEXICAL_CHAR_WEIGHT))
+
+
 def _combine_lexical_scores(word_scores: np.ndarray, char_scores: np.ndarray | None) -> np.ndarray:
     if char_scores is None or LEXICAL_CHAR_WEIGHT <= 0:
         return word_scores
-    w = max(0.0, min(1.0, LEXICAL_CHAR_WEIGHT))
+    w = _char_weight()
     return (1 - w) * word_scores + w * char_scores
 
 
-def topk_lexical(index: CorpusIndex, query: str, k: int = 5) -> List[Tuple[int, float]]:
+def _lexical_spaces(word_postings: PostingIndex, char_postings: PostingIndex | None, q_word, q_char) -> list:
+    # Vetores TF-IDF já têm norma L2 unitária: produto interno == cosseno
+    w = _char_weight() if q_char is not None and LEXICAL_CHAR_WEIGHT > 0 else 0.0
+    spaces = [(word_postings, q_word, 1 - w)]
+    if q_char is not None:
+        spaces.append((char_postings, q_char, w))
+    return spaces
+
+
+def _topk_lexical_postings(index: CorpusIndex, q_word, q_char, k: int) -> List[Tuple[int, float]]:
+    spaces = _lexical_spaces(index.word_postings, index.char_postings, q_word, q_char)
+    cand, scores = search_postings(spaces, k, index.alive if index.n_dead else None)
+    sims = _combine_lexical_scores(scores[0], scores[1] if q_char is not None else None)
+    return _sparse_hits(index, cand, sims, k)
+
+
+def _sparse_hits(index: CorpusIndex, pos: np.ndarray, scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+    # Top-k sobre (posição, score) esparsos; posições ausentes valem 0
+    if index.n_dead:
+        keep = index.alive[pos]
+        pos, scores = pos[keep], scores[keep]
+    order = topk_indices(scores, k)
+    return _pad_hits(index, [(int(index.ids[pos[i]]), float(scores[i])) for i in order], k)
+
+
+def _pad_hits(index: CorpusIndex, hits: List[Tuple[int, float]], k: int) -> List[Tuple[int, float]]:
+    if len(hits) < k:
+        # Completa com documentos sem termos em comum (score 0), como na busca densa
+        taken = np.asarray([index.position(doc_id) for doc_id, _ in hits], dtype=np.int64)
+        fill = np.setdiff1d(np.flatnonzero(index.alive)[: k + len(taken)], taken)
+        hits = hits + [(int(index.ids[i]), 0.0) for i in fill[: k - len(hits)]]
+    return hits
+
+
+def _dense_hits(index: CorpusIndex, sims: np.ndarray, k: int) -> List[Tuple[int, float]]:
+    if index.n_dead:
+        sims = np.where(index.alive, sims, -np.inf)
+    top_idx = topk_indices(sims, min(k, index.n_alive))
+    return [(int(index.ids[i]), float(sims[i])) for i in top_idx]
+
+
+def _semantic_rows(
+    vectors,
+    exact: np.ndarray,
+    ann,
+    q_vec: np.ndarray,
+    m: int,
+    alive: np.ndarray | None,
+    n_rows: int,
+    sims: np.ndarray | None = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Best `m` live rows for `q_vec` as (rows, scores). `vectors` (the quantized
+    copy, if any) is scored through the ANN or by brute force; with a quantized
+    copy the best m * EMBED_RERANK rows are re-scored with the `exact` vectors.
+    `sims` holds brute-force scores already computed for this query.
+    """
+    quantized = isinstance(vectors, QuantizedMatrix) and EMBED_RERANK > 1
+    fetch = m * EMBED_RERANK if quantized else m
+    n_dead = 0 if alive is None else n_rows - int(alive.sum())
+    if ann is not None:
+        rows, scores = ann.search(q_vec, fetch + n_dead)
+        if alive is not None:
+            keep = alive[rows]
+            rows, scores = rows[keep], scores[keep]
+        rows, scores = rows[:fetch], scores[:fetch]
+    else:
+        # Embeddings já normalizados: produto interno == cosseno
+        if sims is None:
+            sims = dot(vectors, q_vec)
+        if alive is not None:
+            sims = np.where(alive, sims, -np.inf)
+        rows = topk_indices(sims, min(fetch, n_rows - n_dead))
+        scores = sims[rows]
+    if quantized:
+        rows, scores = rerank(exact, rows, q_vec, m)
+    return rows, scores
+
+
+def _semantic_hits(
+    index: CorpusIndex, q_vec: np.ndarray, k: int, sims: np.ndarray | None = None
+) -> List[Tuple[int, float]]:
+    alive = index.alive
+    vectors = index.embed_codes if index.embed_codes is not None else index.embed_matrix
+    rows, scores = _semantic_rows(
+        vectors, index.embed_matrix, index.ann, q_vec, min(k, index.n_alive),
+        alive if index.n_dead else None, len(alive), sims,
+    )
+    return [(int(index.ids[r]), float(sc)) for r, sc in zip(rows, scores)]
+
+
+def _pooled_hits(
+    index: CorpusIndex,
+    table: PassageTable,
+    search,
+    k: int,
+    spans: Dict[int, Tuple[int, int]] | None,
+) -> List[Tuple[int, float]]:
+    """
+    Top-k documents from passage hits. `search(m)` returns the m best live
+    passages (rows, scores), best first; m starts at PASSAGE_FANOUT * k and
+    doubles until k distinct documents show up, so max pooling ranks documents
+    exactly by their best passage. `spans` receives the best passage of each hit.
+    """
+    if k <= 0:
+        return []
+    n = len(table.doc)
+    m = min(n, PASSAGE_FANOUT * k)
+    while True:
+        rows, scores = search(m)
+        pos, doc_scores, best = pool_passages(table.doc, rows, scores, k, PASSAGE_POOLING)
+        if len(pos) >= k or len(rows) < m or m >= n:
+            break
+        m = min(n, 2 * m)
+    hits = [(int(index.ids[p]), float(sc)) for p, sc in zip(pos, doc_scores)]
+    if spans is not None:
+        for (doc_id, _), row in zip(hits, best):
+            spans[doc_id] = (int(table.starts[row]), int(table.ends[row]))
+    return hits
+
+
+def _passage_alive(index: CorpusIndex, table: PassageTable) -> np.ndarray | None:
+    return index.alive[table.doc] if index.n_dead else None
+
+
+def _dense_search(sims: np.ndarray, alive: np.ndarray | None, positive: bool = False):
+    if alive is not None:
+        sims = np.where(alive, sims, -np.inf)
+    n_valid = int(np.count_nonzero(sims > 0 if positive else np.isfinite(sims)))
+
+    def search(m: int):
+        rows = topk_indices(sims, min(m, n_valid))
+        return rows, sims[rows]
+
+    return search
+
+
+def _lexical_passage_hits(
+    index: CorpusIndex, q_word, q_char, k: int, spans: Dict[int, Tuple[int, int]] | None
+) -> List[Tuple[int, float]]:
+    table = index.passages
+    alive = _passage_alive(index, table)
+    if table.word_postings is not None and (q_char is None or table.char_postings is not None):
+        spaces = _lexical_spaces(table.word_postings, table.char_postings, q_word, q_char)
+
+        def search(m: int):
+            cand, scores = search_postings(spaces, m, alive)
+            sims = _combine_lexical_scores(scores[0], scores[1] if q_char is not None else None)
+            order = topk_indices(sims, m)
+            return cand[order], sims[order]
+    else:
+        sims = _cosine(q_word, table.word_matrix)
+        if q_char is not None:
+            sims = _combine_lexical_scores(sims, _cosine(q_char, table.char_matrix))
+        search = _dense_search(sims, alive, positive=True)
+    return _pad_hits(index, _pooled_hits(index, table, search, k, spans), k)
+
+
+def _semantic_passage_hits(
+    index: CorpusIndex, q_vec: np.ndarray, k: int, spans: Dict[int, Tuple[int, int]] | None
+) -> List[Tuple[int, float]]:
+    table = index.passages
+    alive = _passage_alive(index, table)
+    vectors = table.embed_codes if table.embed_codes is not None else table.embed_matrix
+    # Sem ANN, os scores de todos os trechos são calculados uma vez só
+    sims = dot(vectors, q_vec) if table.ann is None else None
+
+    def search(m: int):
+        return _semantic_rows(vectors, table.embed_matrix, table.ann, q_vec, m, alive, len(table.doc), sims)
+
+    return _pooled_hits(index, table, search, k, spans)
+
+
+def vectorize_queries(index: CorpusIndex, queries: List[str]) -> tuple:
+    """(word, char) TF-IDF rows of `queries`; char is None without char n-grams."""
     # Word scores
-    q_word = index.tfidf_word_vectorizer.transform([query])
-    word_sims = cosine_similarity(q_word, index.tfidf_word_matrix).ravel()
+    with timed("word_tfidf"):
+        q_word = index.tfidf_word_vectorizer.transform(queries)
     # Char scores (optional)
-    char_sims = None
-    if index.tfidf_char_vectorizer is not None and index.tfidf_char_matrix is not None:
-        q_char = index.tfidf_char_vectorizer.transform([query])
-        char_sims = cosine_similarity(q_char, index.tfidf_char_matrix).ravel()
-    sims = _combine_lexical_scores(word_sims, char_sims)
-    top_idx = np.argsort(-sims)[:k]
-    return [(int(index.ids[i]), float(sims[i])) for i in top_idx]
+    with timed("char_tfidf"):
+        q_char = None
+        if index.tfidf_char_vectorizer is not None:
+            q_char = index.tfidf_char_vectorizer.transform(queries)
+    return q_word, q_char
+
+
+@timer("lexical")
+def topk_lexical(
+    index: CorpusIndex, query: str, k: int = 5, spans: Dict[int, Tuple[int, int]] | None = None
+) -> List[Tuple[int, float]]:
+    """
+    Top-k documents by TF-IDF cosine (word and char n-grams). On passage indexes,
+    `spans` (if given) is filled with doc_id -> (start, end) of the best passage.
+    """
+    q_word, q_char = vectorize_queries(index, [query])
+    return lexical_hits(index, q_word, q_char, k, [spans] if spans is not None else None)[0]
+
+
+@timer("semantic")
+def topk_semantic(
+    index: CorpusIndex, query: str, k: int = 5, spans: Dict[int, Tuple[int, int]] | None = None
+) -> List[Tuple[int, float]]:
+    """Top-k documents by embedding cosine; `spans` as in `topk_lexical`."""
+    q_vecs = encode_queries([query])
+    return semantic_hits(index, q_vecs, k, [spans] if spans is not None else None)[0]
+
+
+@timer("lexical")
+def topk_lexical_batch(
+    index: CorpusIndex,
+    queries: List[str],
+    k: int = 5,
+    spans: List[Dict[int, Tuple[int, int]]] | None = None,
+) -> List[List[Tuple[int, float]]]:
+    """Same as `topk_lexical` for many queries, with one sparse product per space."""
+    if not queries:
+        return []
+    q_word, q_char = vectorize_queries(index, queries)
+    return lexical_hits(index, q_word, q_char, k, spans)
+
+
+@timer("semantic")
+def topk_semantic_batch(
+    index: CorpusIndex,
+    queries: List[str],
+    k: int = 5,
+    spans: List[Dict[int, Tuple[int, int]]] | None = None,
+) -> List[List[Tuple[int, float]]]:
+    """Same as `topk_semantic` for many queries, encoded in a single forward pass."""
+    if not queries:
+        return []
+    return semantic_hits(index, encode_queries(queries), k, spans)
+
+
+def lexical_hits(
+    index: CorpusIndex,
+    q_word,
+    q_char,
+    k: int,
+    spans: List[Dict[int, Tuple[int, int]]] | None = None,
+) -> List[List[Tuple[int, float]]]:
+    """
+    Top-k documents for each row of already vectorized queries (`q_char` is None
+    without char n-grams); `spans` holds one dict per row. Queries are vectorized
+    once by the caller, so shards of one corpus can share the work.
+    """
+    n = q_word.shape[0]
+    return _per_segment(index, lambda seg, sp: _segment_lexical_hits(seg, q_word, q_char, k, sp), n, k, spans)
+
+
+def _segment_lexical_hits(index: CorpusIndex, q_word, q_char, k: int, spans) -> List[List[Tuple[int, float]]]:
+    n = q_word.shape[0]
+    if index.passages is not None:
+        return [
+            _lexical_passage_hits(
+                index, q_word[i], q_char[i] if q_char is not None else None, k, spans[i] if spans else None
+            )
+            for i in range(n)
+        ]
+    if n == 1:
+        if index.word_postings is not None and (q_char is None or index.char_postings is not None):
+            return [_topk_lexical_postings(index, q_word, q_char, k)]
+        word_sims = _cosine(q_word, index.tfidf_word_matrix)
+        char_sims = None
+        if q_char is not None:
+            char_sims = _cosine(q_char, index.tfidf_char_matrix)
+        return [_dense_hits(index, _combine_lexical_scores(word_sims, char_sims), k)]
+    # Vetores TF-IDF têm norma L2 unitária: Q @ M.T já é a matriz de cossenos
+    sims = q_word @ index.tfidf_word_matrix.T
+    if q_char is not None:
+        sims = _combine_lexical_scores(sims, q_char @ index.tfidf_char_matrix.T)
+    sims = sparse.csr_matrix(sims)
+    results = []
+    for row in range(sims.shape[0]):
+        start, end = sims.indptr[row], sims.indptr[row + 1]
+        results.append(_sparse_hits(index, sims.indices[start:end], sims.data[start:end], k))
+    return results
+
+
+def semantic_hits(
+    index: CorpusIndex,
+    q_vecs: np.ndarray,
+    k: int,
+    spans: List[Dict[int, Tuple[int, int]]] | None = None,
+) -> List[List[Tuple[int, float]]]:
+    """Top-k documents for each row of already encoded queries; `spans` as in `lexical_hits`."""
+    return _per_segment(index, lambda seg, sp: _segment_semantic_hits(seg, q_vecs, k, sp), len(q_vecs), k, spans)
 
 
-def topk_semantic(index: CorpusIndex, query: str, k: int = 5) -> List[Tuple[int, float]]:
-    q_vec = encoder.encode([query])[0].reshape(1, -1)
-    sims = cosine_similarity(q_vec, index.embed_matrix).ravel()
-    top_idx = np.argsort(-sims)[:k]
-    return [(int(index.ids[i]), float(sims[i])) for i in top_idx]
\ No newline at end of file
+def _segment_semantic_hits(index: CorpusIndex, q_vecs: np.ndarray, k: int, spans) -> List[List[Tuple[int, float]]]:
+    if index.passages is not None:
+        return [
+            _semantic_passage_hits(index, q_vec, k, spans[i] if spans else None)
+            for i, q_vec in enumerate(q_vecs)
+        ]
+    if index.ann is not None or len(q_vecs) == 1:
+        return [_semantic_hits(index, q_vec, k) for q_vec in q_vecs]
+    # Embeddings normalizados: (N x d) @ (d x m) dá os cossenos de todas as consultas
+    vectors = index.embed_codes if index.embed_codes is not None else index.embed_matrix
+    sims = dot(vectors, q_vecs.T)
+    return [_semantic_hits(index, q_vec, k, sims[:, col]) for col, q_vec in enumerate(q_vecs)]
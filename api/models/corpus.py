@@ -1,9 +1,121 @@
 from __future__ import annotations
+import copy
 import numpy as np
 
-from typing                          import List
+from typing                          import TYPE_CHECKING, Iterable, List, Tuple
 from dataclasses                     import dataclass
-from sklearn.feature_extraction.text import TfidfVectorizer
+from scipy                           import sparse
+
+if TYPE_CHECKING:
+    from ann import VectorIndex
+    from fingerprint import FingerprintIndex
+    from quant import QuantizedMatrix
+    from inverted import PostingIndex
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+
+@dataclass
+class SentenceTable:
+    # Sentenças de todo o corpus; as do documento i são as linhas doc_ptr[i]:doc_ptr[i+1]
+    starts: np.ndarray
+    ends: np.ndarray
+    doc_ptr: np.ndarray
+    matrix: np.ndarray | None  # TF-IDF (palavras) de cada sentença, CSR; None = só os offsets
+    postings: PostingIndex | None = None  # listas invertidas da busca de sentenças (report.py), montadas com o índice
+
+    def doc_range(self, pos: int) -> tuple[int, int]:
+        return int(self.doc_ptr[pos]), int(self.doc_ptr[pos + 1])
+
+    def append(self, other: SentenceTable) -> SentenceTable:
+        return SentenceTable.concat([self, other])
+
+    def offsets_only(self) -> SentenceTable:
+        """This table without the sentence vectors and postings."""
+        return SentenceTable(starts=self.starts, ends=self.ends, doc_ptr=self.doc_ptr, matrix=None)
+
+    def select(self, docs: np.ndarray) -> SentenceTable:
+        """Sentences of the documents at positions `docs`, in that order (postings are not carried over)."""
+        rows, doc_ptr = _doc_rows(self.doc_ptr, docs)
+        return SentenceTable(
+            starts=np.asarray(self.starts[rows]),
+            ends=np.asarray(self.ends[rows]),
+            doc_ptr=doc_ptr,
+            matrix=self.matrix[rows] if self.matrix is not None else None,
+        )
+
+    @staticmethod
+    def concat(tables: List[SentenceTable]) -> SentenceTable:
+        offsets = np.cumsum([0] + [t.doc_ptr[-1] for t in tables[:-1]])
+        matrix = None
+        if all(t.matrix is not None for t in tables):
+            matrix = sparse.vstack([t.matrix for t in tables], format="csr")
+        return SentenceTable(
+            starts=np.concatenate([t.starts for t in tables]),
+            ends=np.concatenate([t.ends for t in tables]),
+            doc_ptr=np.concatenate(
+                [tables[0].doc_ptr[:1]] + [off + t.doc_ptr[1:] for off, t in zip(offsets, tables)]
+            ).astype(np.int64),
+            matrix=matrix,
+        )
+
+
+def _doc_rows(doc_ptr: np.ndarray, docs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Linhas de cada documento (início do doc + deslocamento dentro dele) e o novo doc_ptr
+    counts = doc_ptr[docs + 1] - doc_ptr[docs]
+    rows = np.repeat(doc_ptr[docs], counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return rows, np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+
+@dataclass
+class PassageTable:
+    # Trechos sobrepostos (janelas de sentenças); os do documento i são as linhas doc_ptr[i]:doc_ptr[i+1]
+    starts: np.ndarray
+    ends: np.ndarray
+    doc_ptr: np.ndarray
+    word_matrix: np.ndarray  # TF-IDF de cada trecho, CSR
+    char_matrix: np.ndarray | None
+    embed_matrix: np.ndarray
+    word_postings: PostingIndex | None = None
+    char_postings: PostingIndex | None = None
+    ann: VectorIndex | None = None
+    embed_codes: QuantizedMatrix | None = None
+
+    def __post_init__(self):
+        # Documento de cada trecho
+        self.doc = np.repeat(np.arange(len(self.doc_ptr) - 1), np.diff(self.doc_ptr))
+
+    def doc_range(self, pos: int) -> tuple[int, int]:
+        return int(self.doc_ptr[pos]), int(self.doc_ptr[pos + 1])
+
+    def select(self, docs: np.ndarray) -> PassageTable:
+        """Passages of the documents at positions `docs`, in that order (postings, ANN and codes are not carried over)."""
+        rows, doc_ptr = _doc_rows(self.doc_ptr, docs)
+        return PassageTable(
+            starts=np.asarray(self.starts[rows]),
+            ends=np.asarray(self.ends[rows]),
+            doc_ptr=doc_ptr,
+            word_matrix=self.word_matrix[rows],
+            char_matrix=self.char_matrix[rows] if self.char_matrix is not None else None,
+            embed_matrix=np.asarray(self.embed_matrix[rows]),
+        )
+
+    @staticmethod
+    def concat(tables: List[PassageTable]) -> PassageTable:
+        """Stack the passages of consecutive document ranges (postings, ANN and codes are not carried over)."""
+        offsets = np.cumsum([0] + [t.doc_ptr[-1] for t in tables[:-1]])
+        char = None
+        if tables[0].char_matrix is not None:
+            char = sparse.vstack([t.char_matrix for t in tables], format="csr")
+        return PassageTable(
+            starts=np.concatenate([t.starts for t in tables]),
+            ends=np.concatenate([t.ends for t in tables]),
+            doc_ptr=np.concatenate(
+                [tables[0].doc_ptr[:1]] + [off + t.doc_ptr[1:] for off, t in zip(offsets, tables)]
+            ).astype(np.int64),
+            word_matrix=sparse.vstack([t.word_matrix for t in tables], format="csr"),
+            char_matrix=char,
+            embed_matrix=np.vstack([np.asarray(t.embed_matrix, dtype=np.float32) for t in tables]),
+        )
 
 
 @dataclass
@@ -12,7 +124,300 @@ class CorpusIndex:
     titles: List[str | None]
     texts: List[str]
     tfidf_word_vectorizer: TfidfVectorizer
-    tfidf_word_matrix: np.ndarray
+    # Matrizes e embeddings são None no processo da API com shards (ver shards.coordinator_view)
+    tfidf_word_matrix: np.ndarray | None
     tfidf_char_vectorizer: TfidfVectorizer | None
     tfidf_char_matrix: np.ndarray | None
-    embed_matrix: np.ndarray
\ No newline at end of file
+    embed_matrix: np.ndarray | None  # float32 exatos; com EMBED_QUANT, só lidos no re-rank
+    version: str = ""  # identificador do snapshot em disco (ver store.index_version)
+    ann: VectorIndex | None = None  # None = busca semântica exata
+    word_postings: PostingIndex | None = None  # None = busca léxica densa
+    char_postings: PostingIndex | None = None
+    sentences: SentenceTable | None = None  # None = segmenta os documentos a cada consulta
+    alive: np.ndarray | None = None  # False = removido (tombstone) até a próxima compactação
+    generation: int = 0  # incrementa a cada alteração do corpus (invalida caches)
+    passages: PassageTable | None = None  # None = busca por documento inteiro (INDEX_MODE=document)
+    fingerprints: FingerprintIndex | None = None  # None = sem o caminho rápido de impressões
+    embed_codes: QuantizedMatrix | None = None  # cópia float16/int8 usada na busca semântica
+    # Documentos incluídos desde o último build: segmento pequeno, com postings próprias e busca exata
+    delta: CorpusIndex | None = None
+
+    def __post_init__(self):
+        if self.alive is None:
+            self.alive = np.ones(len(self.ids), dtype=bool)
+        self._build_id_map()
+        self._set_base()
+
+    def _build_id_map(self) -> None:
+        # ids ordenados + permutação: busca binária em vez de list.index
+        live = np.flatnonzero(self.alive)
+        ids = np.asarray(self.ids, dtype=np.int64)[live]
+        order = np.argsort(ids, kind="stable")
+        self._id_order = live[order]
+        self._id_sorted = ids[order]
+        self._n_dead = len(self.ids) - len(live)
+
+    def _set_base(self) -> None:
+        # Visão só das linhas base (sem o delta), buscada como um segmento independente
+        self._base = self
+        if self.delta is not None:
+            self._base = copy.copy(self)
+            self._base.delta = None
+            self._base._base = self._base
+
+    def _replace(self, **changes) -> CorpusIndex:
+        """
+        Copy of this index with `changes` applied; arrays not changed are shared.
+        A new `alive` may only add tombstones, so the id map is filtered, not rebuilt.
+        """
+        new = copy.copy(self)
+        for name, value in changes.items():
+            setattr(new, name, value)
+        if "alive" in changes:
+            keep = new.alive[new._id_order]
+            new._id_order, new._id_sorted = new._id_order[keep], new._id_sorted[keep]
+            new._n_dead = len(new.ids) - len(new._id_order)
+        new._set_base()
+        return new
+
+    @property
+    def n_dead(self) -> int:
+        return self._n_dead + (self.delta.n_dead if self.delta is not None else 0)
+
+    @property
+    def n_alive(self) -> int:
+        return len(self.ids) - self._n_dead + (self.delta.n_alive if self.delta is not None else 0)
+
+    @property
+    def n_rows(self) -> int:
+        """Rows of all segments; global positions go from 0 to n_rows - 1."""
+        return len(self.ids) + (len(self.delta.ids) if self.delta is not None else 0)
+
+    def segments(self) -> List[Tuple[int, CorpusIndex]]:
+        """
+        (first global position, segment) pairs: the base rows and, after
+        inclusions, the delta. Each segment is a self-contained index (its own
+        rows, tombstones and search structures) and is searched on its own.
+        """
+        if self.delta is None:
+            return [(0, self)]
+        return [(0, self._base), (len(self.ids), self.delta)]
+
+    def segment(self, pos: int) -> Tuple[CorpusIndex, int]:
+        """Segment holding global position `pos` and the row inside it."""
+        if self.delta is not None and pos >= len(self.ids):
+            return self.delta, pos - len(self.ids)
+        return self._base, pos
+
+    def text(self, pos: int) -> str:
+        seg, row = self.segment(pos)
+        return seg.texts[row]
+
+    def title(self, pos: int) -> str | None:
+        seg, row = self.segment(pos)
+        return seg.titles[row]
+
+    def memory_usage(self) -> dict:
+        """
+        Bytes held by each component, as {(component, "resident" | "mapped"): bytes};
+        "mapped" arrays are memory-mapped from the snapshot and paged in on demand.
+        """
+        p = self.passages
+        parts = {
+            "word_tfidf": [self.tfidf_word_matrix],
+            "char_tfidf": [self.tfidf_char_matrix],
+            "embeddings": [self.embed_matrix],
+            "embed_codes": [self.embed_codes],
+            "postings": [self.word_postings, self.char_postings],
+            # Os vetores do ANN são os próprios embeddings/códigos: só centróides e listas
+            "ann": [getattr(self.ann, "centroids", None), getattr(self.ann, "list_ids", None)],
+            "sentences": [self.sentences],
+            "fingerprints": [self.fingerprints],
+            "texts": [self.texts],
+        }
+        if p is not None:
+            parts["passages"] = [
+                p.starts, p.ends, p.doc_ptr, p.word_matrix, p.char_matrix, p.embed_matrix,
+                p.embed_codes, p.word_postings, p.char_postings,
+                getattr(p.ann, "centroids", None), getattr(p.ann, "list_ids", None),
+            ]
+        usage: dict = {}
+        for name, objs in parts.items():
+            for obj in objs:
+                for arr in _arrays(obj):
+                    key = (name, "mapped" if _is_mapped(arr) else "resident")
+                    usage[key] = usage.get(key, 0) + int(arr.nbytes)
+        if self.delta is not None:
+            for key, size in self.delta.memory_usage().items():
+                usage[key] = usage.get(key, 0) + size
+        return usage
+
+    def position(self, doc_id: int) -> int:
+        """Global position of live `doc_id` (see `segments`); raises KeyError for unknown ids."""
+        if self.delta is not None:
+            try:
+                return len(self.ids) + self.delta.position(doc_id)
+            except KeyError:
+                pass
+        i = int(np.searchsorted(self._id_sorted, doc_id))
+        if i == len(self._id_sorted) or self._id_sorted[i] != doc_id:
+            raise KeyError(doc_id)
+        return int(self._id_order[i])
+
+    def add_documents(
+        self,
+        ids: List[int],
+        titles: List[str | None],
+        texts: List[str],
+        embeddings: np.ndarray,
+        passages: PassageTable | None = None,
+    ) -> CorpusIndex:
+        """
+        New index with the documents appended to the delta segment; this one is
+        left untouched, so readers keep a consistent snapshot until the caller
+        swaps the reference. TF-IDF uses the frozen vocabulary and IDF (terms
+        unseen at build time are ignored until the next compaction). Ids already
+        present are replaced. Only the delta is rebuilt (its postings included),
+        so the cost follows the documents added since the last compaction, not
+        the corpus size. Passage indexes also need the `passages` of the new
+        documents.
+        """
+        if not (len(ids) == len(titles) == len(texts) == len(embeddings)):
+            raise ValueError("ids, titles, texts and embeddings must have the same length")
+        if not ids:
+            return self
+        if self.passages is not None and passages is None:
+            raise ValueError("passage index requires the passages of the new documents")
+        ids = [int(i) for i in ids]
+        new = self.remove_documents(ids)[0]
+        delta = _build_delta(new, ids, list(titles), list(texts), embeddings, passages)
+        return new._replace(delta=delta, generation=self.generation + 1)
+
+    def remove_documents(self, ids: Iterable[int]) -> Tuple[CorpusIndex, int]:
+        """New index with `ids` tombstoned (in any segment) and how many were removed."""
+        ids = [int(i) for i in ids]
+        delta, removed = self.delta, 0
+        if delta is not None:
+            delta, removed = delta.remove_documents(ids)
+        alive = self.alive.copy()
+        for doc_id in ids:
+            i = int(np.searchsorted(self._id_sorted, doc_id))
+            if i < len(self._id_sorted) and self._id_sorted[i] == doc_id:
+                alive[self._id_order[i]] = False
+                removed += 1
+        if not removed:
+            return self, 0
+        return self._replace(alive=alive, delta=delta, generation=self.generation + 1), removed
+
+    def needs_compaction(self, dead_ratio: float, delta_ratio: float) -> bool:
+        n = max(self.n_rows, 1)
+        n_delta = len(self.delta.ids) if self.delta is not None else 0
+        return self.n_dead / n > dead_ratio or n_delta / n > delta_ratio
+
+
+def _build_delta(
+    index: CorpusIndex,
+    ids: List[int],
+    titles: List[str | None],
+    texts: List[str],
+    embeddings: np.ndarray,
+    passages: PassageTable | None,
+) -> CorpusIndex:
+    """
+    Delta segment of `index` with the new documents appended: the rows of the
+    current delta (if any) plus the new ones, vectorized with the frozen base
+    vectorizers. Each component (matrices, postings, quantized codes, sentences,
+    fingerprints) is built only when the base has it; semantic search over the
+    delta is exact (no ANN).
+    """
+    from inverted import PostingIndex
+    from fingerprint import FingerprintIndex
+    from quant import QuantizedMatrix
+    from split import build_sentence_table
+
+    old = index.delta
+    # Só os componentes que a base tem (o processo da API com shards não guarda matrizes)
+    word = char = embed = sentences = fingerprints = None
+    if index.tfidf_word_matrix is not None:
+        word = index.tfidf_word_vectorizer.transform(texts)
+    if index.tfidf_char_matrix is not None:
+        char = index.tfidf_char_vectorizer.transform(texts)
+    if index.embed_matrix is not None:
+        embed = np.asarray(embeddings, dtype=np.float32)
+    if index.sentences is not None:
+        sentences = build_sentence_table(texts, index.tfidf_word_vectorizer)
+        if index.sentences.matrix is None:
+            sentences = sentences.offsets_only()
+    if index.fingerprints is not None:
+        fingerprints = old.fingerprints.extend(texts, len(old.ids)) if old is not None else FingerprintIndex.build(texts)
+    if index.passages is None:
+        passages = None
+    alive = np.ones(len(ids), dtype=bool)
+    if old is not None:
+        if word is not None:
+            word = sparse.vstack([old.tfidf_word_matrix, word], format="csr")
+        if char is not None:
+            char = sparse.vstack([old.tfidf_char_matrix, char], format="csr")
+        if embed is not None:
+            embed = np.vstack([np.asarray(old.embed_matrix, dtype=np.float32), embed])
+        if sentences is not None:
+            sentences = old.sentences.append(sentences)
+        if passages is not None:
+            passages = PassageTable.concat([old.passages, passages])
+        alive = np.concatenate([old.alive, alive])
+        ids, titles, texts = old.ids + ids, old.titles + titles, old.texts + texts
+
+    def postings(base: PostingIndex | None, matrix) -> PostingIndex | None:
+        return PostingIndex.from_matrix(matrix) if base is not None and matrix is not None else None
+
+    def codes(base: QuantizedMatrix | None, vectors: np.ndarray) -> QuantizedMatrix | None:
+        return QuantizedMatrix.from_vectors(vectors, base.kind) if base is not None else None
+
+    if sentences is not None:
+        sentences.postings = postings(index.sentences.postings, sentences.matrix)
+    if passages is not None:
+        passages.word_postings = postings(index.passages.word_postings, passages.word_matrix)
+        passages.char_postings = postings(index.passages.char_postings, passages.char_matrix)
+        passages.embed_codes = codes(index.passages.embed_codes, passages.embed_matrix)
+    return CorpusIndex(
+        ids=ids,
+        titles=titles,
+        texts=texts,
+        tfidf_word_vectorizer=index.tfidf_word_vectorizer,
+        tfidf_word_matrix=word,
+        tfidf_char_vectorizer=index.tfidf_char_vectorizer,
+        tfidf_char_matrix=char,
+        embed_matrix=embed,
+        version=index.version,
+        word_postings=postings(index.word_postings, word),
+        char_postings=postings(index.char_postings, char),
+        sentences=sentences,
+        alive=alive,
+        passages=passages,
+        fingerprints=fingerprints,
+        embed_codes=codes(index.embed_codes, embed),
+    )
+
+
+def _arrays(obj) -> List[np.ndarray]:
+    # Arrays NumPy de uma matriz esparsa ou, um nível abaixo, de uma tabela/índice auxiliar
+    if obj is None:
+        return []
+    if isinstance(obj, np.ndarray):
+        return [obj]
+    if sparse.issparse(obj):
+        return [obj.data, obj.indices, obj.indptr]
+    return [
+        arr for value in getattr(obj, "__dict__", {}).values()
+        if isinstance(value, np.ndarray) or sparse.issparse(value)
+        for arr in _arrays(value)
+    ]
+
+
+def _is_mapped(arr: np.ndarray) -> bool:
+    # np.load(mmap_mode="r") devolve memmap; fatias dele guardam o memmap em .base
+    while arr is not None:
+        if isinstance(arr, np.memmap):
+            return True
+        arr = getattr(arr, "base", None)
+    return False
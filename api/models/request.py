@@ -1,9 +1,40 @@
 from __future__ import annotations
 
 from pydantic   import BaseModel
+from typing     import List, Literal, Optional
 
 
 class CompareRequest(BaseModel):
     text: str
     top_k: int = 5
-    detail: bool = True  # se False, retorna estrutura sem matches
\ No newline at end of file
+    detail: bool = True  # se False, retorna estrutura sem matches
+    mode: Optional[str] = None  # full | fast | auto (padrão: COMPARE_MODE)
+    format: Literal["full", "compact"] = "full"  # compact: só offsets e scores, sem o texto das sentenças
+
+
+class CompareBatchRequest(BaseModel):
+    texts: List[str]
+    top_k: int = 5
+    detail: bool = True
+    mode: Optional[str] = None
+    format: Literal["full", "compact"] = "full"
+
+
+class ReportRequest(BaseModel):
+    text: str
+    min_lexical: Optional[float] = None  # padrão: REPORT_MIN_LEXICAL
+    min_semantic: Optional[float] = None  # padrão: REPORT_MIN_SEMANTIC
+
+
+class DocumentIn(BaseModel):
+    id: int
+    title: Optional[str] = None
+    text: str
+
+
+class DocumentsAddRequest(BaseModel):
+    documents: List[DocumentIn]
+
+
+class DocumentsRemoveRequest(BaseModel):
+    ids: List[int]
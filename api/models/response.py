@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from pydantic   import BaseModel, Field
-from typing     import List, Optional
+from typing     import Dict, List, Optional
 
 
 class SentencePair(BaseModel):
@@ -17,6 +17,12 @@ class SentencePair(BaseModel):
 class DocSentences(BaseModel):
     doc_id: int = Field(..., description="ID do documento")
     doc_title: Optional[str] = Field(None, description="Título do documento")
+    score: Optional[float] = Field(None, description="Score do documento no método")
+    sentences: List[SentencePair]
+
+
+class DocAlignment(BaseModel):
+    doc_id: int = Field(..., description="ID do documento")
     sentences: List[SentencePair]
 
 
@@ -28,4 +34,64 @@ class CompareMethodResult(BaseModel):
 class CompareResponse(BaseModel):
     query_len: int
     corpus_size: int
-    items: List[CompareMethodResult]
\ No newline at end of file
+    items: List[CompareMethodResult]
+    profile: Optional[Dict[str, float]] = Field(None, description="Segundos por estágio (só com ?profile=1)")
+
+
+class CompareBatchResponse(BaseModel):
+    results: List[CompareResponse]
+
+
+class DocumentText(BaseModel):
+    doc_id: int
+    start: int
+    end: int
+    length: int = Field(..., description="Tamanho do documento inteiro")
+    text: str
+    generation: int = Field(..., description="Geração do índice que respondeu")
+
+
+class ReportSentence(BaseModel):
+    query_sentence: str
+    query_start: int
+    query_end: int
+    doc_id: Optional[int] = Field(None, description="Fonte da sentença (None = sem correspondência)")
+    doc_title: Optional[str] = None
+    doc_sentence: Optional[str] = None
+    doc_start: Optional[int] = None
+    doc_end: Optional[int] = None
+    score: Optional[float] = None
+    method: Optional[str] = Field(None, description="lexical | semantic")
+
+
+class ReportSpan(BaseModel):
+    doc_id: int
+    query_start: int
+    query_end: int
+    doc_start: int
+    doc_end: int
+    sentences: int = Field(..., description="Sentenças da consulta agrupadas no trecho")
+    score: float = Field(..., description="Score médio das sentenças do trecho")
+
+
+class ReportSource(BaseModel):
+    doc_id: int
+    doc_title: Optional[str] = None
+    sentences: int
+    matched_chars: int
+    percent_matched: float
+
+
+class ReportResponse(BaseModel):
+    query_len: int
+    corpus_size: int
+    percent_matched: float = Field(..., description="% dos caracteres das sentenças com alguma fonte")
+    sentences: List[ReportSentence]
+    spans: List[ReportSpan]
+    sources: List[ReportSource]
+
+
+class DocumentsUpdateResponse(BaseModel):
+    changed: int = Field(..., description="Documentos adicionados ou removidos")
+    corpus_size: int
+    generation: int
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING, Callable, List, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from models.corpus import PassageTable, SentenceTable
+from split import sentence_offsets
+from utils.config import PASSAGE_OVERLAP, PASSAGE_SENTENCES
+from utils.topk import topk_indices
+
+if TYPE_CHECKING:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+logger = logging.getLogger(__name__)
+
+
+def passage_offsets(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    doc_ptr: np.ndarray,
+    size: int = PASSAGE_SENTENCES,
+    overlap: int = PASSAGE_OVERLAP,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Windows of `size` consecutive sentences, `overlap` of them shared with the
+    previous window, over the sentences (starts, ends, doc_ptr) of each document.
+    Returns the (starts, ends, doc_ptr) of the passages; a document shorter than
+    `size` sentences is a single passage and one without sentences has none.
+    """
+    size = max(1, size)
+    stride = max(1, size - max(0, overlap))
+    p_starts: List[int] = []
+    p_ends: List[int] = []
+    p_ptr = np.zeros(len(doc_ptr), dtype=np.int64)
+    for pos in range(len(doc_ptr) - 1):
+        first, last = int(doc_ptr[pos]), int(doc_ptr[pos + 1])
+        count = 0
+        for s in range(first, last, stride):
+            e = min(s + size, last)
+            p_starts.append(int(starts[s]))
+            p_ends.append(int(ends[e - 1]))
+            count += 1
+            if e == last:
+                break
+        p_ptr[pos + 1] = p_ptr[pos] + count
+    return np.asarray(p_starts, dtype=np.int64), np.asarray(p_ends, dtype=np.int64), p_ptr
+
+
+def passage_texts(texts: List[str], starts: np.ndarray, ends: np.ndarray, doc_ptr: np.ndarray) -> List[str]:
+    out = []
+    for pos, text in enumerate(texts):
+        for row in range(doc_ptr[pos], doc_ptr[pos + 1]):
+            out.append(text[starts[row]:ends[row]])
+    return out
+
+
+def build_passage_table(
+    texts: List[str],
+    word: TfidfVectorizer,
+    char: TfidfVectorizer | None,
+    encode: Callable[[List[str]], np.ndarray] | None = None,
+    embed_matrix: np.ndarray | None = None,
+    sentences: SentenceTable | None = None,
+) -> PassageTable:
+    """
+    Split `texts` into overlapping passages and vectorize them in the TF-IDF and
+    embedding spaces. Embeddings come from `encode`, unless `embed_matrix` already
+    holds them (one row per passage, e.g. reused on compaction).
+    """
+    if sentences is not None:
+        offsets = (sentences.starts, sentences.ends, sentences.doc_ptr)
+    else:
+        offsets = sentence_offsets(texts)
+    starts, ends, doc_ptr = passage_offsets(*offsets)
+    chunks = passage_texts(texts, starts, ends, doc_ptr)
+    if embed_matrix is None:
+        embed_matrix = encode(chunks) if chunks else np.zeros((0, 0), dtype=np.float32)
+    return PassageTable(
+        starts=starts,
+        ends=ends,
+        doc_ptr=doc_ptr,
+        word_matrix=_transform(word, chunks),
+        char_matrix=_transform(char, chunks) if char is not None else None,
+        embed_matrix=np.asarray(embed_matrix, dtype=np.float32),
+    )
+
+
+def _transform(vectorizer: TfidfVectorizer, chunks: List[str]) -> sparse.csr_matrix:
+    if not chunks:
+        return sparse.csr_matrix((0, len(vectorizer.vocabulary_)))
+    return vectorizer.transform(chunks)
+
+
+def pool_embeddings(table: PassageTable, dim: int | None = None) -> np.ndarray:
+    """Document vectors as the normalized mean of their passage embeddings (zero without passages)."""
+    n_docs = len(table.doc_ptr) - 1
+    embed = np.asarray(table.embed_matrix, dtype=np.float32)
+    if len(embed) == 0:
+        return np.zeros((n_docs, dim or 0), dtype=np.float32)
+    membership = sparse.csr_matrix(
+        (np.ones(len(table.doc), dtype=np.float32), (table.doc, np.arange(len(table.doc)))),
+        shape=(n_docs, len(table.doc)),
+    )
+    pooled = np.asarray(membership @ embed, dtype=np.float32)
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return pooled / np.where(norms > 0, norms, 1.0)
+
+
+def pool_passages(
+    doc: np.ndarray, rows: np.ndarray, scores: np.ndarray, k: int, pooling: str = "max"
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Aggregate passage hits (`rows`, `scores`, best first) into the top-k documents.
+    pooling="max" scores a document by its best passage, "sum" by the sum of its
+    passages among the hits. Returns document positions, their scores and the
+    row of each document's best passage.
+    """
+    docs = doc[rows]
+    uniq, first, inverse = np.unique(docs, return_index=True, return_inverse=True)
+    if pooling == "max":
+        doc_scores = scores[first]
+    elif pooling == "sum":
+        doc_scores = np.bincount(inverse.ravel(), weights=scores, minlength=len(uniq))
+    else:
+        raise ValueError(f"Unknown passage pooling: {pooling}")
+    order = topk_indices(doc_scores, k)
+    return uniq[order], doc_scores[order], rows[first[order]]
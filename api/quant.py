@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from typing import Tuple
+
+import numpy as np
+
+from utils.topk import topk_indices
+
+# Linhas convertidas para float32 por vez: limita a memória temporária do produto
+_CHUNK = 16384
+
+
+class QuantizedMatrix:
+    """
+    Row-wise scalar-quantized copy of an embedding matrix, for scoring only.
+
+    kind="float16" keeps half-precision codes; kind="int8" keeps symmetric int8
+    codes with one float32 scale per row (row ~= codes * scale). The exact
+    vectors stay in `CorpusIndex.embed_matrix` (memory-mapped from the snapshot)
+    and are only read to re-rank the best candidates.
+    """
+
+    def __init__(self, codes: np.ndarray, scale: np.ndarray | None = None):
+        self.codes = codes
+        self.scale = scale
+        self.kind = "int8" if scale is not None else "float16"
+
+    @classmethod
+    def from_vectors(cls, vectors: np.ndarray, kind: str) -> "QuantizedMatrix":
+        if kind == "float16":
+            codes = np.empty(vectors.shape, dtype=np.float16)
+            for start in range(0, len(vectors), _CHUNK):
+                codes[start:start + _CHUNK] = vectors[start:start + _CHUNK]
+            return cls(codes)
+        if kind == "int8":
+            codes = np.empty(vectors.shape, dtype=np.int8)
+            scale = np.empty(len(vectors), dtype=np.float32)
+            for start in range(0, len(vectors), _CHUNK):
+                block = np.asarray(vectors[start:start + _CHUNK], dtype=np.float32)
+                s = np.abs(block).max(axis=1) / 127.0 if block.size else np.zeros(len(block), np.float32)
+                s[s == 0] = 1.0
+                codes[start:start + len(block)] = np.rint(block / s[:, None])
+                scale[start:start + len(block)] = s
+            return cls(codes, scale)
+        raise ValueError(f"Unknown embedding quantization: {kind}")
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.codes.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def __getitem__(self, rows) -> np.ndarray:
+        """Dequantized float32 rows (approximate vectors)."""
+        block = np.asarray(self.codes[rows], dtype=np.float32)
+        if self.scale is not None:
+            block *= np.asarray(self.scale[rows], dtype=np.float32)[..., None]
+        return block
+
+    def dot(self, query: np.ndarray) -> np.ndarray:
+        """codes @ query in float32, with the int8 scale applied per row after the product."""
+        scores = _chunked_dot(self.codes, query)
+        if self.scale is not None:
+            scores *= self.scale.reshape((-1,) + (1,) * (scores.ndim - 1))
+        return scores
+
+
+def _chunked_dot(vectors: np.ndarray, query: np.ndarray) -> np.ndarray:
+    # float16/int8 não têm BLAS no NumPy: converte blocos de linhas e usa o sgemm/sgemv
+    query = np.asarray(query, dtype=np.float32)
+    if vectors.dtype == np.float32:
+        return np.asarray(vectors @ query, dtype=np.float32)
+    out = np.empty((len(vectors),) + query.shape[1:], dtype=np.float32)
+    for start in range(0, len(vectors), _CHUNK):
+        out[start:start + _CHUNK] = np.asarray(vectors[start:start + _CHUNK], dtype=np.float32) @ query
+    return out
+
+
+def dot(vectors, query: np.ndarray) -> np.ndarray:
+    """
+    Inner products of every row of `vectors` (ndarray, memmap or QuantizedMatrix)
+    with `query` (d,) or (d, m), in float32. Embeddings are already L2-normalized,
+    so this is the cosine without re-normalizing either side.
+    """
+    if isinstance(vectors, QuantizedMatrix):
+        return vectors.dot(query)
+    return _chunked_dot(vectors, query)
+
+
+def rerank(exact: np.ndarray, rows: np.ndarray, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Re-score candidate `rows` with the exact vectors and keep the best `k`."""
+    if len(rows) == 0:
+        return rows, np.zeros(0, dtype=np.float32)
+    order = np.argsort(rows, kind="stable")  # leitura sequencial do memmap
+    scores = np.empty(len(rows), dtype=np.float32)
+    scores[order] = np.asarray(exact[rows[order]], dtype=np.float32) @ np.asarray(query, dtype=np.float32)
+    top = topk_indices(scores, k)
+    return rows[top], scores[top]
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from inverted import search_postings
+from match import topk_semantic_batch
+from models.corpus import CorpusIndex, SentenceTable
+from split import split_sentences
+from utils.config import REPORT_GAP, REPORT_MIN_LEXICAL, REPORT_MIN_SEMANTIC
+from utils.metrics import timer
+
+logger = logging.getLogger(__name__)
+
+
+# Melhor sentença do corpus para uma da consulta: (doc_id, nº da sentença no documento, início, fim, score)
+SentenceHit = Tuple[int, int, int, int, float]
+
+
+def _sentence_alive(index: CorpusIndex, table: SentenceTable) -> np.ndarray | None:
+    if not index.n_dead:
+        return None
+    n_docs = len(table.doc_ptr) - 1
+    return np.repeat(index.alive[:n_docs], np.diff(table.doc_ptr))
+
+
+def _hit(index: CorpusIndex, table: SentenceTable, row: int, score: float) -> SentenceHit:
+    pos = int(np.searchsorted(table.doc_ptr, row, side="right") - 1)
+    return int(index.ids[pos]), row - int(table.doc_ptr[pos]), int(table.starts[row]), int(table.ends[row]), score
+
+
+def sentence_hits(index: CorpusIndex, q_vecs) -> List[SentenceHit | None]:
+    """
+    Best live corpus sentence for each row of `q_vecs` (TF-IDF of the query
+    sentences), through the sentence posting lists built with the index. Scores
+    are accumulated only for sentences sharing terms with the query.
+    """
+    best: List[SentenceHit | None] = [None] * q_vecs.shape[0]
+    for _, seg in index.segments():
+        table = seg.sentences
+        alive = _sentence_alive(seg, table)
+        for row in range(q_vecs.shape[0]):
+            cand, scores = search_postings([(table.postings, q_vecs[row], 1.0)], 1, alive)
+            if len(cand):
+                i = int(np.argmax(scores[0]))
+                if best[row] is None or scores[0][i] > best[row][4]:
+                    best[row] = _hit(seg, table, int(cand[i]), float(scores[0][i]))
+    return best
+
+
+def best_sentences(
+    index: CorpusIndex, q_vecs, targets: List[Tuple[int, int, Tuple[int, int] | None]]
+) -> List[SentenceHit | None]:
+    """
+    For each (row of `q_vecs`, doc_id, matched passage or None): the sentence of
+    that document most similar to the query sentence, or None when the document
+    is not in `index`. Scores are the TF-IDF cosine of the sentence.
+    """
+    out: List[SentenceHit | None] = []
+    for row, doc_id, span in targets:
+        try:
+            seg, pos = index.segment(index.position(doc_id))
+        except KeyError:
+            out.append(None)
+            continue
+        table = seg.sentences
+        best, score = _best_sentence_in(table, q_vecs[row], pos, span)
+        out.append(_hit(seg, table, best, score))
+    return out
+
+
+@timer("report")
+def build_report(
+    index: CorpusIndex,
+    text: str,
+    min_lexical: float = REPORT_MIN_LEXICAL,
+    min_semantic: float = REPORT_MIN_SEMANTIC,
+    gap: int = REPORT_GAP,
+    search=None,
+) -> dict:
+    """
+    Coverage report of `text` against the whole corpus. The text is split and
+    vectorized once; each sentence is matched to its best corpus sentence through
+    the sentence TF-IDF index (lexical) and, when no sentence reaches
+    `min_lexical`, to the closest document or passage by embedding (all
+    sentences are encoded in one pass) if it reaches `min_semantic`. Matched
+    sentences that follow each other in the text and in the same source (at most
+    `gap` source sentences apart) are merged into copied spans. Returns plain
+    dicts (see models.response.ReportResponse). With `search` (a
+    shards.ShardPool) the corpus searches run on the shards and `index` only
+    has to map doc ids to titles and texts.
+    """
+    q_sents = split_sentences(text)
+    total = sum(end - start for _, start, end in q_sents)
+    if not q_sents:
+        return {"query_len": len(text), "corpus_size": index.n_alive, "percent_matched": 0.0,
+                "sentences": [], "spans": [], "sources": []}
+
+    q_texts = [s for s, _, _ in q_sents]
+    q_vecs = index.tfidf_word_vectorizer.transform(q_texts)
+    # Buscas no corpus: nos shards, quando há, ou neste processo
+    find_sentences = search.sentence_hits if search is not None else sentence_hits
+    find_docs = search.topk_semantic_batch if search is not None else topk_semantic_batch
+    find_best = search.best_sentences if search is not None else best_sentences
+
+    # Candidato léxico: melhor sentença do corpus para cada sentença da consulta
+    hits = find_sentences(index, q_vecs)
+    methods = ["lexical"] * len(hits)
+
+    # Candidato semântico só para quem não casou lexicamente
+    weak = [i for i, hit in enumerate(hits) if hit is None or hit[4] < min_lexical]
+    if weak and min_semantic <= 1.0:
+        spans: List[Dict[int, Tuple[int, int]]] = [{} for _ in weak]
+        doc_hits = find_docs(index, [q_texts[i] for i in weak], 1, spans)
+        targets, scores = [], []
+        for i, found, span in zip(weak, doc_hits, spans):
+            if found and found[0][1] >= min_semantic:
+                doc_id, score = found[0]
+                targets.append((i, doc_id, span.get(doc_id)))
+                scores.append(score)
+        for (i, _, _), score, hit in zip(targets, scores, find_best(index, q_vecs, targets)):
+            if hit is not None:
+                # Score do método semântico: o do embedding, não o da sentença escolhida
+                hits[i], methods[i] = hit[:4] + (score,), "semantic"
+
+    sentences = []
+    for i, (sent, q_start, q_end) in enumerate(q_sents):
+        hit = hits[i]
+        if hit is None or (methods[i] == "lexical" and hit[4] < min_lexical):
+            sentences.append({"query_sentence": sent, "query_start": q_start, "query_end": q_end})
+            continue
+        doc_id, n, d_start, d_end, score = hit
+        pos = index.position(doc_id)
+        sentences.append({
+            "query_sentence": sent,
+            "query_start": q_start,
+            "query_end": q_end,
+            "doc_id": doc_id,
+            "doc_title": index.title(pos),
+            "doc_sentence": index.text(pos)[d_start:d_end].strip(),
+            "doc_start": d_start,
+            "doc_end": d_end,
+            "score": score,
+            "method": methods[i],
+            "_n": n,
+        })
+
+    spans = _merge_spans(sentences, gap)
+    matched = sum(s["query_end"] - s["query_start"] for s in sentences if "doc_id" in s)
+    sources: Dict[int, dict] = {}
+    for s in sentences:
+        if "doc_id" not in s:
+            continue
+        src = sources.setdefault(s["doc_id"], {"doc_id": s["doc_id"], "doc_title": s["doc_title"],
+                                               "sentences": 0, "matched_chars": 0})
+        src["sentences"] += 1
+        src["matched_chars"] += s["query_end"] - s["query_start"]
+    for src in sources.values():
+        src["percent_matched"] = 100.0 * src["matched_chars"] / total if total else 0.0
+    for s in sentences:
+        s.pop("_n", None)
+    return {
+        "query_len": len(text),
+        "corpus_size": index.n_alive,
+        "percent_matched": 100.0 * matched / total if total else 0.0,
+        "sentences": sentences,
+        "spans": spans,
+        "sources": sorted(sources.values(), key=lambda src: -src["matched_chars"]),
+    }
+
+
+def _best_sentence_in(table: SentenceTable, q_vec, pos: int, span: Tuple[int, int] | None) -> Tuple[int, float]:
+    # Sentença do documento (ou do trecho que casou) mais parecida com a da consulta
+    first, last = table.doc_range(pos)
+    if span is not None:
+        inside = np.flatnonzero((table.starts[first:last] >= span[0]) & (table.ends[first:last] <= span[1]))
+        if len(inside):
+            first, last = first + int(inside[0]), first + int(inside[-1]) + 1
+    if first >= last:
+        return first, 0.0
+    sims = (q_vec @ table.matrix[first:last].T).toarray().ravel()
+    best = int(np.argmax(sims))
+    return first + best, float(sims[best])
+
+
+def _merge_spans(sentences: List[dict], gap: int) -> List[dict]:
+    # Sentenças casadas em sequência na consulta e na mesma fonte (avançando até `gap` sentenças)
+    spans: List[dict] = []
+    prev = None
+    for s in sentences:
+        if "doc_id" not in s:
+            prev = None
+            continue
+        if prev is not None and s["doc_id"] == prev["doc_id"] and 0 <= s["_n"] - prev["_n"] <= gap + 1:
+            cur = spans[-1]
+            cur["query_end"] = s["query_end"]
+            cur["doc_start"] = min(cur["doc_start"], s["doc_start"])
+            cur["doc_end"] = max(cur["doc_end"], s["doc_end"])
+            cur["sentences"] += 1
+            cur["score"] += (s["score"] - cur["score"]) / cur["sentences"]
+        else:
+            spans.append({
+                "doc_id": s["doc_id"],
+                "query_start": s["query_start"],
+                "query_end": s["query_end"],
+                "doc_start": s["doc_start"],
+                "doc_end": s["doc_end"],
+                "sentences": 1,
+                "score": s["score"],
+            })
+        prev = s
+    return spans
@@ -0,0 +1,202 @@
+"""
+Sharded search: the live corpus is split into N shards (see match.shard_index),
+each memory-mapped from its own snapshot and searched by its own worker process.
+The API process keeps only the vectorizers, encoder, ids, titles, texts and
+sentence offsets (see coordinator_view), and scatters every search (queries
+already vectorized/encoded) to all shards, merging their per-shard results.
+"""
+from __future__ import annotations
+
+import dataclasses
+import logging
+import multiprocessing
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+import match
+import report
+from models.corpus import CorpusIndex, PassageTable
+from store import load_index, save_index
+from utils.metrics import timer
+
+logger = logging.getLogger(__name__)
+
+Hits = List[Tuple[int, float]]
+
+# Shard servido por este processo (só existe nos processos de shard)
+_shard: CorpusIndex | None = None
+
+
+def _load_shard(root: str, version: str) -> None:
+    global _shard
+    _shard = load_index(root, version)
+    if _shard is None:
+        raise RuntimeError(f"shard snapshot {version} not found under {root}")
+
+
+def _shard_size() -> int:
+    return _shard.n_alive
+
+
+def _lexical(q_word, q_char, k: int) -> Tuple[List[Hits], List[dict]]:
+    spans: List[Dict[int, Tuple[int, int]]] = [{} for _ in range(q_word.shape[0])]
+    return match.lexical_hits(_shard, q_word, q_char, k, spans), spans
+
+
+def _semantic(q_vecs: np.ndarray, k: int) -> Tuple[List[Hits], List[dict]]:
+    spans: List[Dict[int, Tuple[int, int]]] = [{} for _ in range(len(q_vecs))]
+    return match.semantic_hits(_shard, q_vecs, k, spans), spans
+
+
+def _sentence_hits(q_vecs) -> List[report.SentenceHit | None]:
+    return report.sentence_hits(_shard, q_vecs)
+
+
+def _best_sentences(q_vecs, targets: List[tuple]) -> List[report.SentenceHit | None]:
+    return report.best_sentences(_shard, q_vecs, targets)
+
+
+def _fingerprint(query: str, k: int) -> Tuple[List[list], None]:
+    return [match.topk_fingerprint(_shard, query, k)], None
+
+
+def _add(ids: List[int], texts: List[str], embeddings: np.ndarray, passages) -> None:
+    global _shard
+    # Títulos e textos não são usados pela busca; o texto só para vetorizar
+    _shard = _shard.add_documents(ids, [None] * len(ids), texts, embeddings, passages=passages)
+
+
+def _remove(ids: List[int]) -> int:
+    global _shard
+    _shard, removed = _shard.remove_documents(ids)
+    return removed
+
+
+def coordinator_view(index: CorpusIndex) -> CorpusIndex:
+    """
+    What the API process keeps of `index` next to the shards: vectorizers, ids,
+    titles, texts (memory-mapped from the snapshot), tombstones and sentence
+    offsets (to align sentences and map doc ids). Matrices, embeddings,
+    postings, ANN, passages and fingerprints live only in the shards.
+    """
+    delta = coordinator_view(index.delta) if index.delta is not None else None
+    sentences = index.sentences.offsets_only() if index.sentences is not None else None
+    return dataclasses.replace(
+        index, tfidf_word_matrix=None, tfidf_char_matrix=None, embed_matrix=None, ann=None,
+        word_postings=None, char_postings=None, embed_codes=None, sentences=sentences,
+        passages=None, fingerprints=None, delta=delta,
+    )
+
+
+class ShardPool:
+    """
+    One single-worker process per shard. Searches and updates of a shard go
+    through the same queue, so they are applied in order. Methods mirror the
+    `topk_*` functions of `match` and the sentence searches of `report`, and
+    take the API process' index (see coordinator_view), whose vectorizers turn
+    queries into the TF-IDF rows sent to the shards.
+    """
+
+    def __init__(self, index: CorpusIndex, n: int, root: str):
+        Path(root).mkdir(parents=True, exist_ok=True)
+        self.root = Path(tempfile.mkdtemp(prefix="shards-", dir=root))
+        # spawn, não fork: o processo da API tem threads e o índice inteiro em memória
+        ctx = multiprocessing.get_context("spawn")
+        self._executors = []
+        for i, part in enumerate(match.shard_index(index, n)):
+            part.version = f"shard{i}"
+            save_index(part, str(self.root))
+            self._executors.append(ProcessPoolExecutor(
+                max_workers=1, mp_context=ctx, initializer=_load_shard, initargs=(str(self.root), part.version)
+            ))
+        self.n = len(self._executors)
+        # O índice da API não guarda trechos nem impressões: o modo vem daqui
+        self.passage_mode = index.passages is not None
+        self.fingerprints = index.fingerprints is not None
+        # Falhas de carga aparecem aqui, e não na primeira consulta
+        sizes = self._scatter(_shard_size)
+        logger.info("Started %d search shards %s from %s", self.n, sizes, self.root)
+
+    def _scatter(self, fn, *args) -> list:
+        futures = [executor.submit(fn, *args) for executor in self._executors]
+        return [future.result() for future in futures]
+
+    @staticmethod
+    def _gather(results: list, k: int, spans: List[dict] | None) -> List[Hits]:
+        # Heap por consulta sobre os top-k de cada shard (ids não se repetem entre shards)
+        return match.merge_hits(results, k, spans)
+
+    def topk_lexical(
+        self, index: CorpusIndex, query: str, k: int = 5, spans: Dict[int, Tuple[int, int]] | None = None
+    ) -> Hits:
+        return self.topk_lexical_batch(index, [query], k, [spans] if spans is not None else None)[0]
+
+    def topk_semantic(
+        self, index: CorpusIndex, query: str, k: int = 5, spans: Dict[int, Tuple[int, int]] | None = None
+    ) -> Hits:
+        return self.topk_semantic_batch(index, [query], k, [spans] if spans is not None else None)[0]
+
+    @timer("lexical")
+    def topk_lexical_batch(
+        self, index: CorpusIndex, queries: List[str], k: int = 5, spans: List[dict] | None = None
+    ) -> List[Hits]:
+        if not queries:
+            return []
+        q_word, q_char = match.vectorize_queries(index, queries)
+        return self._gather(self._scatter(_lexical, q_word, q_char, k), k, spans)
+
+    @timer("semantic")
+    def topk_semantic_batch(
+        self, index: CorpusIndex, queries: List[str], k: int = 5, spans: List[dict] | None = None
+    ) -> List[Hits]:
+        if not queries:
+            return []
+        q_vecs = match.encode_queries(queries)
+        return self._gather(self._scatter(_semantic, q_vecs, k), k, spans)
+
+    @timer("fingerprint")
+    def topk_fingerprint(self, index: CorpusIndex, query: str, k: int = 5) -> list:
+        if not self.fingerprints:
+            return []
+        return self._gather(self._scatter(_fingerprint, query, k), k, None)[0]
+
+    def sentence_hits(self, index: CorpusIndex, q_vecs) -> List[report.SentenceHit | None]:
+        """Best live sentence for each row of `q_vecs` over all shards (see report.sentence_hits)."""
+        per_shard = self._scatter(_sentence_hits, q_vecs)
+        return [
+            max((hits[row] for hits in per_shard if hits[row] is not None), key=itemgetter(4), default=None)
+            for row in range(q_vecs.shape[0])
+        ]
+
+    def best_sentences(
+        self, index: CorpusIndex, q_vecs, targets: List[tuple]
+    ) -> List[report.SentenceHit | None]:
+        """report.best_sentences on the shard holding each target document."""
+        per_shard = self._scatter(_best_sentences, q_vecs, targets)
+        return [next((hits[i] for hits in per_shard if hits[i] is not None), None) for i in range(len(targets))]
+
+    def add_documents(
+        self, ids: List[int], texts: List[str], embeddings: np.ndarray, passages: PassageTable | None
+    ) -> None:
+        """Add documents (embedded by match.embed_documents) to the last shard."""
+        if not ids:
+            return
+        # Ids repetidos substituem a versão antiga, que pode estar em qualquer shard
+        for executor in self._executors[:-1]:
+            executor.submit(_remove, ids).result()
+        self._executors[-1].submit(_add, ids, texts, embeddings, passages).result()
+
+    def remove_documents(self, ids: List[int]) -> int:
+        return sum(self._scatter(_remove, ids))
+
+    def close(self) -> None:
+        """Stop the shard processes (after queued searches finish) and delete their snapshots."""
+        for executor in self._executors:
+            executor.shutdown(wait=True)
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -1,11 +1,17 @@
 from __future__ import annotations
 
 import logging
-from typing import List
+from typing import TYPE_CHECKING, List
 import re
 
-from sklearn.metrics.pairwise import cosine_similarity
-from models.corpus import CorpusIndex
+import numpy as np
+from scipy import sparse
+from models.corpus import CorpusIndex, SentenceTable
+from utils.metrics import timer
+from utils.topk import topk_indices
+
+if TYPE_CHECKING:
+    from sklearn.feature_extraction.text import TfidfVectorizer
 
 logger = logging.getLogger(__name__)
 
@@ -27,41 +33,254 @@ def _split_sentences_with_offsets(text: str) -> List[tuple[str, int, int]]:
             parts.append((tail, start, len(text)))
     return parts
 
-def sentence_alignment(index: CorpusIndex, query: str, doc_text: str, top_n: int = 5) -> List[dict]:
+
+def split_sentences(text: str) -> List[tuple[str, int, int]]:
+    """Sentences of `text` as (sentence, start, end) character offsets."""
+    return _split_sentences_with_offsets(text)
+
+
+def sentence_offsets(texts: List[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(starts, ends, doc_ptr) of the sentences of `texts`, as in a SentenceTable but without vectors."""
+    starts: List[int] = []
+    ends: List[int] = []
+    doc_ptr = np.zeros(len(texts) + 1, dtype=np.int64)
+    for pos, text in enumerate(texts):
+        parts = _split_sentences_with_offsets(text)
+        starts.extend(start for _, start, _ in parts)
+        ends.extend(end for _, _, end in parts)
+        doc_ptr[pos + 1] = doc_ptr[pos] + len(parts)
+    return np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64), doc_ptr
+
+
+def build_sentence_table(
+    texts: List[str], vectorizer: TfidfVectorizer, chunk_size: int = 1000
+) -> SentenceTable:
+    """Split every corpus document once and vectorize all its sentences."""
+    starts: List[int] = []
+    ends: List[int] = []
+    doc_ptr = np.zeros(len(texts) + 1, dtype=np.int64)
+    blocks = []
+    for chunk_start in range(0, len(texts), chunk_size):
+        chunk_sents: List[str] = []
+        for pos in range(chunk_start, min(chunk_start + chunk_size, len(texts))):
+            parts = _split_sentences_with_offsets(texts[pos])
+            for sent, start, end in parts:
+                chunk_sents.append(sent)
+                starts.append(start)
+                ends.append(end)
+            doc_ptr[pos + 1] = doc_ptr[pos] + len(parts)
+        if chunk_sents:
+            blocks.append(vectorizer.transform(chunk_sents))
+    if blocks:
+        matrix = sparse.vstack(blocks, format="csr")
+    else:
+        matrix = sparse.csr_matrix((0, len(vectorizer.vocabulary_)))
+    return SentenceTable(
+        starts=np.asarray(starts, dtype=np.int64),
+        ends=np.asarray(ends, dtype=np.int64),
+        doc_ptr=doc_ptr,
+        matrix=matrix,
+    )
+
+
+class Alignment:
+    """
+    Sentence pairs of one query/document alignment as parallel arrays, sorted by
+    decreasing score. The sentences themselves are slices of `query`/`doc_text`;
+    indexing or iterating yields one dict per pair.
+    """
+
+    __slots__ = ("query", "doc_text", "query_start", "query_end", "doc_start", "doc_end", "score")
+
+    def __init__(
+        self, query: str, doc_text: str, query_start=(), query_end=(), doc_start=(), doc_end=(), score=()
+    ):
+        self.query = query
+        self.doc_text = doc_text
+        self.query_start = np.asarray(query_start, dtype=np.int64)
+        self.query_end = np.asarray(query_end, dtype=np.int64)
+        self.doc_start = np.asarray(doc_start, dtype=np.int64)
+        self.doc_end = np.asarray(doc_end, dtype=np.int64)
+        self.score = np.asarray(score, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.score)
+
+    def __getitem__(self, i: int) -> dict:
+        return self._pair(
+            int(self.query_start[i]), int(self.query_end[i]),
+            int(self.doc_start[i]), int(self.doc_end[i]), float(self.score[i]),
+        )
+
+    def __iter__(self):
+        # tolist() uma vez por coluna em vez de converter escalar por escalar
+        columns = (self.query_start, self.query_end, self.doc_start, self.doc_end, self.score)
+        return (self._pair(*row) for row in zip(*(c.tolist() for c in columns)))
+
+    def _pair(self, qs: int, qe: int, ds: int, de: int, score: float) -> dict:
+        return {
+            'doc_sentence': self.doc_text[ds:de].strip(),
+            'doc_start': ds,
+            'doc_end': de,
+            'query_sentence': self.query[qs:qe].strip(),
+            'query_start': qs,
+            'query_end': qe,
+            'score': score,
+        }
+
+
+@timer("alignment")
+def sentence_alignment(
+    index: CorpusIndex,
+    query: str,
+    doc_text: str,
+    top_n: int = 5,
+    doc_pos: int | None = None,
+    mode: str = "greedy",
+    span: tuple[int, int] | None = None,
+) -> Alignment:
+    """
+    Best one-to-one pairs of query/document sentences by TF-IDF cosine.
+
+    mode="greedy" takes pairs by decreasing score, skipping sentences already
+    used; mode="optimal" keeps the assignment with the highest total score
+    (Hungarian algorithm) and returns its `top_n` best pairs. With `span`
+    (start, end), only document sentences inside that character range are
+    considered, e.g. the passage that matched the query. Pairs come sorted by
+    decreasing score.
+    """
     q_sents = _split_sentences_with_offsets(query)
-    d_sents = _split_sentences_with_offsets(doc_text)
-    if not q_sents or not d_sents:
-        return []
+    if not q_sents:
+        return Alignment(query, doc_text)
     q_texts = [s for s, _, _ in q_sents]
-    d_texts = [s for s, _, _ in d_sents]
     q_vecs = index.tfidf_word_vectorizer.transform(q_texts)
-    d_vecs = index.tfidf_word_vectorizer.transform(d_texts)
-    sims = cosine_similarity(q_vecs, d_vecs)
+    if doc_pos is not None and index.sentences is not None:
+        # Sentenças e vetores pré-computados no índice: só um recorte da tabela
+        first, last = index.sentences.doc_range(doc_pos)
+        d_starts = index.sentences.starts[first:last]
+        d_ends = index.sentences.ends[first:last]
+        if span is not None:
+            # Trechos são janelas de sentenças: basta recortar o intervalo contíguo
+            first += int(np.searchsorted(d_starts, span[0]))
+            last -= len(d_ends) - int(np.searchsorted(d_ends, span[1], side="right"))
+            d_starts = index.sentences.starts[first:last]
+            d_ends = index.sentences.ends[first:last]
+        if first >= last:
+            return Alignment(query, doc_text)
+        if index.sentences.matrix is not None:
+            d_vecs = index.sentences.matrix[first:last]
+        else:
+            # Só os offsets no índice (processo da API com shards): vetoriza as sentenças do documento
+            d_vecs = index.tfidf_word_vectorizer.transform([doc_text[s:e] for s, e in zip(d_starts, d_ends)])
+        # Linhas TF-IDF já têm norma L2 unitária: o produto é o cosseno
+        sims = (q_vecs @ d_vecs.T).toarray()
+    else:
+        d_sents = _split_sentences_with_offsets(doc_text)
+        if span is not None:
+            d_sents = [p for p in d_sents if p[1] >= span[0] and p[2] <= span[1]]
+        if not d_sents:
+            return Alignment(query, doc_text)
+        d_starts = np.asarray([start for _, start, _ in d_sents], dtype=np.int64)
+        d_ends = np.asarray([end for _, _, end in d_sents], dtype=np.int64)
+        d_vecs = index.tfidf_word_vectorizer.transform([s for s, _, _ in d_sents])
+        sims = (q_vecs @ d_vecs.T).toarray()
+
+    if mode == "greedy":
+        q_idx, d_idx = _greedy_match(sims, top_n)
+    elif mode == "optimal":
+        q_idx, d_idx = _optimal_match(sims, top_n)
+    else:
+        raise ValueError(f"Unknown alignment mode: {mode}")
+
+    scores = sims[q_idx, d_idx]
+    # Estável: empates mantêm a ordem do casamento
+    order = np.argsort(-scores, kind="stable")
+    q_idx, d_idx = q_idx[order], d_idx[order]
+    q_starts = np.asarray([start for _, start, _ in q_sents], dtype=np.int64)
+    q_ends = np.asarray([end for _, _, end in q_sents], dtype=np.int64)
+    return Alignment(
+        query, doc_text, q_starts[q_idx], q_ends[q_idx], d_starts[d_idx], d_ends[d_idx], scores[order]
+    )
+
+
+def _greedy_match(sims: np.ndarray, top_n: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Greedy one-to-one matching over the cells of `sims` with score > 0, in order of
+    decreasing score (ties: lower query index, then lower doc index). Returns the
+    first `top_n` accepted (query, doc) pairs.
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    flat = sims.ravel()
+    n_pos = int(np.count_nonzero(flat > 0))
+    if top_n <= 0 or n_pos == 0:
+        return empty, empty
+    # Ordena só os melhores pares; se o guloso não fechar top_n, dobra a janela
+    window = min(n_pos, 4 * top_n)
+    while True:
+        order = topk_indices(flat, window)
+        accepted = _greedy_accept(order // sims.shape[1], order % sims.shape[1], top_n)
+        if len(accepted) >= top_n or window >= n_pos:
+            order = order[accepted]
+            return order // sims.shape[1], order % sims.shape[1]
+        window = min(n_pos, 2 * window)
+
+
+def _greedy_accept(q: np.ndarray, d: np.ndarray, top_n: int) -> np.ndarray:
+    """
+    Positions (into the score-ordered candidates q/d) that a sequential greedy scan
+    would accept, limited to the first `top_n`. Works in rounds: a candidate that
+    is the first remaining one of its query row and of its doc column cannot be
+    blocked by anything before it, so it is accepted; candidates sharing a row or
+    column with an accepted one are then discarded.
+    """
+    remaining = np.arange(len(q))
+    accepted = np.zeros(0, dtype=np.int64)
+    while len(remaining):
+        rq, rd = q[remaining], d[remaining]
+        first_q = np.zeros(len(remaining), dtype=bool)
+        first_q[np.unique(rq, return_index=True)[1]] = True
+        first_d = np.zeros(len(remaining), dtype=bool)
+        first_d[np.unique(rd, return_index=True)[1]] = True
+        taken = remaining[first_q & first_d]
+        accepted = np.sort(np.concatenate([accepted, taken]))
+        blocked = np.isin(rq, q[taken]) | np.isin(rd, d[taken])
+        remaining = remaining[~blocked]
+        # Os top_n primeiros aceitos são definitivos quando nada antes deles está pendente
+        if len(accepted) >= top_n:
+            accepted = accepted[:top_n]
+            remaining = remaining[remaining < accepted[-1]]
+    return accepted
+
+
+def _greedy_reference(sims: np.ndarray, top_n: int) -> tuple[np.ndarray, np.ndarray]:
+    # Implementação direta (laços Python) usada como referência nos testes
     pairs = []
     for qi in range(sims.shape[0]):
         for di in range(sims.shape[1]):
             sc = sims[qi, di]
             if sc > 0:
                 pairs.append((sc, qi, di))
-    pairs.sort(reverse=True)
+    pairs.sort(key=lambda p: (-p[0], p[1], p[2]))
     used_q, used_d = set(), set()
-    results = []
+    q_idx, d_idx = [], []
     for sc, qi, di in pairs:
         if qi in used_q or di in used_d:
             continue
-        q_sent, q_start, q_end = q_sents[qi]
-        d_sent, d_start, d_end = d_sents[di]
-        results.append({
-            'doc_sentence': d_sent,
-            'doc_start': d_start,
-            'doc_end': d_end,
-            'query_sentence': q_sent,
-            'query_start': q_start,
-            'query_end': q_end,
-            'score': float(sc)
-        })
+        q_idx.append(qi)
+        d_idx.append(di)
         used_q.add(qi)
         used_d.add(di)
-        if len(results) >= top_n:
+        if len(q_idx) >= top_n:
             break
-    return results
\ No newline at end of file
+    return np.asarray(q_idx, dtype=np.int64), np.asarray(d_idx, dtype=np.int64)
+
+
+def _optimal_match(sims: np.ndarray, top_n: int) -> tuple[np.ndarray, np.ndarray]:
+    from scipy.optimize import linear_sum_assignment
+
+    rows, cols = linear_sum_assignment(sims, maximize=True)
+    scores = sims[rows, cols]
+    keep = scores > 0
+    rows, cols, scores = rows[keep], cols[keep], scores[keep]
+    best = topk_indices(scores, top_n)
+    return rows[best].astype(np.int64), cols[best].astype(np.int64)
@@ -0,0 +1,455 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import shutil
+from collections.abc import Sequence
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, List
+
+import numpy as np
+from scipy import sparse
+
+from ann import ExactIndex, IVFFlatIndex
+from fingerprint import FingerprintIndex
+from inverted import PostingIndex
+from models.corpus import CorpusIndex, PassageTable, SentenceTable
+from quant import QuantizedMatrix
+from utils.config import (
+    ANN_BACKEND,
+    ANN_MIN_DOCS,
+    ANN_NLIST,
+    ANN_NPROBE,
+    DATASET_LANG,
+    DATASET_SIZE,
+    EMBED_QUANT,
+    FINGERPRINT_KGRAM,
+    FINGERPRINT_WINDOW,
+    INDEX_EMBED_DTYPE,
+    INDEX_MODE,
+    LEXICAL_CHAR_WEIGHT,
+    LEXICAL_ENGINE,
+    MODEL_NAME,
+    PASSAGE_OVERLAP,
+    PASSAGE_SENTENCES,
+    TFIDF_CHAR_PARAMS,
+    TFIDF_WORD_PARAMS,
+    WIKIPEDIA_DATES,
+)
+
+if TYPE_CHECKING:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+logger = logging.getLogger(__name__)
+
+# Incrementar sempre que o layout dos arquivos mudar
+FORMAT_VERSION = 6
+
+_MANIFEST = "manifest.json"
+_UPDATES = "updates.jsonl"
+
+
+def index_version() -> str:
+    """
+    Hash of everything that determines the content of the index. A snapshot is
+    only reused when its version matches the current configuration.
+    """
+    spec = {
+        "format": FORMAT_VERSION,
+        "model": MODEL_NAME,
+        "lang": DATASET_LANG,
+        "size": DATASET_SIZE,
+        "dates": WIKIPEDIA_DATES,
+        "word": TFIDF_WORD_PARAMS,
+        "char": TFIDF_CHAR_PARAMS if LEXICAL_CHAR_WEIGHT > 0 else None,
+        "embed_dtype": INDEX_EMBED_DTYPE,
+        "embed_quant": EMBED_QUANT,
+        "ann": [ANN_BACKEND, ANN_NLIST, ANN_MIN_DOCS],
+        "lexical": LEXICAL_ENGINE,
+        "fingerprint": [FINGERPRINT_KGRAM, FINGERPRINT_WINDOW] if FINGERPRINT_KGRAM > 0 else None,
+        "mode": [INDEX_MODE, PASSAGE_SENTENCES, PASSAGE_OVERLAP] if INDEX_MODE == "passage" else INDEX_MODE,
+    }
+    raw = json.dumps(spec, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+
+class MappedTexts(Sequence):
+    """
+    Document texts of a snapshot: one UTF-8 blob plus the byte offset of each
+    text, both memory-mapped. A text is only decoded when accessed, so the corpus
+    stays in the page cache instead of the process heap.
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+
+def _save_texts(path: Path, texts: Iterable[str]) -> None:
+    offsets = [0]
+    with open(path / "texts.bin", "wb") as f:
+        for text in texts:
+            raw = text.encode("utf-8")
+            f.write(raw)
+            offsets.append(offsets[-1] + len(raw))
+    np.save(path / "text_offsets.npy", np.asarray(offsets, dtype=np.int64))
+
+
+def _load_texts(path: Path) -> MappedTexts:
+    offsets = np.load(path / "text_offsets.npy", mmap_mode="r")
+    # np.memmap não aceita arquivos vazios
+    blob = np.memmap(path / "texts.bin", dtype=np.uint8, mode="r") if offsets[-1] else np.zeros(0, np.uint8)
+    return MappedTexts(blob, offsets)
+
+
+def _save_csr(path: Path, prefix: str, matrix: sparse.csr_matrix) -> List[int]:
+    matrix = sparse.csr_matrix(matrix)
+    matrix.sort_indices()
+    np.save(path / f"{prefix}_data.npy", matrix.data)
+    np.save(path / f"{prefix}_indices.npy", matrix.indices)
+    np.save(path / f"{prefix}_indptr.npy", matrix.indptr)
+    return list(matrix.shape)
+
+
+def _load_csr(path: Path, prefix: str, shape: List[int]) -> sparse.csr_matrix:
+    # mmap_mode='r': os arrays ficam no page cache e são compartilhados entre workers
+    data = np.load(path / f"{prefix}_data.npy", mmap_mode="r")
+    indices = np.load(path / f"{prefix}_indices.npy", mmap_mode="r")
+    indptr = np.load(path / f"{prefix}_indptr.npy", mmap_mode="r")
+    matrix = sparse.csr_matrix((data, indices, indptr), shape=tuple(shape), copy=False)
+    matrix.has_sorted_indices = True
+    return matrix
+
+
+def _save_postings(path: Path, prefix: str, postings: PostingIndex) -> None:
+    np.save(path / f"{prefix}_post_indptr.npy", postings.indptr)
+    np.save(path / f"{prefix}_post_indices.npy", postings.indices)
+    np.save(path / f"{prefix}_post_data.npy", postings.data)
+    np.save(path / f"{prefix}_post_max.npy", postings.max_weight)
+
+
+def _load_postings(path: Path, prefix: str, n_docs: int) -> PostingIndex | None:
+    if not (path / f"{prefix}_post_indptr.npy").exists():
+        return None
+    return PostingIndex(
+        np.load(path / f"{prefix}_post_indptr.npy", mmap_mode="r"),
+        np.load(path / f"{prefix}_post_indices.npy", mmap_mode="r"),
+        np.load(path / f"{prefix}_post_data.npy", mmap_mode="r"),
+        np.load(path / f"{prefix}_post_max.npy"),
+        n_docs,
+    )
+
+
+def _save_vectorizer(path: Path, prefix: str, vectorizer: TfidfVectorizer) -> None:
+    terms = [""] * len(vectorizer.vocabulary_)
+    for term, col in vectorizer.vocabulary_.items():
+        terms[col] = term
+    with open(path / f"{prefix}_vocab.json", "w", encoding="utf-8") as f:
+        json.dump(terms, f, ensure_ascii=False)
+    np.save(path / f"{prefix}_idf.npy", vectorizer.idf_)
+
+
+def _load_vectorizer(path: Path, prefix: str, params: dict) -> TfidfVectorizer:
+    with open(path / f"{prefix}_vocab.json", encoding="utf-8") as f:
+        terms = json.load(f)
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vectorizer = TfidfVectorizer(**params)
+    vectorizer.vocabulary_ = {term: col for col, term in enumerate(terms)}
+    vectorizer.idf_ = np.load(path / f"{prefix}_idf.npy")
+    return vectorizer
+
+
+def _save_embed(path: Path, prefix: str, embed: np.ndarray, manifest: dict) -> None:
+    embed = np.ascontiguousarray(embed, dtype=INDEX_EMBED_DTYPE)
+    embed.tofile(path / f"{prefix}.bin")
+    manifest[f"{prefix}_shape"] = list(embed.shape)
+    manifest[f"{prefix}_dtype"] = str(embed.dtype)
+
+
+def _load_embed(path: Path, prefix: str, manifest: dict) -> np.ndarray:
+    shape = tuple(manifest[f"{prefix}_shape"])
+    if not shape[0]:
+        # np.memmap não aceita arquivos vazios
+        return np.zeros(shape, dtype=manifest[f"{prefix}_dtype"])
+    return np.memmap(path / f"{prefix}.bin", dtype=manifest[f"{prefix}_dtype"], mode="r", shape=shape)
+
+
+def _save_codes(path: Path, prefix: str, codes: QuantizedMatrix | None) -> None:
+    if codes is None:
+        return
+    np.save(path / f"{prefix}_codes.npy", codes.codes)
+    if codes.scale is not None:
+        np.save(path / f"{prefix}_scale.npy", codes.scale)
+
+
+def _load_codes(path: Path, prefix: str) -> QuantizedMatrix | None:
+    # Os códigos ficam em memória (são o caminho quente); os float32 seguem mapeados
+    if not (path / f"{prefix}_codes.npy").exists():
+        return None
+    scale = path / f"{prefix}_scale.npy"
+    return QuantizedMatrix(np.load(path / f"{prefix}_codes.npy"), np.load(scale) if scale.exists() else None)
+
+
+def _save_ann(path: Path, prefix: str, ann) -> str | None:
+    if isinstance(ann, IVFFlatIndex):
+        np.save(path / f"{prefix}_centroids.npy", ann.centroids)
+        np.save(path / f"{prefix}_list_ids.npy", ann.list_ids)
+        np.save(path / f"{prefix}_list_offsets.npy", ann.list_offsets)
+    return getattr(ann, "name", None)
+
+
+def _load_ann(path: Path, prefix: str, name: str | None, vectors: np.ndarray):
+    if name == "ivf":
+        return IVFFlatIndex(
+            vectors,
+            np.load(path / f"{prefix}_centroids.npy"),
+            np.load(path / f"{prefix}_list_ids.npy", mmap_mode="r"),
+            np.load(path / f"{prefix}_list_offsets.npy"),
+            nprobe=ANN_NPROBE,
+        )
+    if name == "exact":
+        return ExactIndex(vectors)
+    return None
+
+
+def _save_passages(path: Path, table: PassageTable, manifest: dict) -> None:
+    np.save(path / "pass_starts.npy", table.starts)
+    np.save(path / "pass_ends.npy", table.ends)
+    np.save(path / "pass_doc_ptr.npy", table.doc_ptr)
+    manifest["pass_word_shape"] = _save_csr(path, "pass_word", table.word_matrix)
+    if table.word_postings is not None:
+        _save_postings(path, "pass_word", table.word_postings)
+    if table.char_matrix is not None:
+        manifest["pass_char_shape"] = _save_csr(path, "pass_char", table.char_matrix)
+        if table.char_postings is not None:
+            _save_postings(path, "pass_char", table.char_postings)
+    _save_embed(path, "pass_embed", table.embed_matrix, manifest)
+    _save_codes(path, "pass_embed", table.embed_codes)
+    manifest["pass_ann"] = _save_ann(path, "pass_ann", table.ann)
+
+
+def _load_passages(path: Path, manifest: dict) -> PassageTable:
+    n_rows = manifest["pass_word_shape"][0]
+    embed = _load_embed(path, "pass_embed", manifest)
+    codes = _load_codes(path, "pass_embed")
+    char_matrix = None
+    if "pass_char_shape" in manifest:
+        char_matrix = _load_csr(path, "pass_char", manifest["pass_char_shape"])
+    return PassageTable(
+        starts=np.load(path / "pass_starts.npy", mmap_mode="r"),
+        ends=np.load(path / "pass_ends.npy", mmap_mode="r"),
+        doc_ptr=np.load(path / "pass_doc_ptr.npy"),
+        word_matrix=_load_csr(path, "pass_word", manifest["pass_word_shape"]),
+        char_matrix=char_matrix,
+        embed_matrix=embed,
+        word_postings=_load_postings(path, "pass_word", n_rows),
+        char_postings=_load_postings(path, "pass_char", n_rows) if char_matrix is not None else None,
+        ann=_load_ann(path, "pass_ann", manifest.get("pass_ann"), codes if codes is not None else embed),
+        embed_codes=codes,
+    )
+
+
+def save_index(index: CorpusIndex, root: str, overwrite: bool = False) -> Path:
+    """
+    Write `index` to `root/<index.version>/`. The directory is written under a
+    temporary name and renamed at the end, so readers never see a partial snapshot.
+    With `overwrite`, an existing snapshot of the same version is replaced (used
+    after compaction, when the corpus changed but the configuration did not).
+    """
+    if index.delta is not None:
+        raise ValueError("index has documents added after its build; compact it before saving")
+    target = Path(root) / index.version
+    if target.exists() and not overwrite:
+        return target
+    tmp = Path(root) / f".{index.version}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    manifest: dict = {"format": FORMAT_VERSION, "version": index.version}
+    with open(tmp / "docs.json", "w", encoding="utf-8") as f:
+        json.dump({"ids": list(index.ids), "titles": list(index.titles)}, f, ensure_ascii=False)
+    _save_texts(tmp, index.texts)
+
+    manifest["word_shape"] = _save_csr(tmp, "word", index.tfidf_word_matrix)
+    _save_vectorizer(tmp, "word", index.tfidf_word_vectorizer)
+    if index.word_postings is not None:
+        _save_postings(tmp, "word", index.word_postings)
+    if index.tfidf_char_vectorizer is not None and index.tfidf_char_matrix is not None:
+        manifest["char_shape"] = _save_csr(tmp, "char", index.tfidf_char_matrix)
+        _save_vectorizer(tmp, "char", index.tfidf_char_vectorizer)
+        if index.char_postings is not None:
+            _save_postings(tmp, "char", index.char_postings)
+
+    _save_embed(tmp, "embed", index.embed_matrix, manifest)
+    _save_codes(tmp, "embed", index.embed_codes)
+
+    if index.sentences is not None:
+        np.save(tmp / "sent_starts.npy", index.sentences.starts)
+        np.save(tmp / "sent_ends.npy", index.sentences.ends)
+        np.save(tmp / "sent_doc_ptr.npy", index.sentences.doc_ptr)
+        manifest["sent_shape"] = _save_csr(tmp, "sent", index.sentences.matrix)
+        if index.sentences.postings is not None:
+            _save_postings(tmp, "sent", index.sentences.postings)
+
+    manifest["ann"] = _save_ann(tmp, "ann", index.ann)
+    if index.fingerprints is not None:
+        for name in ("hashes", "docs", "starts", "ends"):
+            np.save(tmp / f"fp_{name}.npy", getattr(index.fingerprints, name))
+    if index.passages is not None:
+        _save_passages(tmp, index.passages, manifest)
+
+    if index.n_dead:
+        np.save(tmp / "alive.npy", index.alive)
+
+    with open(tmp / _MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    old = None
+    if overwrite and target.exists():
+        # Arquivos antigos podem seguir mapeados por leitores; removê-los é seguro no POSIX
+        old = Path(root) / f".{index.version}.old-{os.getpid()}"
+        os.rename(target, old)
+    try:
+        os.rename(tmp, target)
+    except OSError:
+        # Outro worker terminou antes; o snapshot dele é equivalente
+        shutil.rmtree(tmp, ignore_errors=True)
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+    logger.info("Saved corpus index snapshot to %s", target)
+    return target
+
+
+def load_index(root: str, version: str) -> CorpusIndex | None:
+    """
+    Memory-map the snapshot for `version` under `root`. Returns None when there is
+    no usable snapshot (missing, other format or other version).
+    """
+    path = Path(root) / version
+    try:
+        with open(path / _MANIFEST, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest.get("format") != FORMAT_VERSION or manifest.get("version") != version:
+        logger.warning("Ignoring incompatible index snapshot at %s", path)
+        return None
+
+    with open(path / "docs.json", encoding="utf-8") as f:
+        docs = json.load(f)
+
+    tfidf_char = None
+    tfidf_char_matrix = None
+    if "char_shape" in manifest:
+        tfidf_char = _load_vectorizer(path, "char", TFIDF_CHAR_PARAMS)
+        tfidf_char_matrix = _load_csr(path, "char", manifest["char_shape"])
+
+    embed_matrix = _load_embed(path, "embed", manifest)
+    embed_codes = _load_codes(path, "embed")
+    ann = _load_ann(path, "ann", manifest.get("ann"), embed_codes if embed_codes is not None else embed_matrix)
+
+    sentences = None
+    if "sent_shape" in manifest:
+        sentences = SentenceTable(
+            starts=np.load(path / "sent_starts.npy", mmap_mode="r"),
+            ends=np.load(path / "sent_ends.npy", mmap_mode="r"),
+            doc_ptr=np.load(path / "sent_doc_ptr.npy", mmap_mode="r"),
+            matrix=_load_csr(path, "sent", manifest["sent_shape"]),
+            postings=_load_postings(path, "sent", manifest["sent_shape"][0]),
+        )
+
+    fingerprints = None
+    if (path / "fp_hashes.npy").exists():
+        fingerprints = FingerprintIndex(
+            *(np.load(path / f"fp_{name}.npy", mmap_mode="r") for name in ("hashes", "docs", "starts", "ends"))
+        )
+
+    alive = np.load(path / "alive.npy") if (path / "alive.npy").exists() else None
+    n_docs = len(docs["ids"])
+    logger.info("Loaded corpus index snapshot from %s (%d docs)", path, n_docs)
+    return CorpusIndex(
+        ids=docs["ids"],
+        titles=docs["titles"],
+        texts=_load_texts(path),
+        tfidf_word_vectorizer=_load_vectorizer(path, "word", TFIDF_WORD_PARAMS),
+        tfidf_word_matrix=_load_csr(path, "word", manifest["word_shape"]),
+        tfidf_char_vectorizer=tfidf_char,
+        tfidf_char_matrix=tfidf_char_matrix,
+        embed_matrix=embed_matrix,
+        version=version,
+        ann=ann,
+        word_postings=_load_postings(path, "word", n_docs),
+        char_postings=_load_postings(path, "char", n_docs) if tfidf_char is not None else None,
+        sentences=sentences,
+        alive=alive,
+        passages=_load_passages(path, manifest) if "pass_word_shape" in manifest else None,
+        fingerprints=fingerprints,
+        embed_codes=embed_codes,
+    )
+
+
+def _pack(arr: np.ndarray | None) -> dict | None:
+    if arr is None:
+        return None
+    arr = np.ascontiguousarray(arr)
+    return {"dtype": arr.dtype.str, "shape": list(arr.shape), "data": base64.b64encode(arr.tobytes()).decode("ascii")}
+
+
+def _unpack(packed: dict | None) -> np.ndarray | None:
+    if packed is None:
+        return None
+    raw = base64.b64decode(packed["data"])
+    return np.frombuffer(raw, dtype=packed["dtype"]).reshape(packed["shape"]).copy()
+
+
+def append_update(root: str, version: str, entry: dict) -> None:
+    """
+    Append an inclusion or removal to the update log of snapshot `version`, so
+    it survives restarts until the next compaction rewrites the snapshot (and
+    drops the log). Array values are stored as base64; the entry is fsynced
+    before returning.
+    """
+    line = json.dumps(
+        {key: _pack(value) if isinstance(value, np.ndarray) else value for key, value in entry.items()},
+        ensure_ascii=False,
+    )
+    with open(Path(root) / version / _UPDATES, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_updates(root: str, version: str) -> List[dict]:
+    """Entries of the update log of snapshot `version`, oldest first (see `append_update`)."""
+    path = Path(root) / version / _UPDATES
+    if not path.exists():
+        return []
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Última linha cortada por uma queda no meio da escrita
+                logger.warning("Ignoring truncated entry in %s", path)
+                break
+            entries.append({
+                key: _unpack(value) if isinstance(value, dict) and "dtype" in value else value
+                for key, value in entry.items()
+            })
+    return entries
@@ -0,0 +1,13 @@
+import pytest
+
+import main
+
+
+@pytest.fixture(scope="session", autouse=True)
+def index_dir(tmp_path_factory):
+    # Snapshot do índice servido num diretório temporário, não no INDEX_DIR relativo ao cwd
+    patch = pytest.MonkeyPatch()
+    path = tmp_path_factory.mktemp("index")
+    patch.setattr(main, "INDEX_DIR", str(path))
+    yield path
+    patch.undo()
@@ -0,0 +1,39 @@
+import numpy as np
+
+from ann import ExactIndex, IVFFlatIndex
+
+
+def _clustered(n=4000, d=32, n_centers=40, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_centers, d))
+    x = centers[rng.integers(0, n_centers, n)] + 0.3 * rng.normal(size=(n, d))
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    q = x[rng.integers(0, n, 50)] + 0.1 * rng.normal(size=(50, d))
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    return x.astype(np.float32), q.astype(np.float32)
+
+
+def test_exact_matches_bruteforce():
+    x, q = _clustered(n=500)
+    idx, scores = ExactIndex(x).search(q[0], 10)
+    expected = np.argsort(-(x @ q[0]), kind="stable")[:10]
+    np.testing.assert_array_equal(idx, expected)
+    np.testing.assert_allclose(scores, (x @ q[0])[expected], rtol=1e-6)
+
+
+def test_ivf_recall_against_exact():
+    x, q = _clustered()
+    exact = ExactIndex(x)
+    ivf = IVFFlatIndex.build(x, nlist=64, nprobe=8)
+    hits = 0
+    for qv in q:
+        truth = set(exact.search(qv, 10)[0].tolist())
+        hits += len(truth & set(ivf.search(qv, 10)[0].tolist()))
+    assert hits / (10 * len(q)) >= 0.9
+
+
+def test_ivf_full_probe_is_exact():
+    x, q = _clustered(n=1000)
+    ivf = IVFFlatIndex.build(x, nlist=16, nprobe=16)
+    for qv in q[:10]:
+        np.testing.assert_array_equal(np.sort(ivf.search(qv, 5)[0]), np.sort(ExactIndex(x).search(qv, 5)[0]))
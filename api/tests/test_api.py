@@ -1,4 +1,5 @@
 from main               import app
+from store              import read_updates
 from fastapi.testclient import TestClient
 
 client = TestClient(app)
@@ -28,4 +29,181 @@ def test_compare_min():
             for sent in doc["sentences"]:
                 assert "doc_sentence" in sent
                 assert "query_sentence" in sent
-                assert "score" in sent
\ No newline at end of file
+                assert "score" in sent
+
+
+def test_compare_batch():
+    texts = ["O café é uma bebida popular.", "A Revolução Industrial começou na Inglaterra."]
+    request = client.post("/compare/batch", json={"texts": texts, "top_k": 2})
+    assert request.status_code == 200
+    results = request.json()["results"]
+    assert len(results) == 2
+    for text, result in zip(texts, results):
+        assert result["query_len"] == len(text)
+        assert len(result["items"]) == 2
+
+
+def test_compare_without_detail():
+    payload = {"text": "O café é uma bebida popular.", "top_k": 3, "detail": False}
+    request = client.post("/compare", json=payload)
+    assert request.status_code == 200
+    for item in request.json()["items"]:
+        assert len(item["docs"]) == 3
+        for doc in item["docs"]:
+            assert doc["sentences"] == []
+            assert doc["score"] is not None
+
+
+def test_compare_repeated_is_cached():
+    payload = {"text": "A água do rio é limpa.", "top_k": 2}
+    first = client.post("/compare", json=payload).json()
+    hits = client.get("/health").json()["cache"]["response"]["hits"]
+    second = client.post("/compare", json=payload).json()
+    assert second == first
+    assert client.get("/health").json()["cache"]["response"]["hits"] == hits + 1
+
+
+def test_admin_routes_disabled_without_token(monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "")
+    assert client.post("/admin/compact").status_code == 403
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "segredo")
+    assert client.post("/admin/compact", headers={"X-Admin-Token": "errado"}).status_code == 401
+
+
+def test_admin_add_and_remove_documents(monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "segredo")
+    headers = {"X-Admin-Token": "segredo"}
+    text = "Zumbificação quântica extraordinária acontece raramente."
+    added = client.post(
+        "/admin/documents", json={"documents": [{"id": 987654, "title": "Novo", "text": text}]}, headers=headers
+    )
+    assert added.status_code == 200
+    found = client.post("/compare", json={"text": text, "top_k": 1}).json()
+    assert found["items"][0]["docs"][0]["doc_id"] == 987654
+
+    removed = client.post("/admin/documents/delete", json={"ids": [987654]}, headers=headers)
+    assert removed.json()["changed"] == 1
+    found = client.post("/compare", json={"text": text, "top_k": 1}).json()
+    assert found["items"][0]["docs"][0]["doc_id"] != 987654
+
+    size = removed.json()["corpus_size"]
+    compacted = client.post("/admin/compact", headers=headers)
+    assert compacted.status_code == 200
+    assert compacted.json()["corpus_size"] == size
+    # A compactação regrava o snapshot e descarta o registro de alterações
+    assert read_updates(main.INDEX_DIR, main.get_index().version) == []
+
+
+def test_compare_fast_mode_uses_fingerprints():
+    from main import get_index
+
+    text = get_index().texts[0][:400]
+    request = client.post("/compare", json={"text": text, "top_k": 2, "mode": "fast"})
+    assert request.status_code == 200
+    items = request.json()["items"]
+    assert [item["method"] for item in items] == ["fingerprint"]
+    top = items[0]["docs"][0]
+    assert top["doc_id"] == get_index().ids[0]
+    assert top["sentences"] and top["sentences"][0]["doc_start"] >= 0
+
+    bad = client.post("/compare", json={"text": text, "mode": "rápido"})
+    assert bad.status_code == 400
+
+
+def test_compare_profile_and_metrics():
+    payload = {"text": "O rio corre para o mar azul.", "top_k": 2, "mode": "full"}
+    profile = client.post("/compare?profile=1", json=payload).json()["profile"]
+    for stage in ("lexical", "word_tfidf", "semantic", "encode", "response", "total"):
+        assert profile[stage] >= 0
+    assert client.post("/compare", json=payload).json()["profile"] is None
+
+    text = client.get("/metrics").text
+    assert 'letrus_stage_seconds_count{stage="lexical"}' in text
+    assert 'letrus_request_seconds_bucket{endpoint="/compare",le="+Inf"}' in text
+    assert 'letrus_index_bytes{component="word_tfidf",storage=' in text
+    assert "letrus_response_cache_hit_ratio" in text
+    assert "letrus_pool_in_flight 0" in text
+
+
+def test_compare_stream_matches_compare():
+    import json
+
+    payload = {"text": "A cidade fica perto do rio. O rio corre para o mar.", "top_k": 3, "mode": "full"}
+    with client.stream("POST", "/compare/stream", json=payload) as r:
+        assert r.status_code == 200
+        assert r.headers["content-type"].startswith("application/x-ndjson")
+        events = [json.loads(line) for line in r.iter_lines() if line]
+    assert events[0]["event"] == "ranking" and events[-1]["event"] == "done"
+    docs = {e["data"]["doc_id"]: e["data"]["sentences"] for e in events if e["event"] == "doc"}
+    ranking = events[0]["data"]["items"]
+    assert {d["doc_id"] for item in ranking for d in item["docs"]} == set(docs)
+
+    # O stream completo fica no cache e bate com a resposta do /compare
+    full = client.post("/compare", json=payload).json()
+    for item in full["items"]:
+        for doc in item["docs"]:
+            assert doc["sentences"] == docs[doc["doc_id"]]
+    assert client.get("/health").json()["pool"]["in_flight"] == 0
+
+
+def test_compare_stream_bounds_alignments(monkeypatch):
+    import json
+    import threading
+    import time
+
+    import main
+
+    running, peak, lock = 0, 0, threading.Lock()
+    align_doc = main.align_doc
+
+    def counting_align(*args):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.01)
+        try:
+            return align_doc(*args)
+        finally:
+            with lock:
+                running -= 1
+
+    monkeypatch.setattr(main, "align_doc", counting_align)
+    monkeypatch.setattr(main, "STREAM_ALIGN_MAX", 1)
+    payload = {"text": "O mar fica longe da cidade. A praça tem árvores.", "top_k": 4, "mode": "full"}
+    with client.stream("POST", "/compare/stream", json=payload) as r:
+        events = [json.loads(line) for line in r.iter_lines() if line]
+    assert events[-1]["event"] == "done" and events[-1]["data"]["docs"] > 1
+    assert peak == 1
+
+
+def test_compare_compact_format_and_document_text():
+    text = "A cidade fica perto do rio. O rio corre para o mar."
+    payload = {"text": text, "top_k": 3, "mode": "full"}
+    full = client.post("/compare", json=payload).json()
+    compact = client.post("/compare", json={**payload, "format": "compact"}).json()
+    assert compact["format"] == "compact" and compact["query_len"] == full["query_len"]
+    for item, citem in zip(full["items"], compact["items"]):
+        for doc, cdoc in zip(item["docs"], citem["docs"]):
+            assert cdoc["doc_id"] == doc["doc_id"] and "sentences" not in cdoc
+            pairs = cdoc["pairs"]
+            assert pairs["score"] == [s["score"] for s in doc["sentences"]]
+            # As sentenças saem de recortes da consulta e do documento
+            for i, s in enumerate(doc["sentences"]):
+                assert text[pairs["query_start"][i]:pairs["query_end"][i]].strip() == s["query_sentence"]
+                start, end = pairs["doc_start"][i], pairs["doc_end"][i]
+                params = {"start": start, "end": end, "generation": compact["generation"]}
+                part = client.get(f"/documents/{doc['doc_id']}/text", params=params).json()
+                assert part["text"].strip() == s["doc_sentence"] and part["end"] == end
+
+    assert client.post("/compare", json={**payload, "format": "xml"}).status_code == 422
+    assert client.get("/documents/-1/text").status_code == 404
+    doc_id = full["items"][0]["docs"][0]["doc_id"]
+    assert client.get(f"/documents/{doc_id}/text", params={"start": 5, "end": 2}).status_code == 400
+    # Offsets de outra geração do índice não são servidos
+    stale = client.get(f"/documents/{doc_id}/text", params={"generation": compact["generation"] + 1})
+    assert stale.status_code == 409
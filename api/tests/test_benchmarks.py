@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import StubEncoder, SyntheticCorpus
+
+
+def test_synthetic_corpus_is_deterministic():
+    a, b = SyntheticCorpus(50, seed=3), SyntheticCorpus(50, seed=3)
+    assert [d.text for d in a] == [d.text for d in b]
+    assert a.queries(5) == b.queries(5)
+    query, source = a.queries(1)[0]
+    # A consulta copia (com edições leves) parte do documento de origem
+    assert len(set(query.lower().split()) & set(a.document(source).text.lower().split())) >= 5
+
+
+def test_large_sizes_are_opt_in():
+    from benchmarks.bench_retrieval import bench_sizes
+
+    assert bench_sizes(None, False) == [1_000, 10_000]
+    assert bench_sizes(None, True) == [1_000, 10_000, 100_000, 1_000_000]
+    assert bench_sizes([500, 100_000], True) == [500, 100_000, 1_000_000]
+
+
+def test_stub_encoder_is_normalized():
+    vecs = StubEncoder(dim=32).encode(["o gato mia", "o gato dorme", "economia do brasil"])
+    np.testing.assert_allclose(np.linalg.norm(vecs, axis=1), 1.0, rtol=1e-5)
+    assert vecs[0] @ vecs[1] > vecs[0] @ vecs[2]
+
+
+@pytest.mark.slow
+def test_run_size_reports_all_stages(tmp_path, monkeypatch):
+    from argparse import Namespace
+
+    import main
+    from benchmarks.bench_retrieval import run_size
+
+    # run_size troca o índice servido; os testes seguintes usam o original
+    monkeypatch.setattr(main, "_index", main._index)
+
+    args = Namespace(
+        seed=0, chunk_size=100, workers=1, mode="document", queries=10, k=5, concurrency=2
+    )
+    result = run_size(200, args, StubEncoder(dim=32))
+    for stage in ("lexical", "semantic", "alignment", "compare"):
+        assert result[stage]["n"] == 10 and result[stage]["p99_ms"] >= result[stage]["p50_ms"]
+    assert result["recall_at_k"]["lexical"] == 1.0
+    assert result["hit_at_k"]["lexical"] > 0.5
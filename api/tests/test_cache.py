@@ -0,0 +1,27 @@
+import time
+
+from utils.cache import MISSING, LRUCache, text_key
+
+
+def test_lru_eviction_and_counters():
+    cache = LRUCache(maxsize=2, ttl=0)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "a" passa a ser o mais recente
+    cache.put("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.hits == 3 and cache.misses == 1
+
+
+def test_ttl_expiry():
+    cache = LRUCache(maxsize=4, ttl=0.05)
+    cache.put("a", 1)
+    time.sleep(0.1)
+    assert cache.get("a") is MISSING
+    assert len(cache) == 0
+
+
+def test_text_key_normalization():
+    assert text_key("O  gato\nmia ") == text_key("O gato mia")
+    assert text_key("O  gato", normalize=False) != text_key("O gato", normalize=False)
@@ -1,6 +1,6 @@
 import pytest
 
-from match import topk_lexical, topk_semantic, build_index
+from match import topk_lexical, topk_lexical_batch, topk_semantic, topk_semantic_batch, build_index
 
 
 def _toy_index():
@@ -26,4 +26,15 @@ def test_topk_lexical_basic():
 def test_topk_semantic_basic():
     idx = _toy_index()
     res = topk_semantic(idx, "felino miando", 2)
-    assert len(res) == 2
\ No newline at end of file
+    assert len(res) == 2
+
+
+@pytest.mark.slow
+def test_topk_batch_matches_single():
+    idx = _toy_index()
+    queries = ["gato no telhado", "cão late"]
+    lex = topk_lexical_batch(idx, queries, 2)
+    sem = topk_semantic_batch(idx, queries, 2)
+    for q, lex_res, sem_res in zip(queries, lex, sem):
+        assert [d for d, _ in lex_res] == [d for d, _ in topk_lexical(idx, q, 2)]
+        assert [d for d, _ in sem_res] == [d for d, _ in topk_semantic(idx, q, 2)]
@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from utils.encoder import MicroBatcher, OnnxEncoder, SemanticEncoder, _pool
+
+
+def _encode(texts):
+    return np.array([[len(t), i] for i, t in enumerate(texts)], dtype=np.float32)
+
+
+def test_encoder_loads_model_lazily():
+    enc = SemanticEncoder()
+    assert enc._model is None
+    with pytest.raises(ValueError):
+        SemanticEncoder(backend="tensorflow")
+
+
+def test_micro_batcher_solo_call_does_not_wait():
+    batcher = MicroBatcher(_encode, wait_ms=2000, max_batch=4)
+    start = time.perf_counter()
+    assert batcher.encode(["solo"]).shape == (1, 2)
+    assert time.perf_counter() - start < 1.0
+
+
+def test_micro_batcher_coalesces_concurrent_calls():
+    calls = []
+    release = threading.Event()
+
+    def encode(texts):
+        calls.append(list(texts))
+        if texts == ["ocupado"]:
+            release.wait(5)
+        return _encode(texts)
+
+    batcher = MicroBatcher(encode, wait_ms=2000, max_batch=4)
+    # Uma passada em andamento: as chamadas seguintes esperam e viram um lote só
+    busy = threading.Thread(target=batcher.encode, args=(["ocupado"],))
+    busy.start()
+    while not calls:
+        time.sleep(0.001)
+    texts = ["a", "bb", "ccc", "dddd"]
+    results = [None] * len(texts)
+
+    def worker(i):
+        results[i] = batcher.encode([texts[i]])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(texts))]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    release.set()
+    busy.join()
+    # max_batch atingido: uma só passada, sem esperar o prazo inteiro
+    assert time.perf_counter() - start < 1.5
+    assert len(calls) == 2 and sorted(calls[1]) == texts
+    for text, res in zip(texts, results):
+        assert res.shape == (1, 2) and res[0, 0] == len(text)
+
+
+def test_micro_batcher_propagates_errors():
+    def encode(texts):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        MicroBatcher(encode, wait_ms=1, max_batch=8).encode(["x"])
+
+
+def test_mean_pooling_ignores_padding():
+    hidden = np.array([[[1.0, 0.0], [3.0, 0.0], [100.0, 100.0]]], dtype=np.float32)
+    mask = np.array([[1, 1, 0]])
+    np.testing.assert_allclose(_pool(hidden, mask, "mean"), [[1.0, 0.0]])
+
+
+def test_onnx_encoder_int8(tmp_path):
+    # Modelo mínimo (embedding + projeção) quantizado em int8 como no export_onnx
+    ort_quant = pytest.importorskip("onnxruntime.quantization")
+    onnx = pytest.importorskip("onnx")
+    tokenizers = pytest.importorskip("tokenizers")
+    from onnx import TensorProto, helper, numpy_helper
+
+    words = ["[PAD]", "[UNK]", "o", "gato", "mia", "no", "telhado", "cão", "late"]
+    tok = tokenizers.Tokenizer(tokenizers.models.WordLevel({w: i for i, w in enumerate(words)}, unk_token="[UNK]"))
+    tok.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    tok.save(str(tmp_path / "tokenizer.json"))
+
+    rng = np.random.default_rng(0)
+    emb = rng.standard_normal((len(words), 16)).astype(np.float32)
+    w = rng.standard_normal((16, 16)).astype(np.float32)
+    graph = helper.make_graph(
+        [helper.make_node("Gather", ["emb", "input_ids"], ["tokens"]),
+         helper.make_node("MatMul", ["tokens", "w"], ["last_hidden_state"])],
+        "tiny",
+        [helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "seq"])],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "seq", 16])],
+        initializer=[numpy_helper.from_array(emb, "emb"), numpy_helper.from_array(w, "w")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 14)])
+    model.ir_version = 8
+    onnx.save(model, str(tmp_path / "model.onnx"))
+    ort_quant.quantize_dynamic(
+        str(tmp_path / "model.onnx"), str(tmp_path / "model_int8.onnx"), weight_type=ort_quant.QuantType.QInt8
+    )
+    meta = {"inputs": ["input_ids"], "pooling": "mean", "max_seq_length": 8, "pad_id": 0, "pad_token": "[PAD]", "dim": 16}
+    (tmp_path / "encoder.json").write_text(json.dumps(meta))
+
+    texts = ["o gato mia no telhado", "cão late"]
+    got = OnnxEncoder(tmp_path).encode(texts)
+    expected = []
+    for text in texts:
+        ids = [words.index(t) for t in text.split()]
+        vec = (emb[ids] @ w).mean(axis=0)
+        expected.append(vec / np.linalg.norm(vec))
+    assert got.shape == (2, 16)
+    # int8 só nos pesos: mesma direção do modelo float, padding fora da média
+    assert (got * np.array(expected)).sum(axis=1).min() > 0.99
@@ -0,0 +1,40 @@
+import numpy as np
+
+from fingerprint import FingerprintIndex, fingerprints
+
+_DOCS = [
+    "O gato está no telhado. O gato mia alto durante a noite inteira.",
+    "A Revolução Industrial começou na Inglaterra no século dezoito e mudou o trabalho nas fábricas para sempre.",
+    "O café é uma bebida popular no Brasil e em muitos outros países do mundo.",
+]
+
+
+def test_fingerprints_are_stable_and_case_insensitive():
+    h1, s1, e1 = fingerprints("A Revolução Industrial começou na Inglaterra no século dezoito")
+    h2, _, _ = fingerprints("a revolucao industrial COMEÇOU na inglaterra no seculo dezoito")
+    np.testing.assert_array_equal(h1, h2)
+    assert len(h1) > 0 and np.all(s1 < e1)
+
+
+def test_search_finds_copied_span_with_offsets():
+    idx = FingerprintIndex.build(_DOCS)
+    copied = "revolução industrial começou na Inglaterra no século dezoito e mudou o trabalho"
+    query = "Meu texto original sobre outra coisa. Como se sabe, a " + copied + ". Fim."
+    hits = idx.search(query, k=2)
+    assert hits[0][0] == 1
+    pos, score, spans = hits[0]
+    qs, qe, ds, de, span_score = max(spans, key=lambda s: s[1] - s[0])
+    assert span_score == 1.0
+    assert query[qs:qe].lower() == _DOCS[1][ds:de].lower()
+    assert query[qs:qe].lower() in copied.lower()
+    assert len(query[qs:qe]) > len(copied) / 2
+
+
+def test_search_respects_tombstones_and_extend():
+    idx = FingerprintIndex.build(_DOCS)
+    query = _DOCS[2]
+    assert idx.search(query, k=1)[0][0] == 2
+    alive = np.array([True, True, False])
+    assert all(pos != 2 for pos, _, _ in idx.search(query, k=3, alive=alive))
+    idx = idx.extend([_DOCS[2]], offset=3)
+    assert {pos for pos, _, _ in idx.search(query, k=3, alive=np.array([True, True, False, True]))} == {3}
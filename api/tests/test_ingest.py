@@ -0,0 +1,41 @@
+import numpy as np
+
+from ingest import ingest_corpus
+from match import build_index
+from models.document import Document
+
+
+TEXTS = [
+    "O gato está no telhado. O gato mia alto.",
+    "Cães são amigos do homem. Um cão late.",
+    "Gatos e cães podem conviver em paz.",
+    "A Revolução Industrial começou na Inglaterra. Ela mudou o trabalho.",
+    "O café é uma bebida popular no Brasil.",
+]
+
+
+def _encode(texts):
+    vecs = np.stack([np.random.default_rng(sum(map(ord, t))).normal(size=8) for t in texts])
+    return (vecs / np.linalg.norm(vecs, axis=1, keepdims=True)).astype(np.float32)
+
+
+def test_ingest_matches_build_index(tmp_path):
+    docs = [Document(id=i * 3, title=f"T{i}", text=t) for i, t in enumerate(TEXTS)]
+    work_dir = tmp_path / "ingest"
+    # Arquivos de outra construção em andamento no mesmo diretório não podem sumir
+    other = work_dir / "tmp-outra"
+    other.mkdir(parents=True)
+    (other / "docs-00000.jsonl").write_text("{}\n")
+    idx = ingest_corpus(iter(docs), work_dir=str(work_dir), chunk_size=2, workers=1, encode=_encode)
+    ref = build_index([d.id for d in docs], [d.title for d in docs], TEXTS, embed_matrix=_encode(TEXTS))
+
+    assert idx.ids == ref.ids and idx.titles == ref.titles and idx.texts == ref.texts
+    assert abs(idx.tfidf_word_matrix - ref.tfidf_word_matrix).max() < 1e-12
+    assert abs(idx.tfidf_char_matrix - ref.tfidf_char_matrix).max() < 1e-12
+    np.testing.assert_allclose(idx.embed_matrix, ref.embed_matrix)
+    np.testing.assert_array_equal(idx.sentences.doc_ptr, ref.sentences.doc_ptr)
+    np.testing.assert_array_equal(idx.sentences.starts, ref.sentences.starts)
+    assert abs(idx.sentences.matrix - ref.sentences.matrix).max() < 1e-12
+    # Só o diretório desta construção é apagado
+    assert [p.name for p in work_dir.iterdir()] == ["tmp-outra"]
+    assert (other / "docs-00000.jsonl").exists()
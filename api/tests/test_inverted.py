@@ -0,0 +1,64 @@
+import random
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from inverted import PostingIndex, search_postings
+from utils.config import TFIDF_CHAR_PARAMS, TFIDF_WORD_PARAMS
+
+_WORDS = "gato cão casa rio mar sol lua terra fogo água pedra árvore livro escola cidade povo".split()
+
+
+def _corpus(n=300, seed=0):
+    rnd = random.Random(seed)
+    return [" ".join(rnd.choice(_WORDS) for _ in range(rnd.randint(5, 40))) for _ in range(n)]
+
+
+def test_search_postings_matches_dense_scores():
+    texts = _corpus()
+    word = TfidfVectorizer(**TFIDF_WORD_PARAMS)
+    char = TfidfVectorizer(**TFIDF_CHAR_PARAMS)
+    wm, cm = word.fit_transform(texts), char.fit_transform(texts)
+    wp, cp = PostingIndex.from_matrix(wm), PostingIndex.from_matrix(cm)
+    w = 0.4
+    for query in _corpus(n=20, seed=1):
+        qw, qc = word.transform([query]), char.transform([query])
+        dense = (1 - w) * (wm @ qw.T).toarray().ravel() + w * (cm @ qc.T).toarray().ravel()
+        for k in (1, 5, 20):
+            cand, (ws, cs) = search_postings([(wp, qw, 1 - w), (cp, qc, w)], k)
+            sims = (1 - w) * ws + w * cs
+            top = np.sort(sims)[::-1][:k]
+            np.testing.assert_allclose(top, np.sort(dense)[::-1][:k], rtol=1e-9)
+            # Candidatos do top-k têm score completo (exato)
+            best = cand[np.argsort(-sims)[:k]]
+            np.testing.assert_allclose(np.sort(sims)[::-1][:k], np.sort(dense[best])[::-1])
+
+
+def test_search_postings_only_scores_sharing_docs():
+    texts = ["gato mia", "cão late", "gato e cão"]
+    word = TfidfVectorizer(**TFIDF_WORD_PARAMS)
+    wp = PostingIndex.from_matrix(word.fit_transform(texts))
+    cand, _ = search_postings([(wp, word.transform(["gato"]), 1.0)], 3)
+    assert set(cand.tolist()) == {0, 2}
+
+
+def test_search_postings_memory_follows_postings():
+    # Corpus "gigante" com poucas postings: acumuladores densos (n_docs) não caberiam na memória
+    texts = ["gato mia", "cão late", "gato e cão"]
+    word = TfidfVectorizer(**TFIDF_WORD_PARAMS)
+    wp = PostingIndex.from_matrix(word.fit_transform(texts))
+    wp.n_docs = 10**13
+    cand, (scores,) = search_postings([(wp, word.transform(["gato cão"]), 1.0)], 1)
+    assert cand.tolist() == [2] and scores[0] > 0
+
+
+def test_search_postings_space_without_matches():
+    texts = ["gato mia", "cão late", "gato e cão"]
+    word = TfidfVectorizer(**TFIDF_WORD_PARAMS)
+    char = TfidfVectorizer(**TFIDF_CHAR_PARAMS)
+    wp = PostingIndex.from_matrix(word.fit_transform(texts))
+    cp = PostingIndex.from_matrix(char.fit_transform(texts))
+    # A consulta só casa no espaço de palavras; o de caracteres não lê nenhuma posting
+    empty = char.transform(["xyz"])
+    cand, (w_scores, c_scores) = search_postings([(wp, word.transform(["gato"]), 0.6), (cp, empty, 0.4)], 1)
+    assert c_scores.dtype == np.float64 and c_scores.tolist() == [0.0] * len(cand)
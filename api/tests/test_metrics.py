@@ -0,0 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from utils.metrics import gauge, profiling, timed
+
+
+def test_gauge_keeps_every_digit():
+    lines = gauge("x", "help", [({}, 123456789), ({"k": "v"}, 0.1), ({}, 2.5e-7)])
+    assert lines[2:] == ["x 123456789", 'x{k="v"} 0.1', "x 2.5e-07"]
+
+
+def test_profile_merges_worker_threads():
+    def work():
+        for _ in range(200):
+            with timed("stage"):
+                pass
+
+    with profiling() as stages:
+        with ThreadPoolExecutor(4) as pool:
+            for future in [pool.submit(copy_context().run, work) for _ in range(8)]:
+                future.result()
+        assert stages == {}
+    assert set(stages) == {"stage"} and stages["stage"] > 0
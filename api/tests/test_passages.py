@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+import match
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from match import assemble_index, topk_lexical, topk_semantic
+from passages import build_passage_table, passage_offsets, pool_embeddings, pool_passages
+from split import build_sentence_table, sentence_alignment
+from store import load_index, save_index
+from utils.config import TFIDF_CHAR_PARAMS, TFIDF_WORD_PARAMS
+
+_FILLER = " ".join(f"A cidade número {i} fica perto do rio e tem uma praça central." for i in range(12))
+_COPIED = "A Revolução Industrial começou na Inglaterra no século dezoito. Ela mudou o trabalho nas fábricas."
+_TEXTS = [
+    _FILLER + " " + _COPIED + " " + _FILLER,
+    "O gato está no telhado. O gato mia alto.",
+    "A revolução mudou a Inglaterra. O trabalho mudou.",
+    "",
+]
+
+
+def _encode(texts):
+    vecs = np.stack([np.random.default_rng(sum(map(ord, t))).normal(size=8) for t in texts])
+    return (vecs / np.linalg.norm(vecs, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _index():
+    word = TfidfVectorizer(**TFIDF_WORD_PARAMS)
+    char = TfidfVectorizer(**TFIDF_CHAR_PARAMS)
+    word_matrix = word.fit_transform(_TEXTS)
+    char_matrix = char.fit_transform(_TEXTS)
+    sentences = build_sentence_table(_TEXTS, word)
+    passages = build_passage_table(_TEXTS, word, char, _encode, sentences=sentences)
+    return assemble_index(
+        [5, 6, 7, 8], ["Longo", "Gato", "Curto", "Vazio"], list(_TEXTS),
+        word, word_matrix, char, char_matrix,
+        pool_embeddings(passages), sentences, passages,
+    )
+
+
+def test_passage_offsets_windows():
+    # doc 0: 7 sentenças, doc 1: nenhuma, doc 2: 2 sentenças
+    starts = np.arange(9) * 10
+    ends = starts + 8
+    doc_ptr = np.array([0, 7, 7, 9])
+    p_starts, p_ends, p_ptr = passage_offsets(starts, ends, doc_ptr, size=3, overlap=1)
+    assert p_ptr.tolist() == [0, 3, 3, 4]
+    assert p_starts.tolist() == [0, 20, 40, 70]
+    assert p_ends.tolist() == [28, 48, 68, 88]
+
+
+def test_pool_passages_max_and_sum():
+    doc = np.array([0, 0, 1, 1, 2])
+    rows = np.array([0, 2, 3, 1, 4])
+    scores = np.array([0.9, 0.8, 0.7, 0.6, 0.1])
+    pos, sc, best = pool_passages(doc, rows, scores, 2, "max")
+    assert pos.tolist() == [0, 1] and best.tolist() == [0, 2]
+    pos, sc, best = pool_passages(doc, rows, scores, 2, "sum")
+    assert pos.tolist() == [0, 1] and np.allclose(sc, [1.5, 1.5])
+
+
+def test_passage_search_returns_span():
+    idx = _index()
+    spans = {}
+    hits = topk_lexical(idx, _COPIED, 2, spans)
+    assert hits[0][0] == 5
+    start, end = spans[5]
+    assert start <= _TEXTS[0].index(_COPIED) and _TEXTS[0].index(_COPIED) + len(_COPIED) <= end
+    assert end - start < len(_TEXTS[0]) / 2
+
+    pairs = sentence_alignment(idx, _COPIED, _TEXTS[0], doc_pos=0, span=spans[5])
+    assert pairs and all(start <= p["doc_start"] and p["doc_end"] <= end for p in pairs)
+    assert pairs[0]["score"] > 0.99
+
+
+def test_passage_index_updates_and_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(match, "encode_queries", _encode)
+    idx = _index()
+    assert len(topk_semantic(idx, "gato", 3)) == 3
+    idx = idx.remove_documents([5])[0]
+    assert 5 not in [d for d, _ in topk_lexical(idx, _COPIED, 3)]
+
+    word, char = idx.tfidf_word_vectorizer, idx.tfidf_char_vectorizer
+    new = build_passage_table([_COPIED], word, char, _encode)
+    idx = idx.add_documents([9], ["Cópia"], [_COPIED], pool_embeddings(new), passages=new)
+    spans = {}
+    assert topk_lexical(idx, _COPIED, 1, spans)[0][0] == 9
+    assert spans[9] == (0, len(_COPIED))
+
+    # O delta só vai para o disco depois da compactação
+    with pytest.raises(ValueError):
+        save_index(idx, str(tmp_path))
+    compacted = match.compact_index(idx)
+    compacted.version = "p1"
+    save_index(compacted, str(tmp_path))
+    loaded = load_index(str(tmp_path), "p1")
+    np.testing.assert_array_equal(loaded.passages.doc_ptr, compacted.passages.doc_ptr)
+    assert topk_lexical(loaded, _COPIED, 3) == topk_lexical(compacted, _COPIED, 3)
+    assert topk_lexical(loaded, _COPIED, 1)[0][0] == 9
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+import match
+from match import build_index, topk_semantic
+from quant import QuantizedMatrix, dot, rerank
+from store import load_index, save_index
+
+
+def _vectors(n=500, d=32, seed=0):
+    vecs = np.random.default_rng(seed).normal(size=(n, d))
+    return (vecs / np.linalg.norm(vecs, axis=1, keepdims=True)).astype(np.float32)
+
+
+@pytest.mark.parametrize("kind, tol", [("float16", 1e-3), ("int8", 2e-2)])
+def test_quantized_dot_close_to_float32(kind, tol):
+    vecs = _vectors()
+    codes = QuantizedMatrix.from_vectors(vecs, kind)
+    assert codes.nbytes < vecs.nbytes
+    q = vecs[:3].T
+    np.testing.assert_allclose(dot(codes, q), vecs @ q, atol=tol)
+    np.testing.assert_allclose(codes[[4, 2]], vecs[[4, 2]], atol=tol)
+
+
+def test_rerank_restores_exact_order():
+    vecs = _vectors()
+    q = vecs[7]
+    rows = np.argsort(-(vecs @ q))[:20][::-1].copy()  # candidatos fora de ordem
+    top, scores = rerank(vecs, rows, q, 5)
+    np.testing.assert_array_equal(top, np.argsort(-(vecs @ q))[:5])
+    np.testing.assert_allclose(scores, (vecs @ q)[top], rtol=1e-6)
+
+
+def test_semantic_search_with_int8_codes(monkeypatch, tmp_path):
+    vecs = _vectors(n=40, d=8, seed=1)
+    texts = [f"documento número {i} sobre o tema {i % 5}" for i in range(40)]
+    monkeypatch.setattr(match, "EMBED_QUANT", "int8")
+    monkeypatch.setattr(match, "encode_queries", lambda queries: vecs[[3]])
+    idx = build_index(list(range(40)), [None] * 40, texts, embed_matrix=vecs, mode="document")
+    assert idx.embed_codes is not None and idx.embed_codes.kind == "int8"
+
+    hits = topk_semantic(idx, "consulta", k=5)
+    expected = np.argsort(-(vecs @ vecs[3]))[:5]
+    assert [doc_id for doc_id, _ in hits] == list(expected)
+    # Scores finais vêm dos float32 exatos
+    np.testing.assert_allclose([s for _, s in hits], (vecs @ vecs[3])[expected], rtol=1e-5)
+
+    idx.version = "q1"
+    save_index(idx, str(tmp_path))
+    loaded = load_index(str(tmp_path), "q1")
+    assert isinstance(loaded.embed_codes, QuantizedMatrix)
+    assert isinstance(loaded.embed_matrix, np.memmap)
+    assert topk_semantic(loaded, "consulta", k=5) == hits
@@ -0,0 +1,88 @@
+import numpy as np
+from fastapi.testclient import TestClient
+
+import match
+from main import app
+from match import build_index
+from models.response import ReportSentence
+from report import build_report
+from store import load_index, save_index
+
+DOCS = [
+    "O café é uma bebida popular no Brasil. Ele é cultivado em Minas Gerais. A colheita ocorre no inverno.",
+    "A Revolução Industrial começou na Inglaterra. As fábricas usavam máquinas a vapor. O carvão era essencial.",
+    "O rio Amazonas é o maior do mundo em volume. Ele atravessa vários países. A floresta ao redor é imensa.",
+]
+
+
+def _index():
+    vecs = np.eye(len(DOCS), 8, dtype=np.float32)
+    return build_index(list(range(len(DOCS))), [f"Doc {i}" for i in range(len(DOCS))], DOCS,
+                       embed_matrix=vecs, mode="document")
+
+
+def test_report_merges_copied_sentences(monkeypatch):
+    idx = _index()
+    # Nenhuma sentença passa no limiar semântico: só o caminho léxico conta
+    monkeypatch.setattr(match, "encode_queries", lambda qs: np.zeros((len(qs), 8), dtype=np.float32))
+    text = ("As fábricas usavam máquinas a vapor. O carvão era essencial. "
+            "Gosto de jogar futebol aos domingos. O café é uma bebida popular no Brasil.")
+    report = build_report(idx, text)
+
+    matched = [s for s in report["sentences"] if s.get("doc_id") is not None]
+    assert [s["doc_id"] for s in matched] == [1, 1, 0]
+    assert all(s["method"] == "lexical" for s in matched)
+    assert "doc_id" not in report["sentences"][2]
+    # Duas sentenças seguidas do doc 1 viram um único trecho
+    assert [(sp["doc_id"], sp["sentences"]) for sp in report["spans"]] == [(1, 2), (0, 1)]
+    span = report["spans"][0]
+    assert DOCS[1][span["doc_start"]:span["doc_end"]].startswith("As fábricas")
+    assert text[span["query_start"]:span["query_end"]].endswith("essencial.")
+    assert 0 < report["percent_matched"] < 100
+    assert [src["doc_id"] for src in report["sources"]] == [1, 0]
+
+
+def test_report_semantic_fallback(monkeypatch):
+    idx = _index()
+    # A consulta parafraseada aponta para o doc 2 pelo embedding
+    monkeypatch.setattr(match, "encode_queries", lambda qs: np.tile(np.eye(1, 8, 2, dtype=np.float32), (len(qs), 1)))
+    report = build_report(idx, "Ele corta muitas nações da América do Sul.", min_semantic=0.9)
+    (sent,) = report["sentences"]
+    assert sent["method"] == "semantic" and sent["doc_id"] == 2
+    assert sent["doc_sentence"] in DOCS[2]
+    assert report["percent_matched"] == 100.0
+
+
+def test_report_uses_prebuilt_sentence_postings(monkeypatch, tmp_path):
+    monkeypatch.setattr(match, "encode_queries", lambda qs: np.zeros((len(qs), 8), dtype=np.float32))
+    idx = _index()
+    idx.version = "r1"
+    save_index(idx, str(tmp_path))
+    loaded = load_index(str(tmp_path), "r1")
+    postings = loaded.sentences.postings
+    assert postings is not None
+    report = build_report(loaded, "O carvão era essencial.")
+    assert report["sentences"][0]["doc_id"] == 1 and loaded.sentences.postings is postings
+
+    # Documento incluído depois do build: achado no segmento delta
+    text = "A floresta é imensa. O carvão atravessa vários países."
+    new = match.add_documents(loaded, [7], ["Carvão"], [text], np.eye(1, 8, 5, dtype=np.float32))
+    report = build_report(new, "O carvão atravessa vários países.")
+    (sent,) = report["sentences"]
+    assert sent["doc_id"] == 7 and sent["doc_title"] == "Carvão"
+    assert sent["doc_sentence"] == "O carvão atravessa vários países."
+
+
+def test_report_endpoint():
+    client = TestClient(app)
+    request = client.post("/report", json={"text": "O café é uma bebida popular. Chove muito hoje."})
+    assert request.status_code == 200
+    data = request.json()
+    assert len(data["sentences"]) == 2
+    assert 0 <= data["percent_matched"] <= 100
+    # Montado sem validação: ainda traz todos os campos do schema (None sem fonte)
+    assert all(set(s) == set(ReportSentence.model_fields) for s in data["sentences"])
+    again = client.post("/report", json={"text": "O café é uma bebida popular. Chove muito hoje."})
+    assert again.json() == data
+    too_long = " ".join(["Frase curta."] * 1000)
+    assert client.post("/report", json={"text": too_long}).status_code == 400
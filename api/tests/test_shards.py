@@ -0,0 +1,136 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import main
+import match
+from benchmarks.synthetic import StubEncoder, SyntheticCorpus
+from match import build_index, shard_index, topk_fingerprint, topk_lexical_batch, topk_semantic_batch
+from report import build_report
+from shards import ShardPool, coordinator_view
+from split import sentence_alignment
+
+ENCODER = StubEncoder(dim=32)
+
+
+def _index(n=60, mode="document"):
+    # Trechos (modo passage) são codificados pelo encoder de match: os testes trocam pelo falso
+    docs = list(SyntheticCorpus(n, seed=5, vocab_size=2000, n_topics=10))
+    texts = [d.text for d in docs]
+    embed = ENCODER.encode(texts) if mode == "document" else None
+    return build_index([d.id for d in docs], [d.title for d in docs], texts, embed_matrix=embed, mode=mode)
+
+
+def test_shard_index_partitions_live_docs():
+    idx = _index()
+    idx = idx.remove_documents([3, 4])[0]
+    shards = shard_index(idx, 3)
+    assert sorted(i for s in shards for i in s.ids) == [i for i in idx.ids if i not in (3, 4)]
+    # Vetorizador global: linhas idênticas às do índice inteiro
+    shard = shards[1]
+    pos = idx.position(shard.ids[0])
+    assert (shard.tfidf_word_matrix[0] != idx.tfidf_word_matrix[pos]).nnz == 0
+    # Sentenças e impressões do shard são as do documento no índice inteiro
+    first, last = idx.sentences.doc_range(pos)
+    s_first, s_last = shard.sentences.doc_range(0)
+    assert (shard.sentences.matrix[s_first:s_last] != idx.sentences.matrix[first:last]).nnz == 0
+    assert shard.sentences.postings is not None
+    assert sorted(shard.fingerprints.hashes[shard.fingerprints.docs == 0]) == sorted(
+        idx.fingerprints.hashes[idx.fingerprints.docs == pos]
+    )
+
+
+def test_coordinator_view_keeps_offsets_only():
+    idx = _index()
+    # Embeddings do encoder falso: o teste não carrega o modelo
+    added = match.add_documents(idx, [1000], [None], [idx.texts[0]], ENCODER.encode([idx.texts[0]]))
+    view = coordinator_view(added)
+    assert view.tfidf_word_matrix is None and view.embed_matrix is None and view.fingerprints is None
+    assert view.sentences.matrix is None and view.delta.sentences.matrix is None
+    assert view.n_alive == idx.n_alive + 1 and view.text(view.position(1000)) == idx.texts[0]
+    # Alinhamento vetoriza só as sentenças do documento: mesmo resultado
+    query = idx.texts[3][:400]
+    a = sentence_alignment(idx, query, idx.texts[3], doc_pos=3)
+    b = sentence_alignment(view, query, view.texts[3], doc_pos=3)
+    assert list(a) == list(b) and len(a)
+    # Inclusões no processo da API não montam matrizes
+    view = view.add_documents([1001], [None], [idx.texts[1]], ENCODER.encode([idx.texts[1]]))
+    assert view.delta.tfidf_word_matrix is None and view.delta.embed_matrix is None
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("mode", ["document", "passage"])
+def test_sharded_topk_matches_single_index(tmp_path, monkeypatch, mode):
+    monkeypatch.setattr(match, "_encoding", None)
+    match.use_encoder(ENCODER)
+    monkeypatch.setattr(match, "encode_queries", ENCODER.encode)
+    idx = _index(mode=mode)
+    queries = [q for q, _ in SyntheticCorpus(60, seed=5, vocab_size=2000, n_topics=10).queries(6)]
+    pool = ShardPool(idx, 3, str(tmp_path))
+    try:
+        assert pool.n == 3
+        for single, sharded in (
+            (topk_lexical_batch, pool.topk_lexical_batch),
+            (topk_semantic_batch, pool.topk_semantic_batch),
+        ):
+            spans_a = [{} for _ in queries]
+            spans_b = [{} for _ in queries]
+            expected, got = single(idx, queries, 5, spans_a), sharded(idx, queries, 5, spans_b)
+            for a, b in zip(expected, got):
+                assert [d for d, _ in a] == [d for d, _ in b]
+                np.testing.assert_allclose([s for _, s in a], [s for _, s in b], rtol=1e-5)
+            for hits, sa, sb in zip(got, spans_a, spans_b):
+                assert {d: sb[d] for d, _ in hits if d in sb} == {d: sa[d] for d, _ in hits if d in sa}
+
+        # Remoções e inclusões chegam aos shards
+        top = pool.topk_lexical(idx, queries[0], 1)[0][0]
+        assert pool.remove_documents([top]) == 1
+        assert top not in [d for d, _ in pool.topk_lexical(idx, queries[0], 5)]
+        embeddings, passages = match.embed_documents(idx, [queries[0]])
+        idx = idx.add_documents([1000], [None], [queries[0]], embeddings, passages=passages)
+        pool.add_documents([1000], [queries[0]], embeddings, passages)
+        assert pool.topk_lexical(idx, queries[0], 1)[0][0] == 1000
+    finally:
+        pool.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.slow
+def test_sharded_report_and_fingerprints_match_single_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(match, "encode_queries", ENCODER.encode)
+    idx = _index()
+    idx = idx.remove_documents([7])[0]
+    # Trechos de dois documentos e uma frase solta: casamentos léxicos e semânticos
+    text = " ".join([idx.texts[3][:300], idx.texts[10][:300], "Frase que não está em lugar nenhum."])
+    pool = ShardPool(idx, 3, str(tmp_path))
+    try:
+        view = coordinator_view(idx)
+        assert build_report(view, text, 0.5, 0.0, search=pool) == build_report(idx, text, 0.5, 0.0)
+        expected = topk_fingerprint(idx, idx.texts[3][:500], 3)
+        got = pool.topk_fingerprint(view, idx.texts[3][:500], 3)
+        assert [(d, s) for d, s, _ in got] == [(d, s) for d, s, _ in expected]
+    finally:
+        pool.close()
+
+
+class _FakePool:
+    closed = 0
+
+    def close(self):
+        self.closed += 1
+
+
+def test_retired_shards_close_on_timer_or_shutdown(monkeypatch):
+    monkeypatch.setattr(main, "_retired", {})
+    monkeypatch.setattr(main, "_shards", _FakePool())
+    soon, later = _FakePool(), _FakePool()
+    main._retire(soon, delay=0.01)
+    main._retire(later, delay=60)
+    # Timers daemon: não impedem o processo de sair
+    assert all(timer.daemon for timer in main._retired.values())
+    main._retired[soon].join(5)
+    assert soon.closed == 1 and later.closed == 0
+    # O shutdown fecha os que ainda esperavam e os atuais, sem esperar o timer
+    asyncio.run(main.close_shards())
+    assert later.closed == 1 and main._shards.closed == 1 and main._retired == {}
@@ -0,0 +1,83 @@
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from models.corpus import CorpusIndex
+from split import _greedy_match, _greedy_reference, _optimal_match, build_sentence_table, sentence_alignment
+from utils.config import TFIDF_WORD_PARAMS
+
+_TEXTS = [
+    "O gato está no telhado. O gato mia alto! Depois ele desce.",
+    "Cães são amigos do homem. Um cão late. 3 cães dormem.",
+    "",
+    "Gatos e cães podem conviver em paz.",
+]
+
+
+def _index(with_table=True):
+    word = TfidfVectorizer(**TFIDF_WORD_PARAMS)
+    matrix = word.fit_transform(_TEXTS)
+    return CorpusIndex(
+        ids=list(range(len(_TEXTS))),
+        titles=[None] * len(_TEXTS),
+        texts=_TEXTS,
+        tfidf_word_vectorizer=word,
+        tfidf_word_matrix=matrix,
+        tfidf_char_vectorizer=None,
+        tfidf_char_matrix=None,
+        embed_matrix=np.zeros((len(_TEXTS), 4), dtype=np.float32),
+        sentences=build_sentence_table(_TEXTS, word, chunk_size=2) if with_table else None,
+    )
+
+
+def test_sentence_table_offsets():
+    table = build_sentence_table(_TEXTS, TfidfVectorizer(**TFIDF_WORD_PARAMS).fit(_TEXTS))
+    assert table.doc_ptr.tolist() == [0, 3, 6, 6, 7]
+    assert table.matrix.shape[0] == 7
+    first, last = table.doc_range(1)
+    sents = [_TEXTS[1][s:e].strip() for s, e in zip(table.starts[first:last], table.ends[first:last])]
+    assert sents == ["Cães são amigos do homem.", "Um cão late.", "3 cães dormem."]
+
+
+def test_alignment_with_table_matches_on_the_fly():
+    with_table, without = _index(), _index(with_table=False)
+    query = "Um cão late muito. O gato mia alto."
+    for pos, text in enumerate(_TEXTS):
+        a = sentence_alignment(with_table, query, text, top_n=5, doc_pos=pos)
+        b = sentence_alignment(without, query, text, top_n=5)
+        assert [(m["doc_start"], m["query_start"]) for m in a] == [(m["doc_start"], m["query_start"]) for m in b]
+        np.testing.assert_allclose([m["score"] for m in a], [m["score"] for m in b])
+        assert [m["doc_sentence"] for m in a] == [m["doc_sentence"] for m in b]
+
+
+def test_greedy_match_equals_reference():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        shape = tuple(rng.integers(1, 30, 2))
+        # Arredondado para gerar empates; parte dos pares fica com score 0
+        sims = np.round(rng.random(shape), 1) * (rng.random(shape) > 0.4)
+        for top_n in (1, 5, 50):
+            got = _greedy_match(sims, top_n)
+            expected = _greedy_reference(sims, top_n)
+            np.testing.assert_array_equal(got[0], expected[0])
+            np.testing.assert_array_equal(got[1], expected[1])
+
+
+def test_optimal_match_beats_greedy():
+    sims = np.array([[0.9, 0.8], [0.85, 0.0]])
+    gq, gd = _greedy_match(sims, 5)
+    oq, od = _optimal_match(sims, 5)
+    assert sims[gq, gd].sum() == 0.9
+    assert np.isclose(sims[oq, od].sum(), 1.65)
+    assert len(set(oq.tolist())) == len(oq) and len(set(od.tolist())) == len(od)
+
+
+def test_alignment_is_columnar_and_sorted():
+    idx = _index()
+    query = "O gato mia alto. Um cão late muito."
+    pairs = sentence_alignment(idx, query, _TEXTS[1], top_n=5, doc_pos=1)
+    assert len(pairs) and not hasattr(pairs, "__dict__")
+    assert list(pairs.score) == sorted(pairs.score, reverse=True)
+    first = pairs[0]
+    assert first["query_sentence"] == query[pairs.query_start[0]:pairs.query_end[0]].strip()
+    assert first == next(iter(pairs))
+    assert len(sentence_alignment(idx, "", _TEXTS[1])) == 0
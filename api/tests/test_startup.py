@@ -0,0 +1,143 @@
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import match
+
+# Orçamento generoso para `import main` num processo novo (medido ~1 s sem torch/sklearn)
+IMPORT_BUDGET_S = 3.0
+HEAVY_MODULES = ["torch", "sentence_transformers", "onnxruntime", "datasets", "pandas", "sklearn"]
+
+
+def test_import_main_is_fast_and_lazy():
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import main\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=Path(__file__).resolve().parents[1],
+        capture_output=True, text=True, check=True,
+    ).stdout.splitlines()
+    assert out[1] == "", f"heavy modules imported by main: {out[1]}"
+    assert float(out[0]) < IMPORT_BUDGET_S
+
+
+class _StubEncoder:
+    # Marca `loaded` na 1ª chamada; com `inner`, as consultas usam o encoder de verdade
+    loaded = False
+
+    def __init__(self, inner=None):
+        self.inner = inner
+
+    def encode(self, texts):
+        self.loaded = True
+        if self.inner is not None:
+            return self.inner.encode(texts)
+        return np.ones((len(texts), 2), dtype=np.float32)
+
+
+def test_ready_only_after_background_warmup(monkeypatch):
+    idx = main.get_index()
+    gate = threading.Event()
+    monkeypatch.setattr(main, "_index", None)
+    monkeypatch.setattr(main, "load_or_build_index", lambda: gate.wait(5) and idx)
+    real = match.get_encoder()
+    monkeypatch.setattr(match, "_encoding", None)
+    match.use_encoder(_StubEncoder(real))
+    monkeypatch.setattr(main, "_warmup", threading.Thread(target=main.warmup, daemon=True))
+    main._warmup.start()
+
+    client = TestClient(main.app)
+    assert client.get("/health").status_code == 200
+    assert client.get("/ready").status_code == 503
+    request = client.post("/compare", json={"text": "O café é uma bebida popular.", "top_k": 1})
+    assert request.status_code == 503 and request.headers["Retry-After"]
+
+    gate.set()
+    main._warmup.join(5)
+    ready = client.get("/ready")
+    assert ready.status_code == 200 and ready.json()["encoder"]
+    assert client.post("/compare", json={"text": "O café é uma bebida popular.", "top_k": 1}).status_code == 200
+
+
+def test_encoder_and_query_batcher_are_swapped_together(monkeypatch):
+    monkeypatch.setattr(match, "_encoding", None)
+    monkeypatch.setattr(match.query_cache, "maxsize", 0)
+    stub = _StubEncoder()
+    match.use_encoder(stub)
+    assert match.get_encoder() is stub
+    assert match.encode_queries(["consulta nova"]).shape == (1, 2) and stub.loaded
+
+
+def test_ready_reflects_index_with_warmup_off(monkeypatch):
+    idx = main.get_index()
+    gate = threading.Event()
+    monkeypatch.setattr(main, "WARMUP_MODE", "off")
+    monkeypatch.setattr(main, "_index", None)
+    monkeypatch.setattr(main, "_warmup", None)
+    monkeypatch.setattr(main, "load_or_build_index", lambda: gate.wait(5) and idx)
+    monkeypatch.setattr(match, "_encoding", None)
+    match.use_encoder(_StubEncoder())
+
+    client = TestClient(main.app)
+    # Nada carregado: não está pronto, e o /ready começa a carga em segundo plano
+    ready = client.get("/ready")
+    assert ready.status_code == 503 and not ready.json()["index"]
+    assert client.get("/health").json()["ready"] is False
+    gate.set()
+    main._warmup.join(5)
+    assert client.get("/ready").status_code == 200
+
+
+def test_blocking_warmup_raises(monkeypatch):
+    def fail():
+        raise OSError("snapshot ilegível")
+
+    monkeypatch.setattr(main, "_index", None)
+    monkeypatch.setattr(main, "_warmup_error", None)
+    monkeypatch.setattr(main, "load_or_build_index", fail)
+    with pytest.raises(OSError):
+        main.warmup(raise_errors=True)
+    assert "snapshot ilegível" in main._warmup_error
+    main.warmup()  # background: só registra o erro
+
+
+def test_lazy_load_does_not_block_event_loop(monkeypatch):
+    idx = main.get_index()
+    loading, gate = threading.Event(), threading.Event()
+
+    def slow_load():
+        loading.set()
+        gate.wait(20)
+        return idx
+
+    # Sem aquecimento (ou depois de um que falhou): a 1ª consulta carrega o índice
+    monkeypatch.setattr(main, "WARMUP_MODE", "off")
+    monkeypatch.setattr(main, "_index", None)
+    monkeypatch.setattr(main, "_warmup", None)
+    monkeypatch.setattr(main, "load_or_build_index", slow_load)
+    # `with`: todas as requisições no mesmo event loop, como no servidor
+    with TestClient(main.app) as client:
+        query = threading.Thread(
+            target=client.post, args=("/compare",),
+            kwargs={"json": {"text": "O café é uma bebida popular.", "top_k": 1}},
+        )
+        query.start()
+        assert loading.wait(5)
+        start = time.perf_counter()
+        assert client.get("/health").status_code == 200
+        # /health respondeu com a carga ainda em andamento
+        assert time.perf_counter() - start < 5 and query.is_alive()
+        gate.set()
+        query.join(20)
+    assert main._index is idx
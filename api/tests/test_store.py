@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from models.corpus import CorpusIndex
+from split import build_sentence_table
+from store import MappedTexts, load_index, save_index
+from utils.config import TFIDF_CHAR_PARAMS, TFIDF_WORD_PARAMS
+
+
+def _toy_index(version="v1"):
+    texts = [
+        "O gato está no telhado. O gato mia alto.",
+        "Cães são amigos do homem. Um cão late.",
+        "Gatos e cães podem conviver em paz.",
+    ]
+    word = TfidfVectorizer(**TFIDF_WORD_PARAMS)
+    char = TfidfVectorizer(**TFIDF_CHAR_PARAMS)
+    rng = np.random.default_rng(0)
+    embed = rng.normal(size=(3, 8)).astype(np.float32)
+    return CorpusIndex(
+        ids=[10, 3, 7],
+        titles=["A", "B", None],
+        texts=texts,
+        tfidf_word_vectorizer=word,
+        tfidf_word_matrix=word.fit_transform(texts),
+        tfidf_char_vectorizer=char,
+        tfidf_char_matrix=char.fit_transform(texts),
+        embed_matrix=embed,
+        version=version,
+        sentences=build_sentence_table(texts, word),
+    )
+
+
+def test_store_roundtrip(tmp_path):
+    idx = _toy_index()
+    save_index(idx, str(tmp_path))
+    loaded = load_index(str(tmp_path), "v1")
+    assert loaded is not None
+    assert loaded.ids == idx.ids and loaded.titles == idx.titles and list(loaded.texts) == idx.texts
+    assert isinstance(loaded.texts, MappedTexts) and isinstance(loaded.texts.blob, np.memmap)
+    assert loaded.texts[-1] == idx.texts[-1] and loaded.texts[1:] == idx.texts[1:]
+    assert isinstance(loaded.embed_matrix, np.memmap)
+    np.testing.assert_allclose(loaded.embed_matrix, idx.embed_matrix)
+    assert (loaded.tfidf_word_matrix != idx.tfidf_word_matrix).nnz == 0
+    assert (loaded.tfidf_char_matrix != idx.tfidf_char_matrix).nnz == 0
+    q = ["o gato late no telhado"]
+    diff = loaded.tfidf_word_vectorizer.transform(q) - idx.tfidf_word_vectorizer.transform(q)
+    assert abs(diff).sum() == 0
+    assert [loaded.position(d) for d in (10, 3, 7)] == [0, 1, 2]
+    np.testing.assert_array_equal(loaded.sentences.doc_ptr, idx.sentences.doc_ptr)
+    np.testing.assert_array_equal(loaded.sentences.starts, idx.sentences.starts)
+    assert (loaded.sentences.matrix != idx.sentences.matrix).nnz == 0
+
+
+def test_store_version_mismatch(tmp_path):
+    save_index(_toy_index("v1"), str(tmp_path))
+    assert load_index(str(tmp_path), "v2") is None
+
+
+def test_position_unknown_id():
+    idx = _toy_index()
+    with pytest.raises(KeyError):
+        idx.position(4)
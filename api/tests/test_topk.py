@@ -0,0 +1,18 @@
+import numpy as np
+
+from utils.topk import topk_indices
+
+
+def test_topk_matches_stable_argsort():
+    rng = np.random.default_rng(0)
+    for n in (1, 7, 100, 5000):
+        # Poucos valores distintos para forçar empates no limiar
+        scores = rng.integers(0, 5, n).astype(np.float64)
+        for k in (1, 3, 20, n, n + 10):
+            expected = np.argsort(-scores, kind="stable")[:k]
+            np.testing.assert_array_equal(topk_indices(scores, k), expected)
+
+
+def test_topk_empty_and_zero():
+    assert len(topk_indices(np.array([]), 5)) == 0
+    assert len(topk_indices(np.array([1.0, 2.0]), 0)) == 0
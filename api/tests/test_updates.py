@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from ann import IVFFlatIndex
+from inverted import PostingIndex, search_postings
+from match import apply_updates, semantic_hits, topk_lexical
+from models.corpus import CorpusIndex
+from split import build_sentence_table
+from store import append_update, read_updates
+from utils.config import TFIDF_WORD_PARAMS
+
+_TEXTS = [
+    "O gato está no telhado. O gato mia alto.",
+    "Cães são amigos do homem. Um cão late.",
+    "Gatos e cães podem conviver em paz.",
+]
+
+
+def _index():
+    word = TfidfVectorizer(**TFIDF_WORD_PARAMS)
+    matrix = word.fit_transform(_TEXTS)
+    embed = np.eye(3, 4, dtype=np.float32)
+    return CorpusIndex(
+        ids=[10, 11, 12],
+        titles=["A", "B", "C"],
+        texts=list(_TEXTS),
+        tfidf_word_vectorizer=word,
+        tfidf_word_matrix=matrix,
+        tfidf_char_vectorizer=None,
+        tfidf_char_matrix=None,
+        embed_matrix=embed,
+        ann=IVFFlatIndex.build(embed, nlist=2, nprobe=2),
+        word_postings=PostingIndex.from_matrix(matrix),
+        sentences=build_sentence_table(_TEXTS, word),
+    )
+
+
+def test_add_documents_builds_delta_segment():
+    idx = _index()
+    new = idx.add_documents([20], ["D"], ["O gato late no telhado."], np.array([[0, 0, 0, 1]], dtype=np.float32))
+    # O índice anterior não muda: leitores em andamento seguem com ele
+    assert idx.delta is None and idx.n_alive == 3 and idx.generation == 0
+    assert new.position(20) == 3 and new.n_alive == 4 and new.generation == 1
+    assert new.tfidf_word_matrix is idx.tfidf_word_matrix and new.ann is idx.ann
+    delta = new.delta
+    assert delta.tfidf_word_matrix.shape[0] == 1 and delta.sentences.doc_range(0) == (0, 1)
+    cand, _ = search_postings([(delta.word_postings, idx.tfidf_word_vectorizer.transform(["telhado"]), 1.0)], 1)
+    assert cand.tolist() == [0]
+    assert new.text(3) == "O gato late no telhado." and new.title(3) == "D"
+    assert topk_lexical(new, "O gato late no telhado.", 2)[0][0] == 20
+    assert semantic_hits(new, np.array([[0, 0, 0, 1]], dtype=np.float32), 1) == [[(20, 1.0)]]
+    assert new.needs_compaction(dead_ratio=0.5, delta_ratio=0.2)
+
+
+def test_remove_documents_tombstones():
+    idx = _index()
+    new, removed = idx.remove_documents([10, 99])
+    assert removed == 1 and idx.alive[0]
+    assert new.n_alive == 2 and not new.alive[0]
+    cand, _ = search_postings(
+        [(new.word_postings, new.tfidf_word_vectorizer.transform(["gato"]), 1.0)], 2, new.alive
+    )
+    assert 0 not in cand.tolist()
+
+
+def test_add_existing_id_replaces_it():
+    idx = _index()
+    new = idx.add_documents([11], ["B2"], ["Um cão novo."], np.zeros((1, 4), dtype=np.float32))
+    assert new.position(11) == 3 and not new.alive[1] and new.n_alive == 3
+    new, removed = new.remove_documents([11])
+    assert removed == 1 and new.n_alive == 2 and new.n_dead == 2
+    with pytest.raises(KeyError):
+        new.position(11)
+
+
+def test_update_log_replay(tmp_path):
+    idx = _index()
+    (tmp_path / "u1").mkdir()
+    embed = np.array([[0, 0, 0, 1]], dtype=np.float32)
+    append_update(str(tmp_path), "u1", {
+        "op": "add", "ids": [20], "titles": ["D"], "texts": ["O gato late."], "embed": embed, "passage_embed": None,
+    })
+    append_update(str(tmp_path), "u1", {"op": "remove", "ids": [10]})
+    entries = read_updates(str(tmp_path), "u1")
+    np.testing.assert_array_equal(entries[0]["embed"], embed)
+    replayed = apply_updates(idx, entries)
+    assert replayed.position(20) == 3 and replayed.n_alive == 3
+    with pytest.raises(KeyError):
+        replayed.position(10)
@@ -0,0 +1,41 @@
+import asyncio
+import threading
+
+import pytest
+
+from utils.workers import PoolSaturated, WorkerPool
+
+
+def test_pool_runs_off_the_loop_thread():
+    pool = WorkerPool(max_workers=2, max_pending=4)
+
+    async def main():
+        async with pool.slot():
+            assert pool.in_flight == 1
+            return await pool.run(lambda: threading.current_thread().name)
+
+    assert asyncio.run(main()).startswith("compare")
+    assert pool.in_flight == 0
+
+
+def test_pool_rejects_when_saturated():
+    pool = WorkerPool(max_workers=1, max_pending=1)
+
+    async def main():
+        async with pool.slot():
+            with pytest.raises(PoolSaturated):
+                async with pool.slot():
+                    pass
+
+    asyncio.run(main())
+    assert pool.rejected == 1 and pool.in_flight == 0
+
+
+def test_acquire_release_is_idempotent():
+    pool = WorkerPool(max_workers=1, max_pending=1)
+    release = pool.acquire()
+    with pytest.raises(PoolSaturated):
+        pool.acquire()
+    release()
+    release()
+    assert pool.in_flight == 0
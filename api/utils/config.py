@@ -10,8 +10,58 @@ DATASET_LANG        = os.getenv("DATASET_LANG", "pt")
 DATASET_SIZE        = int(os.getenv("DATASET_SIZE", "200"))
 WIKIPEDIA_DATES     = _csv_env("WIKIPEDIA_DATES", "20231101")
 MODEL_NAME          = os.getenv("MODEL_NAME", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+ENCODER_BACKEND     = os.getenv("ENCODER_BACKEND", "torch")  # torch | onnx (export int8 em ENCODER_ONNX_DIR)
+ENCODER_ONNX_DIR    = os.getenv("ENCODER_ONNX_DIR", ".data/onnx")  # modelos ONNX exportados
+ENCODER_MIN_COSINE  = float(os.getenv("ENCODER_MIN_COSINE", "0.98"))  # cosseno mínimo do ONNX vs. modelo original
+ENCODER_BATCH_MS    = float(os.getenv("ENCODER_BATCH_MS", "3"))  # espera p/ juntar consultas num lote com o modelo ocupado (0=desliga)
+ENCODER_BATCH_MAX   = int(os.getenv("ENCODER_BATCH_MAX", "32"))  # textos por lote do micro-batching
 TOP_K_MAX           = int(os.getenv("TOP_K_MAX", "20"))
+BATCH_SIZE_MAX      = int(os.getenv("BATCH_SIZE_MAX", "64"))  # textos por chamada de /compare/batch
+REPORT_MAX_SENTS    = int(os.getenv("REPORT_MAX_SENTS", "400"))  # sentenças aceitas por texto em /report
+REPORT_MIN_LEXICAL  = float(os.getenv("REPORT_MIN_LEXICAL", "0.5"))  # cosseno TF-IDF p/ contar a sentença como copiada
+REPORT_MIN_SEMANTIC = float(os.getenv("REPORT_MIN_SEMANTIC", "0.85"))  # cosseno do embedding quando não há cópia léxica (>1=desliga)
+REPORT_GAP          = int(os.getenv("REPORT_GAP", "2"))  # sentenças da fonte puladas dentro de um mesmo trecho copiado
+WORKER_THREADS      = int(os.getenv("WORKER_THREADS", str(min(8, os.cpu_count() or 1))))  # threads p/ estágios pesados
+WORKER_QUEUE_MAX    = int(os.getenv("WORKER_QUEUE_MAX", "32"))  # requisições em andamento antes de responder 503
+STREAM_ALIGN_MAX    = int(os.getenv("STREAM_ALIGN_MAX", "2"))  # alinhamentos de um /compare/stream rodando ao mesmo tempo
+WARMUP_MODE         = os.getenv("WARMUP_MODE", "background")  # background (porta abre já) | blocking (falha = não sobe) | off (carrega no 1º pedido)
+SHARDS              = int(os.getenv("SHARDS", "1"))  # processos de busca, cada um com parte do corpus (1=sem shards)
+SHARD_DIR           = os.getenv("SHARD_DIR", ".data/shards")  # snapshots de cada shard, lidos pelos processos
+QUERY_CACHE_SIZE    = int(os.getenv("QUERY_CACHE_SIZE", "2048"))  # embeddings de consultas em cache (0=desliga)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))  # respostas de /compare em cache (0=desliga)
+CACHE_TTL           = float(os.getenv("CACHE_TTL", "900"))  # segundos (0=sem expiração)
+ADMIN_TOKEN         = os.getenv("ADMIN_TOKEN", "")  # exigido em X-Admin-Token nas rotas /admin (vazio=rotas desligadas)
+COMPACT_INTERVAL    = float(os.getenv("COMPACT_INTERVAL", "300"))  # segundos entre verificações (0=desliga)
+COMPACT_DEAD_RATIO  = float(os.getenv("COMPACT_DEAD_RATIO", "0.2"))  # fração de removidos que dispara compactação
+COMPACT_DELTA_RATIO = float(os.getenv("COMPACT_DELTA_RATIO", "0.2"))  # fração de adicionados que dispara compactação
 LEXICAL_CHAR_WEIGHT = float(os.getenv("LEXICAL_CHAR_WEIGHT", "0.4"))  # peso da similaridade char n-grams (0=desliga)
+LEXICAL_ENGINE      = os.getenv("LEXICAL_ENGINE", "inverted")  # inverted | dense
+INDEX_DIR           = os.getenv("INDEX_DIR", ".data/index")  # snapshot do índice em disco (vazio=desliga)
+INDEX_EMBED_DTYPE   = os.getenv("INDEX_EMBED_DTYPE", "float32")  # float32 | float16
+EMBED_QUANT         = os.getenv("EMBED_QUANT", "none")  # none | float16 | int8 (cópia quantizada p/ busca semântica)
+EMBED_RERANK        = int(os.getenv("EMBED_RERANK", "4"))  # candidatos reavaliados em float32 por resultado (0=sem re-rank)
+INDEX_MODE          = os.getenv("INDEX_MODE", "document")  # document | passage (trechos sobrepostos)
+PASSAGE_SENTENCES   = int(os.getenv("PASSAGE_SENTENCES", "5"))  # sentenças por trecho
+PASSAGE_OVERLAP     = int(os.getenv("PASSAGE_OVERLAP", "1"))  # sentenças repetidas entre trechos vizinhos
+PASSAGE_POOLING     = os.getenv("PASSAGE_POOLING", "max")  # max | sum (agregação trecho -> documento)
+PASSAGE_FANOUT      = int(os.getenv("PASSAGE_FANOUT", "4"))  # trechos buscados por documento pedido
+COMPARE_MODE        = os.getenv("COMPARE_MODE", "full")  # full | fast (só impressões) | auto (semântica só sem cópia)
+FINGERPRINT_KGRAM   = int(os.getenv("FINGERPRINT_KGRAM", "5"))  # palavras por k-grama (0=desliga impressões)
+FINGERPRINT_WINDOW  = int(os.getenv("FINGERPRINT_WINDOW", "4"))  # janela do winnowing (k-gramas)
+FINGERPRINT_MAX_DF  = int(os.getenv("FINGERPRINT_MAX_DF", "1000"))  # ignora k-gramas com mais ocorrências no corpus
+FINGERPRINT_GAP     = int(os.getenv("FINGERPRINT_GAP", "40"))  # caracteres tolerados entre k-gramas de um trecho
+FINGERPRINT_MIN     = float(os.getenv("FINGERPRINT_MIN", "0.1"))  # no modo auto, acima disso pula as outras buscas
+INGEST_DIR          = os.getenv("INGEST_DIR", ".data/ingest")  # shards intermediários da ingestão
+INGEST_CHUNK_SIZE   = int(os.getenv("INGEST_CHUNK_SIZE", "1000"))  # docs por shard (limita o pico de memória)
+INGEST_WORKERS      = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))  # processos de vetorização (1=sem processos)
+ANN_BACKEND         = os.getenv("ANN_BACKEND", "ivf")  # exact | ivf
+ANN_MIN_DOCS        = int(os.getenv("ANN_MIN_DOCS", "10000"))  # abaixo disso a busca semântica é exata
+ANN_NLIST           = int(os.getenv("ANN_NLIST", "0"))  # nº de listas IVF (0=4*sqrt(N))
+ANN_NPROBE          = int(os.getenv("ANN_NPROBE", "8"))  # listas visitadas por consulta (recall x latência)
+
+# Parâmetros dos vetorizadores TF-IDF (fazem parte da versão do snapshot do índice)
+TFIDF_WORD_PARAMS = dict(ngram_range=(1, 2), min_df=1, max_features=60000, sublinear_tf=True)
+TFIDF_CHAR_PARAMS = dict(analyzer="char_wb", ngram_range=(3, 5), min_df=1, max_features=60000, sublinear_tf=True)
 
 # Silencia avisos de cache de symlinks por padrão
 os.environ.setdefault("HF_HUB_DISABLE_SYMLINKS_WARNING", "1")
\ No newline at end of file
@@ -1,14 +1,268 @@
+from __future__ import annotations
+
+import json
+import logging
+import shutil
+import threading
+import time
+from pathlib               import Path
+from typing                import Callable, List
+
 import numpy as np
-from typing                import List
-from utils.config          import MODEL_NAME
-from sentence_transformers import SentenceTransformer
+from utils.config          import (
+    ENCODER_BACKEND,
+    ENCODER_BATCH_MAX,
+    ENCODER_BATCH_MS,
+    ENCODER_MIN_COSINE,
+    ENCODER_ONNX_DIR,
+    MODEL_NAME,
+)
+
+logger = logging.getLogger(__name__)
+
+# Frases usadas para conferir o modelo exportado contra o original
+_CHECK_TEXTS = [
+    "A Revolução Industrial começou na Inglaterra no século XVIII.",
+    "O gato dorme no telhado durante a tarde.",
+    "Redação sobre os desafios da educação pública no Brasil.",
+    "Plagiarism detection compares a text against a reference corpus.",
+]
 
 
 class SemanticEncoder:
-    def __init__(self, model_name: str = MODEL_NAME):
-        self.model = SentenceTransformer(model_name, device="cpu")
+    """
+    L2-normalized sentence embeddings. backend="torch" runs the PyTorch
+    SentenceTransformer; backend="onnx" runs a dynamically int8-quantized ONNX
+    export of the same model with ONNX Runtime (exported on first use). The
+    model is only loaded by the first `encode`, so importing is cheap.
+    """
+
+    def __init__(self, model_name: str = MODEL_NAME, backend: str = ENCODER_BACKEND):
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"Unknown encoder backend: {backend}")
+        self.model_name = model_name
+        self.backend = backend
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    if self.backend == "onnx":
+                        self._model = OnnxEncoder.load(self.model_name, Path(ENCODER_ONNX_DIR))
+                    else:
+                        self._model = _torch_model(self.model_name)
+                    logger.info("Loaded %s encoder in %.1fs", self.backend, time.perf_counter() - start)
+        return self._model
 
     def encode(self, texts: List[str]) -> np.ndarray:
+        if self.backend == "onnx":
+            return self.model.encode(texts)
         return np.asarray(
             self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
-        )
\ No newline at end of file
+        )
+
+
+def _torch_model(model_name: str):
+    # Import tardio: sentence_transformers traz o torch, que domina o tempo de início
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name, device="cpu")
+
+
+class OnnxEncoder:
+    """ONNX Runtime session plus a `tokenizers` tokenizer; neither needs torch at query time."""
+
+    def __init__(self, path: Path, batch_size: int = 32):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(path / "encoder.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.tokenizer = Tokenizer.from_file(str(path / "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.meta["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.meta["pad_id"], pad_token=self.meta["pad_token"])
+        self.session = ort.InferenceSession(str(path / "model_int8.onnx"), providers=["CPUExecutionProvider"])
+        self.batch_size = batch_size
+
+    @classmethod
+    def load(cls, model_name: str, root: Path) -> "OnnxEncoder":
+        path = root / model_name.replace("/", "__")
+        if not (path / "encoder.json").exists():
+            export_onnx(model_name, path)
+        return cls(path)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        out = []
+        for start in range(0, len(texts), self.batch_size):
+            enc = self.tokenizer.encode_batch(texts[start:start + self.batch_size])
+            feeds = {
+                "input_ids": np.array([e.ids for e in enc], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in enc], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in enc], dtype=np.int64),
+            }
+            hidden = self.session.run(None, {name: feeds[name] for name in self.meta["inputs"]})[0]
+            out.append(_pool(hidden, feeds["attention_mask"], self.meta["pooling"]))
+        if not out:
+            return np.zeros((0, self.meta["dim"]), dtype=np.float32)
+        return np.vstack(out)
+
+
+def _pool(hidden: np.ndarray, mask: np.ndarray, mode: str) -> np.ndarray:
+    if mode == "cls":
+        pooled = hidden[:, 0]
+    else:
+        # Média dos tokens reais (sem padding), como o Pooling do sentence-transformers
+        weights = mask[..., None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return (pooled / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+def export_onnx(model_name: str, path: Path) -> Path:
+    """
+    Export the transformer of `model_name` to ONNX, quantize its weights to int8
+    (dynamic quantization) and check the embeddings against the PyTorch model:
+    the export is rejected when any check sentence has cosine below
+    ENCODER_MIN_COSINE. Needs torch, onnx and onnxruntime (export time only).
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model = _torch_model(model_name)
+    modules = [type(m).__name__ for m in model]
+    if modules[:2] != ["Transformer", "Pooling"] or set(modules[2:]) - {"Normalize"}:
+        raise ValueError(f"Unsupported model layout for ONNX export: {modules}")
+    pooling = model[1].get_pooling_mode_str()
+    if pooling not in ("mean", "cls"):
+        raise ValueError(f"Unsupported pooling for ONNX export: {pooling}")
+
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    tokenizer = model.tokenizer
+    sample = tokenizer(_CHECK_TEXTS[:2], padding=True, return_tensors="pt")
+    # Ordem posicional do forward() dos modelos BERT/XLM-R
+    inputs = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    axes = {n: {0: "batch", 1: "seq"} for n in inputs + ["last_hidden_state"]}
+    with torch.no_grad():
+        torch.onnx.export(
+            model[0].auto_model.eval(),
+            tuple(sample[n] for n in inputs),
+            str(tmp / "model.onnx"),
+            input_names=inputs,
+            output_names=["last_hidden_state"],
+            dynamic_axes=axes,
+            opset_version=14,
+        )
+    quantize_dynamic(str(tmp / "model.onnx"), str(tmp / "model_int8.onnx"), weight_type=QuantType.QInt8)
+    (tmp / "model.onnx").unlink()
+    tokenizer.save_pretrained(str(tmp))
+    meta = {
+        "model": model_name,
+        "inputs": inputs,
+        "pooling": pooling,
+        "max_seq_length": int(model.max_seq_length),
+        "pad_id": int(tokenizer.pad_token_id),
+        "pad_token": tokenizer.pad_token,
+        "dim": int(model.get_sentence_embedding_dimension()),
+    }
+    with open(tmp / "encoder.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    expected = model.encode(_CHECK_TEXTS, convert_to_numpy=True, normalize_embeddings=True)
+    cosine = float((OnnxEncoder(tmp).encode(_CHECK_TEXTS) * expected).sum(axis=1).min())
+    if cosine < ENCODER_MIN_COSINE:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise RuntimeError(f"ONNX export of {model_name} diverges from the model (cosine {cosine:.4f})")
+    shutil.rmtree(path, ignore_errors=True)
+    tmp.rename(path)
+    logger.info("Exported %s to %s (min cosine %.4f)", model_name, path, cosine)
+    return path
+
+
+class _Pending:
+    __slots__ = ("texts", "done", "result", "error")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.done = threading.Event()
+        self.result: np.ndarray | None = None
+        self.error: BaseException | None = None
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent `encode` calls from different threads into one forward
+    pass. A caller arriving while no pass is running encodes right away, so a
+    solo query never waits. Otherwise the first caller of the next batch waits
+    up to `wait_ms` (or until `max_batch` texts are queued) for others to join,
+    encodes everything and hands each caller its rows. wait_ms=0 calls `encode`
+    directly.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], wait_ms: float, max_batch: int):
+        self._encode = encode
+        self.wait = wait_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._cond = threading.Condition()
+        self._pending: List[_Pending] = []
+        self._queued = 0
+        self._leader = False
+        self._running = 0  # passadas do modelo em andamento
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if self.wait <= 0 or len(texts) >= self.max_batch:
+            return self._encode(texts)
+        req = _Pending(texts)
+        with self._cond:
+            self._pending.append(req)
+            self._queued += len(texts)
+            if self._leader:
+                if self._queued >= self.max_batch:
+                    self._cond.notify()
+                follower = True
+            else:
+                follower = False
+                self._leader = True
+                # Modelo ocioso: não há com quem agrupar, a consulta sai na hora
+                deadline = time.monotonic() + self.wait if self._running else 0.0
+                while self._queued < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending, self._queued = self._pending, [], 0
+                self._leader = False
+                self._running += 1
+        if not follower:
+            self._run(batch)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def _run(self, batch: List[_Pending]) -> None:
+        # Fora do lock: novas chamadas já formam o próximo lote enquanto este roda
+        try:
+            vecs = self._encode([text for req in batch for text in req.texts])
+        except BaseException as exc:
+            for req in batch:
+                req.error = exc
+                req.done.set()
+            return
+        finally:
+            with self._cond:
+                self._running -= 1
+        start = 0
+        for req in batch:
+            req.result = vecs[start:start + len(req.texts)]
+            start += len(req.texts)
+            req.done.set()
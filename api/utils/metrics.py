@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import numbers
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Iterable, List, Tuple
+
+# Limites (em segundos) dos buckets: de sub-milissegundo (impressões) até a construção do índice
+_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 120.0, 600.0)
+
+
+class _Profile:
+    """Stage times of one profiled request, kept per thread and merged at the end."""
+
+    def __init__(self):
+        self._parts: Dict[int, Dict[str, float]] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        # Cada thread só escreve no próprio dict: sem lock e sem somas perdidas
+        part = self._parts.get(threading.get_ident())
+        if part is None:
+            part = self._parts.setdefault(threading.get_ident(), {})
+        part[stage] = part.get(stage, 0.0) + seconds
+
+    def merge_into(self, out: Dict[str, float]) -> None:
+        for part in list(self._parts.values()):
+            for stage, seconds in part.items():
+                out[stage] = out.get(stage, 0.0) + seconds
+
+
+# Tempos por estágio da requisição atual, quando ela pediu ?profile=1
+_profile: ContextVar[_Profile | None] = ContextVar("profile", default=None)
+
+
+class Histogram:
+    """Latency histogram with one label, rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, help: str, label: str, buckets: Tuple[float, ...] = _BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self._series: Dict[str, list] = {}  # valor do rótulo -> [contagens por bucket, soma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value: str, seconds: float) -> None:
+        with self._lock:
+            series = self._series.get(value)
+            if series is None:
+                series = self._series[value] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += seconds
+            series[2] += 1
+
+    def count(self, value: str) -> int:
+        series = self._series.get(value)
+        return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, [list(v[0]), v[1], v[2]]) for k, v in self._series.items())
+        for value, (counts, total, n) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="+Inf"}} {n}')
+            lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {total:.6f}')
+            lines.append(f'{self.name}_count{{{self.label}="{value}"}} {n}')
+        return lines
+
+
+STAGE_SECONDS = Histogram("letrus_stage_seconds", "Time spent in each stage of a request or index build.", "stage")
+REQUEST_SECONDS = Histogram("letrus_request_seconds", "End-to-end HTTP request latency.", "endpoint")
+
+
+@contextmanager
+def timed(stage: str):
+    """Time the block into STAGE_SECONDS and, if the request is profiled, into its breakdown."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(stage, elapsed)
+        profile = _profile.get()
+        if profile is not None:
+            profile.add(stage, elapsed)
+
+
+def timer(stage: str):
+    """Decorator form of `timed`."""
+
+    def wrap(fn):
+        @wraps(fn)
+        def inner(*args, **kwargs):
+            with timed(stage):
+                return fn(*args, **kwargs)
+
+        return inner
+
+    return wrap
+
+
+@contextmanager
+def profiling(enabled: bool = True):
+    """
+    Collect the stage times of the current context into the yielded dict (None
+    when disabled), filled when the block exits. Threads started with a copy of
+    the context (WorkerPool.run) record their own times, summed per stage.
+    """
+    if not enabled:
+        yield None
+        return
+    stages: Dict[str, float] = {}
+    profile = _Profile()
+    token = _profile.set(profile)
+    try:
+        yield stages
+    finally:
+        _profile.reset(token)
+        profile.merge_into(stages)
+
+
+def gauge(name: str, help: str, values: Iterable[Tuple[Dict[str, str], float]], kind: str = "gauge") -> List[str]:
+    """Prometheus text lines for one metric family; `values` holds (labels, value) pairs."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in values:
+        tags = ",".join(f'{k}="{v}"' for k, v in labels.items())
+        lines.append(f"{name}{{{tags}}} {_number(value)}" if tags else f"{name} {_number(value)}")
+    return lines
+
+
+def _number(value) -> str:
+    # Sem arredondar: contadores e bytes grandes saem exatos (":g" corta em 6 dígitos)
+    if isinstance(value, numbers.Integral):
+        return f"{int(value):d}"
+    return repr(float(value))
@@ -0,0 +1,42 @@
+import json
+from typing import Any
+
+import numpy as np
+from pydantic import BaseModel
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # extra opcional "fast"; sem ele, json da stdlib
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """JSON bytes of plain data (dicts, lists, numbers, numpy arrays), with orjson when installed."""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump_json().encode("utf-8")
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response serialized once by `dumps`. Returning it from an endpoint skips
+    FastAPI's re-validation of the result against `response_model`.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,26 @@
+import numpy as np
+
+from utils.metrics import timer
+
+
+@timer("topk")
+def topk_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the `k` largest scores, best first, in O(N + k log k).
+
+    Ties are broken by the lower index, so the result does not depend on how
+    `np.argpartition` happens to split equal values. With k >= N every index is
+    returned.
+    """
+    scores = np.asarray(scores).ravel()
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= n:
+        return np.argsort(-scores, kind="stable")
+    kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+    above = np.flatnonzero(scores > kth)
+    # Empates no limiar: ficam os de menor índice (flatnonzero já é crescente)
+    ties = np.flatnonzero(scores == kth)[: k - len(above)]
+    winners = np.concatenate([above, ties])
+    return winners[np.lexsort((winners, -scores[winners]))]
@@ -0,0 +1,80 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+
+
+class PoolSaturated(Exception):
+    """Raised when a request arrives while `max_pending` requests are in flight."""
+
+
+class WorkerPool:
+    """
+    Bounded thread pool for the CPU-bound stages of a request (encoding, sparse
+    products, alignment). Threads share the in-memory index and NumPy/SciPy/torch
+    release the GIL in their kernels, so the event loop stays free to answer
+    /health while requests are being scored.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="compare")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def rejected(self) -> int:
+        return self._rejected
+
+    @asynccontextmanager
+    async def slot(self):
+        """Admit one request or raise PoolSaturated (back-pressure)."""
+        release = self.acquire()
+        try:
+            yield
+        finally:
+            release()
+
+    def acquire(self):
+        """
+        Admit one request outside an `async with` (e.g. for the lifetime of a
+        streamed response) or raise PoolSaturated. Returns the release function,
+        which may be called more than once.
+        """
+        with self._lock:
+            if self._in_flight >= self.max_pending:
+                self._rejected += 1
+                raise PoolSaturated()
+            self._in_flight += 1
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            with self._lock:
+                if not released:
+                    released = True
+                    self._in_flight -= 1
+
+        return release
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Leva o contexto junto (p.ex. o perfil por estágio de ?profile=1), como asyncio.to_thread
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, partial(ctx.run, fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "in_flight": self._in_flight,
+            "rejected": self._rejected,
+        }
@@ -1,4 +1,5 @@
 import difflib
+import json
 from typing import Dict, Any, List
 import streamlit as st
 import requests
@@ -6,11 +7,25 @@ import os
 
 
 API_BASE = os.environ.get("API_BASE", "http://api:8000")
+DOC_TEXT_TIMEOUT = float(os.environ.get("DOC_TEXT_TIMEOUT", "10"))  # segundos por recorte de documento
+DOC_TEXT_TTL = int(os.environ.get("DOC_TEXT_TTL", "600"))  # segundos no cache do Streamlit
+
+
+class CorpusChanged(Exception):
+    """The index changed after the comparison: its offsets no longer apply."""
 
 # ---------------------------------- Config ----------------------------------
 st.set_page_config(page_title="Detector de Similaridade Wikipedia", page_icon="🔎", layout="wide")
 
 
+def api_ready() -> bool:
+    """Readiness of the API (/ready): False while the index and the encoder are still loading."""
+    try:
+        return requests.get(f"{API_BASE}/ready", timeout=2).status_code == 200
+    except requests.RequestException:
+        return False
+
+
 def fetch_results(text: str, top_k: int) -> Dict[str, Any]:
     payload = {"text": text, "top_k": top_k}
     try:
@@ -28,6 +43,88 @@ def fetch_results(text: str, top_k: int) -> Dict[str, Any]:
         st.error(f'Falha requisitando backend: {e}')
     return {}
 
+
+@st.cache_data(show_spinner=False, ttl=DOC_TEXT_TTL)
+def fetch_doc_text(doc_id: int, start: int, end: int, generation: int | None) -> str:
+    # A geração entra na chave do cache e a API recusa (409) offsets de outra geração
+    params = {"start": start, "end": end}
+    if generation is not None:
+        params["generation"] = generation
+    r = requests.get(f"{API_BASE}/documents/{doc_id}/text", params=params, timeout=DOC_TEXT_TIMEOUT)
+    if r.status_code == 409:
+        raise CorpusChanged(r.json().get('detail', ''))
+    r.raise_for_status()
+    return r.json()['text']
+
+
+def expand_pairs(doc: Dict[str, Any], query: str, generation: int | None = None) -> None:
+    """Formato compact: monta as sentenças a partir dos offsets, com um único recorte do documento."""
+    pairs = doc.pop('pairs', None)
+    if pairs is None:
+        return
+    if not pairs['score']:
+        doc['sentences'] = []
+        return
+    lo, hi = min(pairs['doc_start']), max(pairs['doc_end'])
+    part = fetch_doc_text(doc['doc_id'], lo, hi, generation)
+    doc['sentences'] = [
+        {
+            'doc_sentence': part[ds - lo:de - lo].strip(),
+            'doc_start': ds,
+            'doc_end': de,
+            'query_sentence': query[qs:qe].strip(),
+            'query_start': qs,
+            'query_end': qe,
+            'score': sc,
+        }
+        for qs, qe, ds, de, sc in zip(
+            pairs['query_start'], pairs['query_end'], pairs['doc_start'], pairs['doc_end'], pairs['score']
+        )
+    ]
+
+
+def stream_results(text: str, top_k: int, placeholder) -> Dict[str, Any]:
+    """Consome /compare/stream: mostra o ranking na hora e preenche as sentenças de cada doc conforme chegam."""
+    # compact: só offsets e scores; os textos vêm da query e de recortes dos documentos
+    payload = {"text": text, "top_k": top_k, "format": "compact"}
+    data: Dict[str, Any] = {}
+    try:
+        # Fechar a conexão (nova busca, aba fechada) cancela o restante no backend
+        with requests.post(f"{API_BASE}/compare/stream", json=payload, stream=True) as r:
+            if r.status_code != 200:
+                st.error(f"Erro backend {r.status_code}: {r.text[:300]}")
+                return {}
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event['event'] == 'ranking':
+                    data = event['data']
+                    for item in data.get('items', []):
+                        for doc in item['docs']:
+                            expand_pairs(doc, text, data.get('generation'))
+                            doc.setdefault('aligned', bool(doc['sentences']))
+                elif event['event'] == 'doc':
+                    expand_pairs(event['data'], text, data.get('generation'))
+                    for item in data.get('items', []):
+                        for doc in item['docs']:
+                            if doc['doc_id'] == event['data']['doc_id']:
+                                doc['sentences'] = event['data']['sentences']
+                                doc['aligned'] = True
+                else:  # done: o que não veio não tem alinhamento
+                    for item in data.get('items', []):
+                        for doc in item['docs']:
+                            doc['aligned'] = True
+                with placeholder.container():
+                    render_results(data)
+    except CorpusChanged:
+        st.warning('O corpus foi atualizado durante a busca. Clique em Buscar de novo.')
+    except requests.Timeout:
+        st.error('Timeout na requisição. Considere aumentar HEALTH_TIMEOUTS.')
+    except Exception as e:  # noqa: BLE001
+        st.error(f'Falha requisitando backend: {e}')
+    return data
+
 # ---------------------------------- Helpers ---------------------------------
 
 def highlight_diff(a: str, b: str) -> str:
@@ -47,9 +144,11 @@ def highlight_diff(a: str, b: str) -> str:
 
 def show_doc(doc: Dict[str, Any]):
     st.markdown(f"### Doc {doc.get('doc_id')} • {doc.get('doc_title','(sem título)')}")
+    if doc.get('score') is not None:
+        st.caption(f"Score documento: {doc['score']:.3f}")
     sentences = doc.get('sentences', [])
     if not sentences:
-        st.caption('Sem sentenças alinhadas.')
+        st.caption('Alinhando sentenças...' if doc.get('aligned') is False else 'Sem sentenças alinhadas.')
         return
     for i, s in enumerate(sentences, 1):
         with st.container():
@@ -104,8 +203,8 @@ with st.sidebar:
     with c1:
         top_k = st.number_input('top_k', min_value=1, max_value=50)
         if st.button('Buscar', type='primary'):
-            with st.spinner('Consultando...'):
-                st.session_state['results'] = fetch_results(input_text, int(top_k))
+            # A busca roda no corpo da página, para os resultados aparecerem aos poucos
+            st.session_state['pending'] = (input_text, int(top_k))
 
     # with c2:
     #     if st.button('Buscar', type='primary'):
@@ -125,10 +224,19 @@ with mc[1]:
 with st.expander('Mostrar Texto Original', expanded=False):
     st.write(input_text)
 
-results: Dict[str, Any] = st.session_state.get('results', {})
-if results:
-    render_results(results)
+if not api_ready():
+    st.info('O backend ainda está carregando o índice e o modelo; as buscas respondem assim que terminar.')
+
+results_area = st.empty()
+pending = st.session_state.pop('pending', None)
+if pending:
+    st.session_state['results'] = stream_results(*pending, results_area)
 else:
-    st.info('Clique em Buscar para obter resultados do backend.')
+    results: Dict[str, Any] = st.session_state.get('results', {})
+    if results:
+        with results_area.container():
+            render_results(results)
+    else:
+        results_area.info('Clique em Buscar para obter resultados do backend.')
 
 st.markdown('---')